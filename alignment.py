@@ -0,0 +1,118 @@
+import json
+import os
+from bisect import bisect_right
+import numpy as np
+from target_index import TargetIndex
+
+def offset_map_path(xdf_path):
+    # Written next to the exported XDF
+    return os.path.splitext(xdf_path)[0] + ".offsets.json"
+
+class OffsetMap:
+    """
+    Piecewise source -> target offset map of one BIN pair.
+    Between two software versions most of the image only moves by a few
+    block offsets, so the map is a sorted list of segments
+    (src_start, src_end, delta): source bytes [src_start, src_end) sit at
+    +delta in the target.
+    Built from unique exact-match anchors sampled along the source; runs of
+    anchors with the same delta become segments, whose edges are then
+    extended byte-exact. Inside a segment the data itself may differ
+    (changed calibration), predict() compares before trusting it.
+    """
+    ANCHOR_SIZE = 32    # Bytes per anchor probe
+    ANCHOR_STRIDE = 256 # Source distance between probes
+    MIN_ANCHORS = 2     # A delta seen by a single anchor is not trusted
+    STOP_PROBES = 256   # Probes between should_stop() checks
+
+    def __init__(self, segments=()):
+        self.segments = sorted(segments)
+        self.starts = [s[0] for s in self.segments]
+
+    @classmethod
+    def build(cls, src_data, trg_data, index=None, should_stop=None):
+        """
+        index: TargetIndex of trg_data, built here if the caller has none.
+        should_stop() is polled every STOP_PROBES probes; returns None once it is true.
+        """
+        if not src_data or not trg_data: return cls()
+        if index is None: index = TargetIndex(trg_data)
+        src_view = memoryview(src_data)
+        src_arr = np.frombuffer(src_data, dtype=np.uint8)
+
+        # 1. Anchors: probes found exactly once in the target
+        runs = [] # [src_start, src_end, delta, anchors]
+        for i, pos in enumerate(range(0, len(src_data) - cls.ANCHOR_SIZE + 1, cls.ANCHOR_STRIDE)):
+            if should_stop and i % cls.STOP_PROBES == 0 and should_stop(): return None
+            block = src_arr[pos : pos + cls.ANCHOR_SIZE]
+            # Fill bytes (FF/00 areas) match everywhere, not worth a lookup
+            if not np.any(block != block[0]): continue
+            hits = index.find_all(src_view[pos : pos + cls.ANCHOR_SIZE], 0, max_matches=2)
+            if len(hits) != 1: continue
+            delta = hits[0] - pos
+            if runs and runs[-1][2] == delta:
+                runs[-1][1] = pos + cls.ANCHOR_SIZE
+                runs[-1][3] += 1
+            else:
+                runs.append([pos, pos + cls.ANCHOR_SIZE, delta, 1])
+        # Lone anchors are chance hits; dropping one can rejoin the run it split
+        merged = []
+        for run in runs:
+            if run[3] < cls.MIN_ANCHORS: continue
+            if merged and merged[-1][2] == run[2]:
+                merged[-1][1] = run[1]
+            else:
+                merged.append(run)
+
+        # 2. Grow every segment byte-exact into the gap before the next one
+        trg_arr = np.frombuffer(trg_data, dtype=np.uint8)
+        segments = []
+        for i, (start, end, delta, _) in enumerate(merged):
+            lo = segments[-1][1] if segments else 0
+            hi = merged[i + 1][0] if i + 1 < len(merged) else len(src_arr)
+            start -= cls._extend(src_arr, trg_arr, max(lo, -delta), start, delta, -1)
+            end += cls._extend(src_arr, trg_arr, end, min(hi, len(trg_arr) - delta), delta, 1)
+            segments.append((start, end, delta))
+        return cls(segments)
+
+    @staticmethod
+    def _extend(src_arr, trg_arr, lo, hi, delta, step):
+        """
+        Bytes of src[lo:hi] that still agree at +delta, counted from hi
+        (step -1) or from lo (step 1).
+        """
+        if hi <= lo: return 0
+        diff = src_arr[lo:hi] != trg_arr[lo + delta : hi + delta]
+        if step < 0: diff = diff[::-1]
+        bad = np.flatnonzero(diff)
+        return int(bad[0]) if len(bad) else hi - lo
+
+    def delta_at(self, addr, size=1):
+        """
+        Offset of the segment holding the whole of [addr, addr+size), or None.
+        """
+        i = bisect_right(self.starts, addr) - 1
+        if i < 0: return None
+        start, end, delta = self.segments[i]
+        if addr + size <= end: return delta
+        return None
+
+    def predict(self, src_data, trg_data, addr, size):
+        """
+        Target address of the source bytes [addr, addr+size) if they lie in an
+        aligned segment and the target really holds the same bytes there.
+        """
+        delta = self.delta_at(addr, size)
+        if delta is None: return None
+        t = addr + delta
+        if memoryview(trg_data)[t : t + size] != memoryview(src_data)[addr : addr + size]: return None
+        return t
+
+    def coverage(self):
+        return sum(end - start for start, end, _ in self.segments)
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"coverage": self.coverage(),
+                       "segments": [{"src_start": f"0x{s:X}", "src_end": f"0x{e:X}", "delta": d} for s, e, d in self.segments]},
+                      f, indent=2)
@@ -0,0 +1,211 @@
+"""
+Headless batch transfer: one reference XDF/BIN pair against many target BINs.
+
+    python -m batch_transfer reference.xdf reference.bin targets/ more/*.bin -o out/
+
+Writes one XDF per target plus summary.json with per-target result counts.
+"""
+import argparse
+import copy
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from data_engine import DataEngine
+from models import table_of
+from target_index import TargetIndex
+from scan_cache import ScanCache
+from alignment import OffsetMap, offset_map_path
+from profiling import profile_path
+from regions import SearchRegions, PROFILES, DEFAULT_PROFILE
+from corpus import FirmwareCorpus, default_corpus_path
+
+# Per-process state filled by _init_worker
+_worker = {}
+
+def expand_targets(specs):
+    """
+    Directories contribute every *.bin inside them, anything else is treated as a glob.
+    """
+    paths = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            found = [os.path.join(spec, f) for f in os.listdir(spec) if f.lower().endswith('.bin')]
+        else:
+            found = glob.glob(spec)
+        for p in sorted(found):
+            if os.path.isfile(p) and p not in paths:
+                paths.append(p)
+    return paths
+
+def output_name(src_path, trg_path):
+    # Same naming as the GUI export dialog
+    s_base = os.path.basename(src_path).split('.')[0]
+    t_base = os.path.basename(trg_path).split('.')[0]
+    return f"{s_base}_to_{t_base}.xdf"
+
+def summarize(all_maps):
+    counts = {"total": len(all_maps), "found": 0, "unique": 0, "deep": 0,
+              "sequential": 0, "fuzzy": 0, "ambiguous": 0, "none": 0}
+    table = table_of(all_maps)
+    if table is None: return counts
+    types = table.type_counts(all_maps.values())
+    for t in ["UNIQUE", "SEQUENTIAL", "FUZZY", "AMBIGUOUS"]:
+        counts[t.lower()] = types[t]
+    counts["found"] = types["UNIQUE"] + types["SEQUENTIAL"] + types["FUZZY"]
+    counts["none"] = counts["total"] - counts["found"] - types["AMBIGUOUS"]
+    found = table.rows_where(all_maps.values(), "UNIQUE", "SEQUENTIAL", "FUZZY")
+    counts["deep"] = int(np.count_nonzero(table["is_deep"][found]))
+    return counts
+
+def transfer(engine, document, all_maps, src_data, trg_data, output_path, fuzzy=True, fuzzy_mode="qgram", include_deep=True,
+             cache=None, cache_key=None, export_offsets=False, export_profile=False, corpus=None, target_name=""):
+    """
+    Full pipeline for one target: scan, resolve, optional fuzzy, write_xdf.
+    all_maps is modified by the scan, pass a copy.
+    With a cache, a hit on cache_key replaces the whole scan.
+    export_offsets: also write the OffsetMap next to output_path.
+    export_profile: also write the engine's phase times and counters next to output_path.
+    corpus: FirmwareCorpus that seeds the scan and records its result under target_name.
+    """
+    index = offset_map = None
+    profile = engine.profile
+    profile.reset()
+    if cache is None or not cache.load(cache_key, all_maps):
+        with profile.phase("index"):
+            index = TargetIndex(trg_data)
+        with profile.phase("align"):
+            offset_map = OffsetMap.build(src_data, trg_data, index)
+        seeds = None
+        if corpus is not None:
+            with profile.phase("corpus"):
+                seeds = corpus.seeds(trg_data, FirmwareCorpus.map_sizes(all_maps.values()))[0]
+        engine.scan_maps(all_maps, src_data, trg_data, index, offset_map=offset_map, seeds=seeds)
+        engine.resolve_matches(all_maps, src_data, trg_data, index=index)
+        if corpus is not None:
+            with profile.phase("corpus"):
+                corpus.add_transfer(trg_data, target_name, all_maps)
+        if fuzzy:
+            engine.scan_fuzzy_sequential(all_maps, src_data, trg_data, mode=fuzzy_mode)
+        if cache is not None: cache.store(cache_key, all_maps)
+    engine.write_xdf(document, all_maps, output_path, include_deep=include_deep)
+    if export_offsets:
+        if offset_map is None: offset_map = OffsetMap.build(src_data, trg_data, index)
+        offset_map.to_json(offset_map_path(output_path))
+    if export_profile:
+        profile.to_json(profile_path(output_path), target=os.path.basename(output_path), maps=len(all_maps),
+                        cached=index is None)
+    return summarize(all_maps)
+
+def _init_worker(document, all_maps, src_path, options, cache_info=None, regions=DEFAULT_PROFILE, corpus_path=None):
+    """
+    Pool initializer: the parsed XDF arrives once per worker, the source BIN
+    is memory-mapped so all workers share the same pages.
+    cache_info: (cache directory, xdf digest, source digest) or None
+    regions: SearchRegions profile or span list, applied to every target
+    corpus_path: FirmwareCorpus file, None = no corpus
+    """
+    engine = DataEngine()
+    corpus = FirmwareCorpus(corpus_path) if corpus_path else None
+    _worker.update(engine=engine, document=document, all_maps=all_maps, src=engine.load_bin(src_path), options=options, cache_info=cache_info,
+                   regions=regions, corpus=corpus)
+
+def _run_target(trg_path, output_path):
+    started = time.time()
+    entry = {"target": trg_path, "output": output_path}
+    try:
+        trg_data = _worker['engine'].load_bin(trg_path)
+        all_maps = copy.deepcopy(_worker['all_maps'])
+        engine, options = _worker['engine'], _worker['options']
+        regions = SearchRegions.for_profile(_worker['regions'], trg_data)
+        engine.regions = regions.spans
+        entry["excluded_bytes"] = regions.excluded
+        cache = cache_key = None
+        if _worker['cache_info']:
+            cache_dir, xdf_digest, src_digest = _worker['cache_info']
+            cache = ScanCache(cache_dir)
+            stage = "fuzzy" if options["fuzzy"] else "scan"
+            cache_key = cache.key(xdf_digest, src_digest, ScanCache.digest(trg_data), engine.scan_params(), stage)
+        entry.update(transfer(engine, _worker['document'], all_maps, _worker['src'], trg_data, output_path, cache=cache, cache_key=cache_key,
+                              corpus=_worker['corpus'], target_name=os.path.basename(trg_path), **options))
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["seconds"] = round(time.time() - started, 3)
+    return entry
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m batch_transfer",
+                                     description="Transfer one reference XDF/BIN pair to many target BINs.")
+    parser.add_argument("xdf", help="reference XDF")
+    parser.add_argument("source_bin", help="BIN matching the reference XDF")
+    parser.add_argument("targets", nargs="+", help="target BIN files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="transfer_out", help="where XDFs and summary.json are written")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="targets processed in parallel")
+    parser.add_argument("--no-fuzzy", action="store_true", help="skip Fuzzy Search for missing maps")
+    parser.add_argument("--fuzzy-mode", choices=["qgram", "scan"], default="qgram", help="fuzzy candidate selection")
+    parser.add_argument("--no-deep", action="store_true", help="leave (deep) results out of the exported XDFs")
+    parser.add_argument("--offset-map", action="store_true", help="also write <output>.offsets.json with the source/target alignment")
+    parser.add_argument("--profile", action="store_true", help="also write <output>.profile.json with phase times and scan counters")
+    parser.add_argument("--regions", default=DEFAULT_PROFILE,
+                        help=f"target search regions: {', '.join(PROFILES)} or spans like 0x10000-0x20000,0x30000-0x38000")
+    parser.add_argument("--corpus", nargs="?", const=default_corpus_path(), metavar="PATH",
+                        help="seed scans from the firmware corpus and add the results to it (default: the GUI's corpus)")
+    parser.add_argument("--no-cache", action="store_true", help="always rescan, do not read or write the scan cache")
+    parser.add_argument("--cache-dir", help="scan cache directory (default: the GUI's cache)")
+    parser.add_argument("--summary", help="summary JSON path (default: <output-dir>/summary.json)")
+    args = parser.parse_args(argv)
+
+    targets = expand_targets(args.targets)
+    if not targets:
+        parser.error("no target BIN files found")
+    try:
+        SearchRegions.for_profile(args.regions, b"")
+    except ValueError as e:
+        parser.error(str(e))
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    engine = DataEngine()
+    document, all_maps = engine.parse_xdf(args.xdf)
+    options = {"fuzzy": not args.no_fuzzy, "fuzzy_mode": args.fuzzy_mode, "include_deep": not args.no_deep,
+               "export_offsets": args.offset_map, "export_profile": args.profile}
+    cache_info = None
+    if not args.no_cache:
+        cache_info = (args.cache_dir or ScanCache().directory, ScanCache.digest_file(args.xdf), ScanCache.digest_file(args.source_bin))
+    print(f"{len(all_maps)} maps from {args.xdf}, {len(targets)} targets, {args.jobs} jobs", file=sys.stderr)
+    if args.corpus:
+        # The reference XDF is known-good for its BIN
+        FirmwareCorpus(args.corpus).add_source(engine.load_bin(args.source_bin), os.path.basename(args.source_bin), all_maps)
+
+    outputs = {t: os.path.join(args.output_dir, output_name(args.source_bin, t)) for t in targets}
+    results = []
+    def report(entry):
+        results.append(entry)
+        name = os.path.basename(entry["target"])
+        if "error" in entry:
+            line = f"ERROR {entry['error']}"
+        else:
+            line = (f"found {entry['found']}/{entry['total']} (unique {entry['unique']}, deep {entry['deep']}, "
+                    f"seq {entry['sequential']}, fuzzy {entry['fuzzy']}) in {entry['seconds']}s")
+        print(f"[{len(results)}/{len(targets)}] {name}: {line}", file=sys.stderr)
+
+    if args.jobs <= 1:
+        _init_worker(document, all_maps, args.source_bin, options, cache_info, args.regions, args.corpus)
+        for t in targets: report(_run_target(t, outputs[t]))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker,
+                                 initargs=(document, all_maps, args.source_bin, options, cache_info, args.regions, args.corpus)) as pool:
+            futures = [pool.submit(_run_target, t, outputs[t]) for t in targets]
+            for fut in as_completed(futures): report(fut.result())
+
+    results.sort(key=lambda e: targets.index(e["target"]))
+    summary_path = args.summary or os.path.join(args.output_dir, "summary.json")
+    with open(summary_path, "w") as f:
+        json.dump({"xdf": args.xdf, "source_bin": args.source_bin, "targets": results}, f, indent=2)
+    print(f"Summary written to {summary_path}", file=sys.stderr)
+    return 1 if any("error" in e for e in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
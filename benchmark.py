@@ -0,0 +1,275 @@
+"""
+Synthetic ME7 benchmark for the scan, resolve, fuzzy and export phases.
+
+    python -m benchmark -o bench.json
+    python -m benchmark --cases small --repeat 5 --baseline bench.json
+
+Every case generates a source BIN with an XDF and a target BIN that
+differs in controlled ways: block shifts, per-cylinder duplicate maps,
+low-entropy tables, tuned (perturbed) maps and 8/16-bit axes. The true
+target address of every map is known, so the result has both the phase
+timings and how many maps were placed correctly.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+from data_engine import DataEngine
+from target_index import TargetIndex
+from alignment import OffsetMap
+from regions import SearchRegions, PROFILES, DEFAULT_PROFILE
+
+CASES = {
+    "small":  {"image_size": 512 * 1024,  "tables": 300,  "constants": 200},
+    "medium": {"image_size": 1024 * 1024, "tables": 1200, "constants": 800},
+    "large":  {"image_size": 2048 * 1024, "tables": 3000, "constants": 2000},
+}
+# Share of maps per condition, and number of block shifts, unless overridden per case
+CONDITIONS = {"shifts": 4, "cylinders": 0.06, "low_entropy": 0.08, "tuned": 0.03, "axis16": 0.5}
+
+def _smooth(rng, n, is16):
+    # Calibration-like data: slowly rising values with noise
+    v = int(rng.integers(0, 200)) + np.cumsum(rng.integers(-3, 7, n))
+    if is16: return ((v * 37 + rng.integers(0, 6, n)) & 0xFFFF).astype('<u2').tobytes()
+    return (v & 0xFF).astype(np.uint8).tobytes()
+
+def _low_entropy(rng, n, is16):
+    # All-zero tables or a few repeated values (switch maps, limits)
+    if rng.random() < 0.5: return bytes(n * (2 if is16 else 1))
+    values = rng.choice(rng.integers(0, 256, 3), n)
+    return values.astype('<u2' if is16 else np.uint8).tobytes()
+
+def _axis(rng, n, is16):
+    v = int(rng.integers(0, 40)) + np.cumsum(rng.integers(1, 21, n))
+    if is16: return ((v * 41) & 0xFFFF).astype('<u2').tobytes()
+    return np.minimum(v, 255).astype(np.uint8).tobytes()
+
+def generate(image_size, tables, constants, seed=1, shifts=4, cylinders=0.06, low_entropy=0.08, tuned=0.03, axis16=0.5):
+    """
+    Returns {"src", "trg": BIN bytes, "xdf": XDF text, "truth": {name: (z, x, y) target addresses},
+    "kinds": {name: plain/cylinder/low_entropy/tuned/constant}}.
+    """
+    rng = np.random.default_rng(seed)
+    src = bytearray(rng.integers(0, 256, image_size, dtype=np.uint8).tobytes())
+    src[image_size - 0x8000:] = b'\xff' * 0x8000 # Erased flash at the end
+    cal = 0x10000
+    gaps = [] # (address, length) of the padding in front of every item
+    entries = []
+    axes = [] # (address, count, is16), shared by several tables like in real XDFs
+
+    def put(data):
+        nonlocal cal
+        pad = int(rng.integers(2, 14)) & ~1
+        gaps.append((cal, pad))
+        cal += pad
+        src[cal : cal + len(data)] = data
+        cal += len(data)
+        return cal - len(data)
+
+    for i in range(tables):
+        rows = int(rng.choice([1, 4, 8, 12, 16]))
+        cols = int(rng.choice([4, 6, 8, 12, 16]))
+        z16 = bool(rng.random() < 0.4)
+        same = [a for a in axes if a[1] == cols]
+        if same and rng.random() < 0.4:
+            x = same[int(rng.integers(len(same)))]
+        else:
+            x16 = bool(rng.random() < axis16)
+            x = (put(_axis(rng, cols, x16)), cols, x16)
+            axes.append(x)
+        y = (0, 0, False)
+        if rows > 1:
+            y16 = bool(rng.random() < axis16)
+            y = (put(_axis(rng, rows, y16)), rows, y16)
+        kind = "low_entropy" if rng.random() < low_entropy else "plain"
+        z = (_low_entropy if kind == "low_entropy" else _smooth)(rng, rows * cols, z16)
+        entries.append({"name": f"TAB_{i}", "kind": kind, "z": (put(z), rows, cols, z16), "x": x, "y": y})
+        if rng.random() < cylinders:
+            for c in range(int(rng.integers(1, 4))):
+                entries.append({"name": f"TAB_{i}_cyl{c + 1}", "kind": "cylinder", "z": (put(z), rows, cols, z16), "x": x, "y": y})
+    for i in range(constants):
+        is16 = bool(rng.random() < 0.5)
+        entries.append({"name": f"CONST_{i}", "kind": "constant", "z": (put(_smooth(rng, 1, is16)), 1, 1, is16)})
+    if cal > image_size - 0x8000:
+        raise ValueError("image too small for this many maps")
+
+    # Target: tuned maps, then block shifts (inserted code, removed padding)
+    trg = bytearray(src)
+    plain = [e for e in entries if e["kind"] == "plain" and e["z"][1] * e["z"][2] >= 8]
+    for k in rng.choice(len(plain), min(len(plain), int(len(entries) * tuned)), replace=False):
+        e = plain[k]
+        e["kind"] = "tuned"
+        addr, rows, cols, is16 = e["z"]
+        # Tuning nudges values, a 16-bit value carries into its high byte
+        width, top = (2, 0xFFFF) if is16 else (1, 0xFF)
+        for a in range(addr, addr + rows * cols * width, width):
+            if rng.random() < 0.1:
+                v = int.from_bytes(trg[a : a + width], 'little') + int(rng.integers(-4, 5))
+                trg[a : a + width] = min(top, max(0, v)).to_bytes(width, 'little')
+    edits = [] # (source address, delta): everything from address on moves by delta
+    for g in rng.choice(len(gaps), min(shifts, len(gaps)), replace=False):
+        addr, pad = gaps[g]
+        if rng.random() < 0.5:
+            edits.append((addr, -pad))
+        else:
+            edits.append((addr, int(rng.choice([2, 16, 256, 4096]))))
+    for addr, delta in sorted(edits, reverse=True):
+        if delta < 0: del trg[addr : addr - delta]
+        else: trg[addr:addr] = rng.integers(0, 256, delta, dtype=np.uint8).tobytes()
+    trg = bytes(trg[:image_size].ljust(image_size, b'\xff'))
+    starts = np.array(sorted(a for a, _ in edits), dtype=np.int64)
+    deltas = np.cumsum([d for _, d in sorted(edits)])
+    def moved(addr):
+        i = int(np.searchsorted(starts, addr, 'right'))
+        return addr + (int(deltas[i - 1]) if i else 0) if addr else -1
+
+    truth = {}
+    for e in entries:
+        truth[e["name"]] = (moved(e["z"][0]),) + ((moved(e["x"][0]), moved(e["y"][0])) if "x" in e else (-1, -1))
+    return {"src": bytes(src), "trg": trg, "xdf": _xdf(entries), "truth": truth,
+            "kinds": {e["name"]: e["kind"] for e in entries}}
+
+def _xdf(entries):
+    def emb(addr, is16, extra=''):
+        return f'<EMBEDDEDDATA mmedtypeflags="0x00" mmedaddress="0x{addr:X}" mmedelementsizebits="{16 if is16 else 8}"{extra} />'
+    x = ['<?xml version="1.0" encoding="ISO-8859-1"?>', '<XDFFORMAT version="1.60">',
+         '<XDFHEADER><deftitle>Synthetic benchmark</deftitle></XDFHEADER>']
+    for i, e in enumerate(entries):
+        z_addr, rows, cols, z16 = e["z"]
+        if "x" not in e:
+            x.append(f'<XDFCONSTANT uniqueid="0x{i:X}"><title>{e["name"]}</title>{emb(z_addr, z16)}'
+                     f'<MATH equation="X*0.1"><VAR id="X" /></MATH></XDFCONSTANT>')
+            continue
+        x.append(f'<XDFTABLE uniqueid="0x{i:X}" flags="0x0">')
+        x.append(f'  <title>{e["name"]}</title>')
+        x.append(f'  <XDFAXIS id="x" uniqueid="0x0">{emb(e["x"][0], e["x"][2])}<indexcount>{e["x"][1]}</indexcount>'
+                 f'<MATH equation="X*0.25"><VAR id="X" /></MATH></XDFAXIS>')
+        if e["y"][0]:
+            x.append(f'  <XDFAXIS id="y" uniqueid="0x0">{emb(e["y"][0], e["y"][2])}<indexcount>{e["y"][1]}</indexcount>'
+                     f'<MATH equation="X/2"><VAR id="X" /></MATH></XDFAXIS>')
+        size = f' mmedrowcount="{rows}" mmedcolcount="{cols}"'
+        x.append(f'  <XDFAXIS id="z">{emb(z_addr, z16, size)}'
+                 f'<MATH equation="X*0.75-10"><VAR id="X" /></MATH></XDFAXIS>')
+        x.append('</XDFTABLE>')
+    x.append('</XDFFORMAT>')
+    return '\n'.join(x)
+
+def accuracy(all_maps, truth, kinds):
+    """
+    Placed maps per kind: correct / wrong (placed elsewhere) / missing,
+    and the same over all X/Y axes.
+    """
+    result = {}
+    axes = {"correct": 0, "wrong": 0, "missing": 0}
+    def score(counts, found, expected):
+        counts["correct" if found == expected else "wrong" if found > 0 else "missing"] += 1
+    for name, m in all_maps.items():
+        z, x, y = truth[name]
+        counts = result.setdefault(kinds[name], {"total": 0, "correct": 0, "wrong": 0, "missing": 0})
+        counts["total"] += 1
+        placed = m.match_type in ["UNIQUE", "SEQUENTIAL", "FUZZY"]
+        score(counts, m.target_addr if placed else -1, z)
+        if not placed: continue
+        if x > 0: score(axes, m.target_x_addr, x)
+        if y > 0: score(axes, m.target_y_addr, y)
+    result["axes"] = axes
+    return result
+
+def run_case(params, seed=1, repeat=1, workdir=None, regions=DEFAULT_PROFILE):
+    """
+    Generates one case and times every phase; with repeat > 1 the fastest
+    run per phase is kept. Returns the case entry of the JSON report.
+    regions: SearchRegions profile of the target, as the app applies it.
+    """
+    conditions = dict(CONDITIONS, **{k: v for k, v in params.items() if k in CONDITIONS})
+    case = generate(params["image_size"], params["tables"], params["constants"], seed, **conditions)
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        xdf_path = os.path.join(tmp, "defs.xdf")
+        with open(xdf_path, "w", encoding="cp1252") as f: f.write(case["xdf"])
+        engine = DataEngine()
+        src, trg = case["src"], case["trg"]
+        timings = {}
+        def timed(phase, fn, *args, **kwargs):
+            started = time.perf_counter()
+            result = fn(*args, **kwargs)
+            timings[phase] = min(timings.get(phase, float("inf")), time.perf_counter() - started)
+            return result
+        for run in range(repeat):
+            for cached in (os.path.join(tmp, f) for f in os.listdir(tmp) if f.endswith(".parsed.json")): os.remove(cached)
+            engine.profile.reset()
+            document, all_maps = timed("parse", engine.parse_xdf, xdf_path)
+            index = timed("index", TargetIndex, trg)
+            search = timed("regions", SearchRegions.for_profile, regions, trg)
+            engine.regions = search.spans
+            offset_map = timed("align", OffsetMap.build, src, trg, index)
+            # Every distinct pattern through scan_with_context, then the way the app scans (aligned first)
+            _, distinct = timed("scan", engine.scan_maps, all_maps, src, trg, index)
+            timed("scan_aligned", engine.scan_maps, all_maps, src, trg, index, offset_map=offset_map)
+            timed("resolve", engine.resolve_matches, all_maps, src, trg, index=index)
+            before = accuracy(all_maps, case["truth"], case["kinds"])
+            stats = timed("fuzzy", engine.scan_fuzzy_sequential, all_maps, src, trg, mode="qgram")
+            timed("export", engine.write_xdf, document, all_maps, os.path.join(tmp, "out.xdf"))
+    return {"params": dict(params, **conditions, seed=seed), "maps": len(all_maps), "distinct_patterns": distinct,
+            "aligned_bytes": offset_map.coverage(), "fuzzy_offsets_checked": stats["checked"],
+            "regions": regions, "excluded_bytes": search.excluded,
+            "seconds": {k: round(v, 4) for k, v in timings.items()},
+            # Engine counters of the last run (scan and scan_aligned both count)
+            "counters": engine.profile.to_dict()["counters"],
+            "accuracy_before_fuzzy": before, "accuracy": accuracy(all_maps, case["truth"], case["kinds"])}
+
+def compare(report, baseline):
+    """
+    Phase timings against an earlier report, one line per case and phase.
+    """
+    lines = []
+    for name, entry in report["cases"].items():
+        old = baseline.get("cases", {}).get(name)
+        if old is None or old["params"] != entry["params"]: continue
+        for phase, seconds in entry["seconds"].items():
+            before = old["seconds"].get(phase)
+            if not before: continue
+            ratio = seconds / before
+            flag = "  slower" if ratio > 1.2 else "  faster" if ratio < 0.8 else ""
+            lines.append(f"{name:8} {phase:8} {before:8.3f}s -> {seconds:8.3f}s  x{ratio:.2f}{flag}")
+        for kind, counts in entry["accuracy"].items():
+            if counts["correct"] != old["accuracy"].get(kind, {}).get("correct"):
+                lines.append(f"{name:8} {kind:12} correct {old['accuracy'].get(kind, {}).get('correct')} -> {counts['correct']}")
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Synthetic ME7 scan/resolve/fuzzy/export benchmark.")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON report path")
+    parser.add_argument("--cases", default="small,medium", help=f"comma separated, from {', '.join(CASES)}")
+    parser.add_argument("--seed", type=int, default=1, help="generator seed (same seed, same images)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest time per phase is kept")
+    parser.add_argument("--baseline", help="earlier report to compare the timings with")
+    parser.add_argument("--regions", default=DEFAULT_PROFILE, help=f"target search regions: {', '.join(PROFILES)} or a span list")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.cases.split(",") if n.strip()]
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "numpy": np.__version__, "machine": platform.machine(), "processor": platform.processor(),
+              "cases": {}}
+    for name in names:
+        started = time.time()
+        entry = report["cases"][name] = run_case(CASES[name], args.seed, args.repeat, regions=args.regions)
+        acc = entry["accuracy"]
+        correct = sum(c["correct"] for k, c in acc.items() if k != "axes")
+        print(f"{name}: {entry['maps']} maps, correct {correct}, wrong {sum(c['wrong'] for k, c in acc.items() if k != 'axes')}, "
+              f"{' '.join(f'{k} {v:.3f}s' for k, v in entry['seconds'].items())} ({time.time() - started:.1f}s)", file=sys.stderr)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as f:
+            for line in compare(report, json.load(f)): print(line)
+
+if __name__ == "__main__":
+    main()
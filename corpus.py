@@ -0,0 +1,279 @@
+"""
+Firmware corpus: a local SQLite library of known BINs and the map
+addresses known in them (from their own XDF or from earlier transfers).
+
+    python -m corpus add reference.xdf reference.bin [more.xdf more.bin ...]
+    python -m corpus find target.bin
+    python -m corpus stats
+
+Every BIN is split into content-defined chunks, so an inserted or removed
+block only changes the chunks around it. The closest known BIN of a new
+target is the one sharing the most chunk bytes with it, and the chunks
+they share tell where its maps moved to (FirmwareCorpus.seeds).
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from bisect import bisect_right
+from contextlib import contextmanager
+import numpy as np
+from scan_cache import ScanCache
+
+def default_corpus_path():
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "XDF-Transfer-Tool", "corpus.sqlite")
+
+# Random 64-bit value per byte value for the gear hash, fixed so fingerprints stay comparable between runs
+GEAR = np.array([int.from_bytes(hashlib.blake2b(bytes([b]), digest_size=8).digest(), 'little') for b in range(256)],
+                dtype=np.uint64)
+
+class FirmwareCorpus:
+    """
+    bins: one row per known BIN (content digest, file name, size)
+    chunks: its distinct chunk fingerprints with the first offset and length
+    maps: map name -> target address known in a BIN; source "xdf" (its own
+    known-good XDF) is never replaced by "transfer" (found by a scan)
+    """
+    # Bump when the chunking changes, older fingerprints are dropped
+    VERSION = 1
+    # Gear hash window: a chunk boundary depends on this many bytes only
+    WINDOW = 32
+    # Boundary where the top AVG_BITS hash bits are zero, ~1 KB chunks on random data
+    AVG_BITS = 10
+    MIN_CHUNK = 256
+    MAX_CHUNK = 8192
+    # With should_stop the hash runs over blocks of this many bytes, polled in between
+    BLOCK = 1 << 18
+    # Closest BINs sharing less than this share of the target's chunk bytes give no seeds
+    MIN_SIMILARITY = 0.1
+
+    def __init__(self, path=None):
+        self.path = path or default_corpus_path()
+        self._chunks = None # (digest, chunks) of the last BIN chunked
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as db:
+            if db.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+                db.executescript("DROP TABLE IF EXISTS bins; DROP TABLE IF EXISTS chunks; DROP TABLE IF EXISTS maps;")
+                db.execute(f"PRAGMA user_version = {self.VERSION}")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS bins (id INTEGER PRIMARY KEY, digest TEXT UNIQUE, name TEXT, size INTEGER);
+                CREATE TABLE IF NOT EXISTS chunks (bin_id INTEGER, fingerprint INTEGER, offset INTEGER, length INTEGER,
+                                                   PRIMARY KEY (bin_id, fingerprint)) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS chunks_fingerprint ON chunks (fingerprint);
+                CREATE TABLE IF NOT EXISTS maps (bin_id INTEGER, name TEXT, addr INTEGER, source TEXT,
+                                                 PRIMARY KEY (bin_id, name)) WITHOUT ROWID;
+            """)
+
+    @contextmanager
+    def _connect(self):
+        # One connection per call: the corpus is used from worker threads and processes
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            with db: yield db # Commits, or rolls back on an error
+        finally:
+            db.close()
+
+    @classmethod
+    def boundaries(cls, data, should_stop=None):
+        """
+        Chunk end offsets of data (the last one is len(data)), None if
+        should_stop() turned true.
+        """
+        buf = np.frombuffer(data, dtype=np.uint8)
+        n = len(buf)
+        if n == 0: return []
+        candidates = []
+        for start in range(0, n, cls.BLOCK):
+            if should_stop and should_stop(): return None
+            # The block starts WINDOW - 1 bytes early, so every hash sees its whole window
+            lo, end = max(0, start - cls.WINDOW + 1), min(n, start + cls.BLOCK)
+            gear = GEAR[buf[lo:end]]
+            h = np.zeros(end - lo, dtype=np.uint64)
+            for j in range(min(cls.WINDOW, end - lo)):
+                h[j:] += gear[: end - lo - j] << np.uint64(j)
+            candidates.extend((np.flatnonzero((h[start - lo :] >> np.uint64(64 - cls.AVG_BITS)) == 0) + start + 1).tolist())
+        cuts, last = [], 0
+        for c in candidates:
+            while c - last > cls.MAX_CHUNK:
+                last += cls.MAX_CHUNK
+                cuts.append(last)
+            if c - last >= cls.MIN_CHUNK:
+                cuts.append(c)
+                last = c
+        while n - last > cls.MAX_CHUNK:
+            last += cls.MAX_CHUNK
+            cuts.append(last)
+        if last < n: cuts.append(n)
+        return cuts
+
+    def chunks(self, data, digest=None, should_stop=None):
+        """
+        [(fingerprint, offset, length)], the first occurrence of every
+        distinct chunk. None if should_stop() turned true.
+        """
+        digest = digest or ScanCache.digest(data)
+        if self._chunks is not None and self._chunks[0] == digest: return self._chunks[1]
+        cuts = self.boundaries(data, should_stop)
+        if cuts is None: return None
+        view = memoryview(data)
+        out, seen, start = [], set(), 0
+        for i, end in enumerate(cuts):
+            if should_stop and i % 256 == 0 and should_stop(): return None
+            fp = int.from_bytes(hashlib.blake2b(view[start:end], digest_size=8).digest(), 'little', signed=True)
+            if fp not in seen:
+                seen.add(fp)
+                out.append((fp, start, end - start))
+            start = end
+        self._chunks = (digest, out)
+        return out
+
+    def add_bin(self, data, name, db=None):
+        """
+        Adds data (once per content) and returns its bin id.
+        """
+        digest = ScanCache.digest(data)
+        if db is None:
+            with self._connect() as db: return self.add_bin(data, name, db)
+        row = db.execute("SELECT id FROM bins WHERE digest = ?", (digest,)).fetchone()
+        if row: return row[0]
+        bin_id = db.execute("INSERT INTO bins (digest, name, size) VALUES (?, ?, ?)", (digest, name, len(data))).lastrowid
+        db.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)",
+                       [(bin_id, fp, off, length) for fp, off, length in self.chunks(data, digest)])
+        return bin_id
+
+    def add_maps(self, data, name, addresses, source):
+        """
+        Records {map name: address} known in data. source: "xdf" or "transfer".
+        """
+        with self._connect() as db:
+            bin_id = self.add_bin(data, name, db)
+            db.executemany("""INSERT INTO maps VALUES (?, ?, ?, ?)
+                              ON CONFLICT (bin_id, name) DO UPDATE SET addr = excluded.addr, source = excluded.source
+                              WHERE maps.source != 'xdf' OR excluded.source = 'xdf'""",
+                           [(bin_id, n, a, source) for n, a in addresses.items()])
+        return bin_id
+
+    def add_source(self, data, name, all_maps):
+        # The XDF belongs to this BIN, its addresses are known-good
+        return self.add_maps(data, name, {n: m.z_addr for n, m in all_maps.items() if m.z_addr > 0}, "xdf")
+
+    def add_transfer(self, data, name, all_maps):
+        # Maps a scan placed with certainty; fuzzy results are guesses and would not verify anyway
+        found = {n: m.target_addr for n, m in all_maps.items() if m.match_type in ("UNIQUE", "SEQUENTIAL") and m.target_addr > 0}
+        return self.add_maps(data, name, found, "transfer")
+
+    def closest(self, data, limit=5, should_stop=None):
+        """
+        Known BINs sharing the most chunk bytes with data, best first:
+        [(bin id, name, digest, similarity)], similarity = shared bytes / distinct chunk bytes of data.
+        None if should_stop() turned true while data was chunked.
+        """
+        chunks = self.chunks(data, should_stop=should_stop)
+        if chunks is None: return None
+        if not chunks: return []
+        with self._connect() as db:
+            db.execute("CREATE TEMP TABLE probe (fingerprint INTEGER PRIMARY KEY, length INTEGER)")
+            db.executemany("INSERT INTO probe VALUES (?, ?)", [(fp, length) for fp, _, length in chunks])
+            rows = db.execute("""SELECT b.id, b.name, b.digest, SUM(p.length) AS shared
+                                 FROM probe p JOIN chunks c ON c.fingerprint = p.fingerprint JOIN bins b ON b.id = c.bin_id
+                                 GROUP BY b.id ORDER BY shared DESC, b.id LIMIT ?""", (limit,)).fetchall()
+        total = sum(length for _, _, length in chunks)
+        return [(bin_id, name, digest, shared / total) for bin_id, name, digest, shared in rows]
+
+    def seed_bins(self, data, limit=3, should_stop=None):
+        """
+        The closest() BINs seeds() takes addresses from.
+        """
+        closest = self.closest(data, limit, should_stop)
+        if closest is None: return None
+        return [c for c in closest if c[3] >= self.MIN_SIMILARITY]
+
+    def seeds(self, data, sizes, limit=3, should_stop=None):
+        """
+        Target addresses {map name: address} in data for the maps known in
+        its closest BINs (sizes: {map name: bytes of its data}, see
+        map_sizes()). A known address is only moved where the map lies in
+        chunks data shares with that BIN, in the same order: the bytes
+        moved as a block, the delta is exact and one comparison verifies it.
+        Returns (seeds, seed_bins()), None if should_stop() turned true.
+        """
+        closest = self.seed_bins(data, limit, should_stop)
+        if closest is None: return None
+        here = {fp: off for fp, off, _ in self.chunks(data)}
+        seeds = {}
+        with self._connect() as db:
+            for bin_id, *_ in closest:
+                known = db.execute("SELECT fingerprint, offset, length FROM chunks WHERE bin_id = ? ORDER BY offset",
+                                   (bin_id,)).fetchall()
+                starts = [off for _, off, _ in known]
+                for name, addr in db.execute("SELECT name, addr FROM maps WHERE bin_id = ?", (bin_id,)):
+                    if name in seeds or name not in sizes: continue
+                    delta = self._shared_delta(known, starts, here, addr, sizes[name])
+                    if delta is not None: seeds[name] = addr + delta
+        return seeds, closest
+
+    @staticmethod
+    def _shared_delta(known, starts, here, addr, size):
+        # Offset of [addr, addr+size) if every chunk it touches is shared and they moved together
+        i = bisect_right(starts, addr) - 1
+        delta, pos = None, addr
+        while i >= 0:
+            fp, off, length = known[i]
+            # Only the first copy of a repeated chunk is stored, a gap ends the run
+            if fp not in here or off + length <= pos: return None
+            if delta is None: delta = here[fp] - off
+            elif here[fp] - off != delta: return None
+            if addr + size <= off + length: return delta
+            pos, i = off + length, i + 1
+            if i == len(known) or known[i][1] != pos: return None
+        return None
+
+    @staticmethod
+    def map_sizes(maps):
+        # {name: bytes of its Z data}, what seeds() has to find inside shared chunks
+        return {m.name: m.z_rows * m.z_cols * (2 if m.z_is16 else 1) for m in maps}
+
+    def stats(self):
+        with self._connect() as db:
+            return {t: db.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("bins", "chunks", "maps")}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m corpus", description="Local library of known BINs and their map addresses.")
+    parser.add_argument("--db", help="corpus file (default: next to the scan cache)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="add XDF/BIN pairs (the XDF must match its BIN)")
+    add.add_argument("pairs", nargs="+", help="XDF BIN [XDF BIN ...]")
+    find = sub.add_parser("find", help="closest known BINs of a target")
+    find.add_argument("target", help="target BIN")
+    find.add_argument("-n", type=int, default=5, help="how many to list")
+    sub.add_parser("stats", help="number of BINs, chunks and known map addresses")
+    args = parser.parse_args(argv)
+
+    corpus = FirmwareCorpus(args.db)
+    if args.command == "add":
+        if len(args.pairs) % 2:
+            parser.error("expected XDF BIN pairs")
+        from data_engine import DataEngine
+        engine = DataEngine()
+        for xdf, bin_path in zip(args.pairs[0::2], args.pairs[1::2]):
+            _, all_maps = engine.parse_xdf(xdf)
+            with open(bin_path, "rb") as f: data = f.read()
+            corpus.add_source(data, os.path.basename(bin_path), all_maps)
+            print(f"{os.path.basename(bin_path)}: {len(all_maps)} maps from {os.path.basename(xdf)}", file=sys.stderr)
+    elif args.command == "find":
+        with open(args.target, "rb") as f: data = f.read()
+        started = time.perf_counter()
+        closest = corpus.closest(data, args.n)
+        for _, name, digest, similarity in closest:
+            print(f"{similarity:7.1%}  {name}  {digest[:12]}")
+        print(f"{len(closest)} matches in {time.perf_counter() - started:.3f}s", file=sys.stderr)
+    else:
+        for k, v in corpus.stats().items(): print(f"{k}: {v:,}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
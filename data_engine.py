@@ -1,9 +1,65 @@
 import struct
-import xml.etree.ElementTree as ET
-import io
-from models import XDFMap
+import mmap
+import os
+from bisect import bisect_left, bisect_right
+import numpy as np
+from target_index import TargetIndex, QGramIndex, find_all_linear
+from equations import compile_equation
+from models import MATCH_CODES, rows_of, table_of
+from xdf_document import read_xdf, XDFPatch
+from profiling import EngineProfile
+from regions import SEGMENT0
 
 class DataEngine:
+    # Elements compared per block by the fuzzy kernel (block rows * pattern length)
+    FUZZY_BLOCK_ELEMENTS = 1 << 18
+    # Pattern bytes scored per step before windows over the bound are dropped
+    FUZZY_COLUMNS = 16
+    # Fuzzy candidates kept per map for review, best first
+    FUZZY_TOP_K = 5
+    # Bytes around the map's own offset searched for its axes before a global search
+    AXIS_WINDOW = 0x200
+    # Maps per batch yielded while their axes are resolved
+    AXIS_BATCH = 64
+
+    def __init__(self, context_radius=None, fuzzy_tolerance=10, fuzzy_threshold=0.80, regions=None):
+        self.context_radius = context_radius   # Max bytes of context compared on each side (Deep Match), None = unlimited
+        self.fuzzy_tolerance = fuzzy_tolerance # +/- raw value per byte in Fuzzy Search
+        self.fuzzy_threshold = fuzzy_threshold # Share of bytes that must be within tolerance
+        self.regions = regions                 # Searched (start, end) target ranges (SearchRegions.spans), None = all after Segment 0
+        self.profile = EngineProfile()         # Phase timers and hot-path counters, see profiling.py
+
+    def scan_params(self):
+        """
+        Parameters that change scan results (cache keys, worker processes).
+        """
+        return {"context_radius": self.context_radius, "fuzzy_tolerance": self.fuzzy_tolerance,
+                "fuzzy_threshold": self.fuzzy_threshold,
+                "regions": None if self.regions is None else [list(span) for span in self.regions]}
+
+    def search_spans(self, size, start=0, end=None):
+        """
+        The searched (start, end) ranges of a target of size bytes, clipped to [start, end).
+        """
+        spans = [(SEGMENT0, size)] if self.regions is None else self.regions
+        end = size if end is None else min(end, size)
+        return [(max(a, start), min(b, end)) for a, b in spans if max(a, start) < min(b, end)]
+
+    def in_regions(self, addr, length, size):
+        # The whole map must fit in one searched range
+        return any(a <= addr and addr + length <= b for a, b in self.search_spans(size))
+
+    @staticmethod
+    def load_bin(path):
+        """
+        Maps a BIN read-only instead of reading it into memory. The engine
+        only slices it through memoryviews, so pages are shared with the OS
+        cache and no per-comparison copies are made.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0: return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
     @staticmethod
     def read_raw(data, addr, is16, signed=False):
         """
@@ -16,91 +72,337 @@ class DataEngine:
         return struct.unpack_from(fmt, data, addr)[0]
 
     @staticmethod
-    def scan_for_matches(src_data, target_data, addr, rows, cols, is16, max_matches=100):
+    def read_array(data, addr, count, is16):
+        """
+        count raw values from addr as one array, same rules as read_raw
+        (elements outside the BIN read as 0).
+        """
+        size = 2 if is16 else 1
+        out = np.zeros(count, dtype=np.int64)
+        if not data or count <= 0: return out
+        first = 0 if addr >= 0 else min(count, (-addr + size - 1) // size)
+        start = addr + first * size
+        avail = max(0, min(count, first + (len(data) - start) // size) - first)
+        if avail:
+            out[first : first + avail] = np.frombuffer(data, dtype="<u2" if is16 else np.uint8, count=avail, offset=start)
+        return out
+
+    def scan_for_matches(self, src_data, target_data, addr, rows, cols, is16, max_matches=100, index=None):
         matches = []
         if addr < 0 or not src_data or not target_data:
             return matches
         element_size = 2 if is16 else 1
         total_size = rows * cols * element_size
         if addr + total_size > len(src_data): return matches
-        pattern = src_data[addr : addr + total_size]
-        start = 0x10000 # Ignore Segment 0 (Bootloader/RAM)
-        while len(matches) < max_matches:
-            idx = target_data.find(pattern, start)
-            if idx == -1: break
-            matches.append(idx)
-            start = idx + 1
+        pattern = memoryview(src_data)[addr : addr + total_size]
+        # 16-bit data keeps its word alignment, only offsets of the source parity count
+        parity = addr & 1 if is16 else None
+        # Only the search regions (by default all but Segment 0, the bootloader/RAM)
+        for start, end in self.search_spans(len(target_data)):
+            if end - start < total_size: continue
+            if index is not None:
+                matches += index.find_all(pattern, start, max_matches - len(matches), parity, end)
+            else:
+                matches += find_all_linear(target_data, pattern, start, max_matches - len(matches), parity, end)
+            if len(matches) >= max_matches: break
         return matches
 
-    def scan_with_context(self, src_data, target_data, addr, rows, cols, is16):
+    def scan_with_context(self, src_data, target_data, addr, rows, cols, is16, index=None, matches=None):
         """
         Returns: (matches, is_deep, radius_l, radius_r)
+        index: optional TargetIndex of target_data (built once per target BIN).
+        matches: scan_for_matches() result if the caller already has it.
+        Context is compared left first, then right, for as long as it tells
+        the candidates apart (up to context_radius bytes if one is set).
+        radius_l/radius_r: context bytes needed to pick the winner.
         """
-        matches = self.scan_for_matches(src_data, target_data, addr, rows, cols, is16)
+        profile = self.profile
+        if matches is None:
+            with profile.phase("scan"):
+                matches = self.scan_for_matches(src_data, target_data, addr, rows, cols, is16, index=index)
+            profile.count("find_calls")
+            profile.count("candidates", len(matches))
         if len(matches) == 1:
             return matches, False, 0, 0 # Standard Unique (Radius 0)
         if len(matches) == 0:
             return matches, False, 0, 0
-            
+
         element_size = 2 if is16 else 1
         ps = rows * cols * element_size
-        radius_l = radius_r = 0
-        current_matches = matches[:]
-        
+        src_arr = np.frombuffer(src_data, dtype=np.uint8)
+        trg_arr = np.frombuffer(target_data, dtype=np.uint8)
+        cands = np.array(matches, dtype=np.int64)
+        limit = len(trg_arr) if self.context_radius is None else self.context_radius
+        profile.count("context_scans")
+
         # LEFT
-        for step in range(1, 9):
-            if addr - step < 0: break
-            radius_l = step
-            src_left = src_data[addr - step : addr]
-            filtered = [m for m in current_matches if m - step >= 0 and target_data[m - step : m] == src_left]
-            if len(filtered) == 1: return filtered, True, radius_l, 0
-            if len(filtered) == 0:
-                radius_l -= 1
-                break 
-            current_matches = filtered
+        bounds = np.minimum(np.minimum(cands, addr), limit)
+        with profile.phase("context"):
+            lengths = self.common_extension(src_arr, trg_arr, addr - 1, cands - 1, bounds, -1, profile)
+        current, radius_l, unique = self._longest_agreement(cands, lengths)
+        if unique: return current, True, radius_l, 0
 
         # RIGHT
-        for step in range(1, 9):
-            if addr + ps + step > len(src_data): break
-            radius_r = step
-            src_right = src_data[addr + ps : addr + ps + step]
-            filtered = [m for m in current_matches if m + ps + step <= len(target_data) and target_data[m + ps : m + ps + step] == src_right]
-            if len(filtered) == 1: return filtered, True, radius_l, radius_r
-            if len(filtered) == 0:
-                radius_r -= 1
-                break
-            current_matches = filtered
-        return current_matches, (len(current_matches) < len(matches)), radius_l, radius_r
-
-    def resolve_matches(self, all_maps, src_data, trg_data):
+        cands = np.array(current, dtype=np.int64)
+        bounds = np.minimum(np.minimum(len(trg_arr) - cands - ps, len(src_arr) - addr - ps), limit)
+        with profile.phase("context"):
+            lengths = self.common_extension(src_arr, trg_arr, addr + ps, cands + ps, bounds, 1, profile)
+        current, radius_r, unique = self._longest_agreement(cands, lengths)
+        if unique: return current, True, radius_l, radius_r
+        return current, (len(current) < len(matches)), radius_l, radius_r
+
+    @staticmethod
+    def _longest_agreement(cands, lengths):
+        """
+        Candidates with the longest context agreement. Returns (matches,
+        radius, unique): a single winner needs one byte more than the
+        runner-up, a tie keeps everyone at the longest agreement.
+        """
+        top = lengths.max()
+        winners = lengths == top
+        if np.count_nonzero(winners) == 1:
+            return cands[winners].tolist(), int(lengths[~winners].max()) + 1, True
+        return cands[winners].tolist(), int(top), False
+
+    @staticmethod
+    def common_extension(src_arr, trg_arr, src_pos, trg_pos, bounds, step, profile=None):
+        """
+        Longest common extension of the source at src_pos against every
+        candidate at trg_pos[i], walking in direction step (-1 left, +1 right)
+        and capped at bounds[i]. Candidates are compared in doubling blocks,
+        all at once; once a single candidate still agrees it is the longest
+        one and its length is left as a lower bound.
+        profile: EngineProfile counting blocks (context_steps) and bytes compared.
+        """
+        lengths = np.zeros(len(trg_pos), dtype=np.int64)
+        active = np.flatnonzero(bounds > 0)
+        done, block = 0, 16
+        while len(active) > 1 or (len(active) == 1 and done == 0):
+            ks = np.arange(done, done + block)
+            valid = ks < bounds[active, None]
+            s_idx = np.clip(src_pos + step * ks, 0, len(src_arr) - 1)
+            t_idx = np.clip(trg_pos[active, None] + step * ks, 0, len(trg_arr) - 1)
+            agree = (trg_arr[t_idx] == src_arr[s_idx]) & valid
+            full = agree.all(axis=1)
+            lengths[active] = np.where(full, done + block, done + np.argmin(agree, axis=1))
+            if profile is not None:
+                profile.count("context_steps")
+                profile.count("context_bytes", len(active) * block)
+            active = active[full]
+            done += block
+            block = min(block * 2, 4096)
+        return lengths
+
+    def scan_key(self, src_data, addr, rows, cols, is16):
+        """
+        Everything scan_with_context() reads from the source: the pattern and
+        the context bytes it may compare on each side. Maps with equal keys
+        get equal results. None = nothing to scan (address outside the source).
+        Unlimited context reaches the ends of the source, the address stands in for it;
+        otherwise 16-bit maps add the parity their matches must have.
+        """
+        ps = rows * cols * (2 if is16 else 1)
+        if addr < 0 or addr + ps > len(src_data): return None
+        src_view = memoryview(src_data)
+        if self.context_radius is None:
+            return bytes(src_view[addr : addr + ps]), addr
+        left = src_view[max(0, addr - self.context_radius) : addr]
+        right = src_view[addr + ps : addr + ps + self.context_radius]
+        return bytes(src_view[addr : addr + ps]), bytes(left), bytes(right), self.match_parity(addr, is16)
+
+    @staticmethod
+    def match_parity(addr, is16):
+        # Byte parity of the offsets a map may match at, None = any (8-bit)
+        return addr & 1 if is16 else None
+
+    def lookup_key(self, key, m):
+        # What scan_for_matches() searches the target for; groups with equal lookups share one search
+        return key[0], self.match_parity(m.z_addr, m.z_is16)
+
+    def count_lookups(self, groups):
+        """
+        Distinct target searches the group_patterns() groups need. With
+        unlimited context every address is its own group, the patterns
+        are still searched once.
+        """
+        return len({self.lookup_key(key, members[0]) for key, members in groups.items() if key is not None})
+
+    def group_patterns(self, maps, src_data):
+        """
+        Pattern-deduplication stage: {scan_key: [maps]}, so every distinct
+        pattern + context is scanned once and fanned out to all its maps
+        (per-cylinder copies, all-zero tables...).
+        """
+        groups = {}
+        for m in maps:
+            key = self.scan_key(src_data, m.z_addr, m.z_rows, m.z_cols, m.z_is16)
+            groups.setdefault(key, []).append(m)
+        return groups
+
+    @staticmethod
+    def apply_scan(maps, result):
+        matches, is_deep, radius_l, radius_r = result
+        for m in maps:
+            m.matches = list(matches)
+            m.match_count = len(matches)
+            m.is_deep = is_deep
+            m.deep_l = radius_l
+            m.deep_r = radius_r
+
+    def scan_maps(self, all_maps, src_data, target_data, index=None, progress_callback=None, should_stop=None, names=None,
+                  offset_map=None, seeds=None):
+        """
+        Resets every map and scans its Z data (serial). Results go straight into all_maps.
+        names: only scan these maps (incremental rescan).
+        offset_map: OffsetMap of the BIN pair; maps it places are not searched.
+        seeds: {name: target address} candidates (FirmwareCorpus.seeds), see seed_groups().
+        Returns: (maps, distinct patterns, see count_lookups())
+        """
+        maps = list(all_maps.values()) if names is None else [all_maps[n] for n in all_maps if n in names]
+        if maps: maps[0].table.reset_scan(rows_of(maps))
+        groups = self.group_patterns(maps, src_data)
+        distinct = self.count_lookups(groups)
+        if offset_map is not None: groups = self.align_groups(groups, src_data, target_data, offset_map)
+        if seeds: groups = self.seed_groups(groups, target_data, seeds)
+        self.scan_groups(groups, src_data, target_data, index, progress_callback, should_stop)
+        return len(maps), distinct
+
+    def align_groups(self, groups, src_data, target_data, offset_map):
+        """
+        Places every group whose maps all lie in aligned segments of
+        offset_map with a single comparison per map (UNIQUE, no search).
+        Each map gets its own predicted address, maps of one group can sit
+        at different source addresses (context_radius set).
+        Returns the groups that still need scan_groups().
+        """
+        predict = lambda m, pattern: offset_map.predict(src_data, target_data, m.z_addr, len(pattern))
+        return self._place_groups(groups, target_data, predict, "aligned")
+
+    def seed_groups(self, groups, target_data, seeds):
+        """
+        Places every group whose maps all have a seed holding their pattern
+        (FirmwareCorpus.seeds: the map lies in a chunk the target shares
+        byte for byte with a known BIN, so one comparison confirms it, like
+        align_groups). Returns the groups that still need scan_groups().
+        """
+        view = memoryview(target_data)
+        def predict(m, pattern):
+            t = seeds.get(m.name)
+            return t if t is not None and view[t : t + len(pattern)] == pattern else None
+        return self._place_groups(groups, target_data, predict, "seeded")
+
+    def _place_groups(self, groups, target_data, predict, counter):
+        # predict(map, pattern) -> target address holding the pattern or None
+        rest = {}
+        with self.profile.phase("place"):
+            for key, members in groups.items():
+                targets = []
+                for m in members if key is not None else ():
+                    t = predict(m, key[0])
+                    # Same search region and word alignment rules as scan_for_matches
+                    if (t is None or not self.in_regions(t, len(key[0]), len(target_data))
+                            or (m.z_is16 and (t - m.z_addr) & 1)):
+                        targets = None
+                        break
+                    targets.append(t)
+                if not targets:
+                    rest[key] = members
+                    continue
+                for m, t in zip(members, targets): self.apply_scan([m], ([t], False, 0, 0))
+        self.profile.count(counter, len(groups) - len(rest))
+        return rest
+
+    def scan_groups(self, groups, src_data, target_data, index=None, progress_callback=None, should_stop=None):
+        """
+        Scans each group_patterns() group once and fans the result out to its maps.
+        progress_callback(done, total) is called every 10 groups.
+        """
+        total = len(groups)
+        if should_stop and should_stop(): return
+        for i, _ in enumerate(self.iter_scan_groups(groups, src_data, target_data, index)):
+            if progress_callback and i % 10 == 0:
+                progress_callback(i, total)
+            if should_stop and should_stop(): break
+
+    def iter_scan_groups(self, groups, src_data, target_data, index=None):
+        """
+        scan_groups() one group at a time: yields the group's maps as soon
+        as their Z matches are in. Stop iterating to cancel, the groups not
+        reached yet keep their reset state.
+        """
+        if index is None: index = TargetIndex(target_data)
+        found = {} # (pattern, parity) -> target matches; one search per pattern even if contexts differ
+        for key, members in groups.items():
+            if key is None:
+                self.apply_scan(members, ([], False, 0, 0))
+                yield members
+                continue
+            m = members[0]
+            lookup = self.lookup_key(key, m)
+            if lookup not in found:
+                with self.profile.phase("scan"):
+                    found[lookup] = self.scan_for_matches(src_data, target_data, m.z_addr, m.z_rows, m.z_cols, m.z_is16, index=index)
+                self.profile.count("find_calls")
+                self.profile.count("candidates", len(found[lookup]))
+            # Scan Z (Deep scanning with context)
+            self.apply_scan(members, self.scan_with_context(src_data, target_data, m.z_addr, m.z_rows, m.z_cols, m.z_is16,
+                                                            index=index, matches=found[lookup]))
+            yield members
+
+    def resolve_matches(self, all_maps, src_data, trg_data, index=None, names=None, patterns=None):
         """
         Priority: 1. Standard Unique, 2. Deep Match Unique, 3. Sequential/Offset.
+        index: TargetIndex of trg_data, built here if the caller has none.
+        names: only resolve these maps; must cover whole pattern groups (see ScanState.plan).
+        patterns: (addr, size) -> source pattern bytes memo, reused between scans.
         """
+        for _ in self.iter_resolve(all_maps, src_data, trg_data, index, names, patterns): pass
+
+    def iter_resolve(self, all_maps, src_data, trg_data, index=None, names=None, patterns=None):
+        """
+        resolve_matches() in steps: yields lists of XDFMaps as their result
+        is decided (all unique maps at once, then one pattern group at a
+        time, then the axes in batches of AXIS_BATCH maps). Stopping early
+        leaves the maps not reached yet unresolved.
+        """
+        if index is None: index = TargetIndex(trg_data)
+        if patterns is None: patterns = {}
+        maps = list(all_maps.values()) if names is None else [all_maps[n] for n in all_maps if n in names]
+        if not maps: return
+        table = maps[0].table
+        rows = rows_of(maps)
+        yield from self.profile.timed("group", self._resolve_groups(table, rows, src_data, patterns))
+        yield from self.profile.timed("axes", self._resolve_axes(table, rows, src_data, trg_data, index))
+
+    def _resolve_groups(self, table, rows, src_data, patterns):
+        src_view = memoryview(src_data)
+        z_addr, match_count = table["z_addr"], table["match_count"]
         # 1. First verify all maps using scan with context
+        # If hloubkově unique (Standard or Deep), confirm immediately; nothing found at all stays NONE, left for Fuzzy Search
+        unique = rows[(z_addr[rows] > 0) & (match_count[rows] == 1)]
+        table["match_type"][unique] = MATCH_CODES["UNIQUE"]
+        table["match_percent"][unique] = 100
+        matches = table["matches"]
+        table["target_addr"][unique] = [matches[r][0] for r in unique.tolist()]
+        if len(unique): yield [table.views[r] for r in unique.tolist()]
+
+        # If not unique, group for sequential analysis
+        sizes, z_is16 = table.z_sizes(), table["z_is16"]
         pattern_groups = {}
-        for m in all_maps.values():
-            if m.z_addr <= 0: continue
-            
-            # If hloubkově unique (Standard or Deep), confirm immediately
-            if m.match_count == 1:
-                # Standard unique (is_deep will be False from ScanWorker if this method was used earlier)
-                m.match_type = "UNIQUE"
-                m.target_addr = m.matches[0]
-                m.match_percent = 100
-                continue
-            
-            # If not unique, group for sequential analysis
-            size = m.z_rows * m.z_cols * (2 if m.z_is16 else 1)
-            if m.z_addr + size > len(src_data): continue
-            pattern = src_data[m.z_addr : m.z_addr + size]
-            if pattern not in pattern_groups: pattern_groups[pattern] = []
-            pattern_groups[pattern].append(m)
+        for r in rows[(z_addr[rows] > 0) & (match_count[rows] > 1)].tolist():
+            addr, size = int(z_addr[r]), int(sizes[r])
+            if addr + size > len(src_data): continue
+            key = (addr, size)
+            if key not in patterns: patterns[key] = bytes(src_view[addr : addr + size])
+            # 16-bit maps of the other parity have other matches, they form their own group
+            group_key = (patterns[key], self.match_parity(addr, bool(z_is16[r])))
+            pattern_groups.setdefault(group_key, []).append(table.views[r])
 
         # 2. Group evaluation (Sequential matching with Deep protection)
-        for pattern, maps in pattern_groups.items():
+        for group in pattern_groups.values():
             # Before doing sequence, try Deep Match again for each map (only for this group)
             unresolved = []
-            for m in maps:
+            for m in group:
                 if m.is_deep and len(m.matches) == 1:
                     m.match_type = "UNIQUE"
                     m.target_addr = m.matches[0]
@@ -109,12 +411,14 @@ class DataEngine:
                 else:
                     unresolved.append(m)
             
-            if not unresolved: continue
+            if not unresolved:
+                yield group
+                continue
             
             # Remaining maps in pattern are resolved sequentially
             # But must exclude matches (addresses in target) already occupied by Deep maps!
-            occupied_addresses = set(m.target_addr for m in maps if m.match_type == "UNIQUE")
-            available_matches = [addr for addr in maps[0].matches if addr not in occupied_addresses]
+            occupied_addresses = set(m.target_addr for m in group if m.match_type == "UNIQUE")
+            available_matches = [addr for addr in group[0].matches if addr not in occupied_addresses]
             
             if len(unresolved) == len(available_matches) and len(available_matches) > 0:
                 sorted_maps = sorted(unresolved, key=lambda x: x.z_addr)
@@ -127,222 +431,211 @@ class DataEngine:
                 for m in unresolved:
                     m.match_type = "AMBIGUOUS"
                     m.match_percent = 0
+            yield group
 
+    def _resolve_axes(self, table, rows, src_data, trg_data, index):
         # 3. Axis resolution - now also with DEEP LOGIC
-        for m in all_maps.values():
-            if m.target_addr <= 0: continue
-            
-            for ax in ['x', 'y']:
-                addr = getattr(m, f"{ax}_addr")
-                count = getattr(m, f"{ax}_count")
-                is16 = getattr(m, f"{ax}_is16")
+        # Many maps share one RPM/load axis: the global lookup is done once per axis
+        profile = self.profile
+        axis_cache = {} # (addr, count, is16) -> scan_with_context result
+        z_addr = table["z_addr"]
+        placed = rows[table["target_addr"][rows] > 0]
+        offsets = table["target_addr"][placed] - z_addr[placed]
+        for ax in ['x', 'y']:
+            c = {f: table[f"{ax}_{f}"] for f in ("addr", "count", "is16", "matches", "is_deep", "deep_l", "deep_r", "match_type")}
+            target = table[f"target_{ax}_addr"]
+            for i, (r, offset) in enumerate(zip(placed.tolist(), offsets.tolist())):
+                if i and i % self.AXIS_BATCH == 0:
+                    yield [table.views[p] for p in placed[i - self.AXIS_BATCH : i].tolist()]
+                addr, count, is16 = c["addr"].item(r), c["count"].item(r), c["is16"].item(r)
                 if addr <= 0: continue
-                
+
+                # Axes usually move together with their map, look there first
+                near = self.find_near(src_data, trg_data, addr, count * (2 if is16 else 1), addr + offset, is16)
+                if near is not None:
+                    profile.count("axis_near_hits")
+                    c["matches"][r] = [near]
+                    c["is_deep"][r], c["deep_l"][r], c["deep_r"][r] = False, 0, 0
+                    target[r] = near
+                    c["match_type"][r] = MATCH_CODES["OFFSET"]
+                    continue
+
                 # Deep Match for axis
-                matches, is_deep, rl, rr = self.scan_with_context(src_data, trg_data, addr, 1, count, is16)
-                setattr(m, f"{ax}_matches", matches)
-                setattr(m, f"{ax}_is_deep", is_deep)
-                setattr(m, f"{ax}_deep_l", rl)
-                setattr(m, f"{ax}_deep_r", rr)
-                
+                key = (addr, count, is16)
+                if key not in axis_cache:
+                    profile.count("axis_scans")
+                    axis_cache[key] = self.scan_with_context(src_data, trg_data, addr, 1, count, is16, index=index)
+                matches, is_deep, rl, rr = axis_cache[key]
+                c["matches"][r] = list(matches)
+                c["is_deep"][r], c["deep_l"][r], c["deep_r"][r] = is_deep, rl, rr
+
                 if len(matches) == 1:
-                    setattr(m, f"target_{ax}_addr", matches[0])
-                    setattr(m, f"{ax}_match_type", "UNIQUE")
+                    target[r] = matches[0]
+                    c["match_type"][r] = MATCH_CODES["UNIQUE"]
                 elif matches:
-                    # If not unique, try OFFSET
-                    offset = m.target_addr - m.z_addr
-                    if (addr + offset) in matches:
-                        setattr(m, f"target_{ax}_addr", addr + offset)
-                        setattr(m, f"{ax}_match_type", "OFFSET")
-                    else:
-                        setattr(m, f"target_{ax}_addr", matches[0])
-                        setattr(m, f"{ax}_match_type", "GUESS")
+                    target[r] = matches[0]
+                    c["match_type"][r] = MATCH_CODES["GUESS"]
                 else:
-                    setattr(m, f"target_{ax}_addr", -1)
-                    setattr(m, f"{ax}_match_type", "NONE")
+                    target[r] = -1
+                    c["match_type"][r] = MATCH_CODES["NONE"]
+            tail = len(placed) % self.AXIS_BATCH or self.AXIS_BATCH
+            if len(placed): yield [table.views[p] for p in placed[-tail:].tolist()]
+
+    def find_near(self, src_data, trg_data, addr, size, expected, is16=False):
+        """
+        Looks for src_data[addr:addr+size] within AXIS_WINDOW bytes of the
+        expected target address. Returns the closest hit or None.
+        is16: only hits with the parity of addr count (word alignment).
+        """
+        if addr < 0 or size <= 0 or addr + size > len(src_data): return None
+        lo = max(0, expected - self.AXIS_WINDOW)
+        hi = min(len(trg_data), expected + size + self.AXIS_WINDOW)
+        if hi - lo < size: return None
+        # Both sides are searched in place, only the offsets are materialised
+        pattern = memoryview(src_data)[addr : addr + size]
+        parity = self.match_parity(addr, is16)
+        # Same search region and word alignment rules as scan_for_matches
+        usable = lambda o: self.in_regions(o, size, len(trg_data))
+        if lo <= expected and parity in (None, expected & 1) and memoryview(trg_data)[expected : expected + size] == pattern and usable(expected):
+            return expected
+        hits = [o for o in find_all_linear(trg_data, pattern, lo, hi - lo, parity, hi) if usable(o)]
+        return min(hits, key=lambda o: (abs(o - expected), o), default=None)
 
-    def write_xdf(self, original_tree, all_maps, output_path, include_deep=True):
-        root = original_tree.getroot()
+    def write_xdf(self, document, all_maps, output_path, include_deep=True):
+        """
+        Streams the original XDF to output_path with the target addresses and
+        title markers patched in and the maps that are not exported left out.
+        Nothing shared is modified: the same document/all_maps can be
+        exported any number of times, also concurrently.
+        """
         def should_export(m):
             if m.match_type not in ["UNIQUE", "SEQUENTIAL", "FUZZY"]: return False
             if m.is_deep and not include_deep: return False
             return True
-        nodes_to_keep = set(m.node for m in all_maps.values() if should_export(m))
-        for m in all_maps.values():
-            if m.node in nodes_to_keep:
-                title_node = m.node.find("title")
-                if title_node is not None:
-                    text = str(title_node.text or "")
-                    for marker in [" (seq)", " (deep)", " (x-deep)", " (y-deep)", " (x-off)", " (y-off)", " (?x)", " (?y)"]:
-                        if marker in text: text = text.replace(marker, "")
+        exported = {m.node_index: m for m in all_maps.values() if should_export(m)}
+        with self.profile.phase("export"), XDFPatch(document) as patch:
+            for i, node in enumerate(patch.layout):
+                m = exported.get(i)
+                if m is None:
+                    patch.remove(node.element)
+                    continue
+                if node.title is not None:
+                    text = patch.text(node.title)
+                    for marker in [b" (seq)", b" (deep)", b" (x-deep)", b" (y-deep)", b" (x-off)", b" (y-off)", b" (?x)", b" (?y)"]:
+                        if marker in text: text = text.replace(marker, b"")
                     markers = ""
                     if m.match_type == "SEQUENTIAL": markers += " (seq)"
                     if m.match_type == "FUZZY": markers += " (fuzzy)"
                     if m.is_deep: markers += " (deep)"
                     if m.x_is_deep: markers += " (x-deep)"
                     if m.y_is_deep: markers += " (y-deep)"
-                    title_node.text = text.strip() + markers
+                    patch.set_text(node.title, text.strip() + markers.encode())
                 if m.is_scalar:
-                    emb = m.node.find("EMBEDDEDDATA")
-                    if emb is not None: emb.set('mmedaddress', f"0x{m.target_addr:X}")
-                else:
-                    z_axis = m.node.find(".//XDFAXIS[@id='z']")
-                    if z_axis is not None:
-                        emb = z_axis.find("EMBEDDEDDATA")
-                        if emb is not None: emb.set('mmedaddress', f"0x{m.target_addr:X}")
-                    for ax_id, addr in [('x', m.target_x_addr), ('y', m.target_y_addr)]:
-                        # Case-insensitive axis search using id attribute
-                        ax_node = None
-                        for axis in m.node.findall(".//XDFAXIS"):
-                            if axis.get('id', '').lower() == ax_id.lower():
-                                ax_node = axis
-                                break
-                        
-                        if ax_node is not None:
-                            emb = ax_node.find("EMBEDDEDDATA")
-                            if emb is not None: emb.set('mmedaddress', f"0x{addr:X}" if addr > 0 else "0x0")
-                            
-                            # Deep markers for axes
-                            is_deep = getattr(m, f"{ax_id}_is_deep", False)
-                            if is_deep:
-                                ax_title_node = ax_node.find("title")
-                                if ax_title_node is not None:
-                                    ax_text = str(ax_title_node.text or "")
-                                    marker = f" ({ax_id}-deep)"
-                                    if marker not in ax_text:
-                                        ax_title_node.text = ax_text.strip() + marker
-                                    
-                                    # Write to title attribute as well (some editors read from there)
-                                    attr_title = ax_node.get('title')
-                                    if attr_title and marker not in str(attr_title):
-                                        ax_node.set('title', str(attr_title).strip() + marker)
-        parent_map = {c: p for p in root.iter() for c in p}
-        for tag in ['XDFTABLE', 'XDFCONSTANT']:
-            for node in list(root.iter(tag)):
-                if node not in nodes_to_keep:
-                    parent = parent_map.get(node)
-                    if parent is not None: parent.remove(node)
-        original_tree.write(output_path, encoding="cp1252", xml_declaration=True)
+                    if node.embedded is not None: patch.set_attribute(node.embedded, 'mmedaddress', f"0x{m.target_addr:X}".encode())
+                    continue
+                z_axis = node.axes.get('z')
+                if z_axis is not None and "EMBEDDEDDATA" in z_axis.first:
+                    patch.set_attribute(z_axis.first["EMBEDDEDDATA"], 'mmedaddress', f"0x{m.target_addr:X}".encode())
+                for ax_id, addr in [('x', m.target_x_addr), ('y', m.target_y_addr)]:
+                    # Case-insensitive axis search using id attribute
+                    ax_node = node.axes.get(ax_id)
+                    if ax_node is None: continue
+                    if "EMBEDDEDDATA" in ax_node.first:
+                        patch.set_attribute(ax_node.first["EMBEDDEDDATA"], 'mmedaddress', (f"0x{addr:X}" if addr > 0 else "0x0").encode())
+
+                    # Deep markers for axes
+                    if not getattr(m, f"{ax_id}_is_deep"): continue
+                    marker = f" ({ax_id}-deep)".encode()
+                    ax_title_node = ax_node.first.get("title")
+                    if ax_title_node is not None:
+                        ax_text = patch.text(ax_title_node)
+                        if marker not in ax_text:
+                            patch.set_text(ax_title_node, ax_text.strip() + marker)
+
+                        # Write to title attribute as well (some editors read from there)
+                        attr_title = patch.attribute(ax_node, 'title')
+                        if attr_title and marker not in attr_title:
+                            patch.set_attribute(ax_node, 'title', attr_title.strip() + marker)
+            patch.write(output_path)
 
     def parse_xdf(self, path):
-        content = open(path, 'rb').read().decode('cp1252', errors='ignore')
-        tree = ET.parse(io.StringIO(content))
-        all_maps = {}
-        
-        def _find(parent, tag):
-            if parent is None: return None
-            res = parent.find(tag)
-            if res is not None: return res
-            tag_u = tag.upper()
-            for child in parent:
-                if child.tag.upper() == tag_u: return child
-            return None
-
-        def _p(n):
-            if n is None: return 0, False, False
-            a = int(n.get('mmedaddress', '0x0'), 16)
-            i = n.get('mmedelementsizebits') == "16"
-            try:
-                flags = int(n.get('mmedtypeflags', '0x00'), 16)
-                s = bool(flags & 0x01)
-            except: s = False
-            return a, i, s
-
-        def _get_eq(math_node, axis_node=None):
-            base_eq = "X"
-            if math_node is not None:
-                base_eq = math_node.get('equation', 'X')
-            
-            # kmul/kadd can be in MATH tag or directly in XDFAXIS/XDFTABLE (axis_node)
-            src = math_node if math_node is not None else axis_node
-            if src is None: return base_eq
-            
-            kmul = src.get('kmul') or (axis_node.get('kmul') if axis_node is not None and axis_node != src else None) or '1.0'
-            kadd = src.get('kadd') or (axis_node.get('kadd') if axis_node is not None and axis_node != src else None) or '0.0'
-            
-            try:
-                f_mul = float(kmul)
-                f_add = float(kadd)
-                if f_mul != 1.0 or f_add != 0.0:
-                    return f"({base_eq})*{f_mul} + {f_add}"
-            except:
-                pass
-            return base_eq
-
-        for tag in ['XDFTABLE', 'XDFCONSTANT']:
-            for node in tree.getroot().iter(tag):
-                title = node.findtext('title', 'Unknown')
-                m = XDFMap(title, node, is_scalar=(tag == 'XDFCONSTANT'))
-                
-                if m.is_scalar:
-                    m.z_addr, m.z_is16, m.z_signed = _p(_find(node, "EMBEDDEDDATA"))
-                    m.z_eq = _get_eq(_find(node, "MATH"), node)
-                else:
-                    for aid in ['x', 'y', 'z']:
-                        n = None
-                        for cand in node.findall(".//XDFAXIS"):
-                            if cand.get('id', '').lower() == aid: n = cand; break
-                        if n is None: continue
-                        e = _find(n, "EMBEDDEDDATA"); a, i, s = _p(e)
-                        eq = _get_eq(_find(n, "MATH"), n)
-                        if aid == 'z':
-                            m.z_addr, m.z_is16, m.z_signed, m.z_eq = a, i, s, eq
-                            m.z_rows = int(e.get('mmedrowcount', '1')) if e is not None else 1
-                            m.z_cols = int(e.get('mmedcolcount', '1')) if e is not None else 1
-                        elif aid == 'x':
-                            m.x_addr, m.x_is16, m.x_signed, m.x_eq = a, i, s, eq
-                            m.x_count = int(n.findtext('indexcount', '1') or '1')
-                        elif aid == 'y':
-                            m.y_addr, m.y_is16, m.y_signed, m.y_eq = a, i, s, eq
-                            m.y_count = int(n.findtext('indexcount', '1') or '1')
-                all_maps[title] = m
-        return tree, all_maps
-
-    def scan_fuzzy_sequential(self, all_maps, src_data, target_data, progress_callback=None):
         """
-        Attempts to find missing maps (NONE) in gaps between already found ones (UNIQUE/SEQ/DEEP).
-        Uses +/- 8 tolerance for each byte and at least 85% area match.
+        Returns (XDFDocument, {title: XDFMap}). See xdf_document.read_xdf.
         """
-        # 1. Collect anchors (already found maps) including their size
-        anchors = []
+        document, all_maps = read_xdf(path)
+        # Compile every equation now, the map views then reuse the cached code
         for m in all_maps.values():
-            if m.match_type in ["UNIQUE", "SEQUENTIAL", "DEEP"] and m.target_addr != -1:
-                element_size = 2 if m.z_is16 else 1
-                size = m.z_rows * m.z_cols * element_size
-                anchors.append((m.z_addr, m.target_addr, size))
-        
-        # Sort by source address
-        anchors.sort(key=lambda x: x[0])
-        
-        # 2. Iterate through missing maps
-        missing_maps = sorted([m for m in all_maps.values() if m.match_type == "NONE"], key=lambda x: x.z_addr)
-        total_missing = len(missing_maps)
-        if total_missing == 0: return
+            for eq in (m.z_eq, m.x_eq, m.y_eq): compile_equation(eq)
+        return document, all_maps
 
-        for i, m in enumerate(missing_maps):
+    def scan_fuzzy_sequential(self, all_maps, src_data, target_data, progress_callback=None, mode="scan", should_stop=None):
+        """
+        Attempts to find missing maps (NONE) in gaps between already found ones (UNIQUE/SEQ/DEEP).
+        Uses +/- fuzzy_tolerance for each byte and at least fuzzy_threshold area match.
+        mode: "scan" checks every offset of each gap, "qgram" verifies only
+        offsets that share a quantized q-gram with the pattern (same results).
+        should_stop() is polled between maps and inside the search of each map.
+        Each map gets the best window (fewest bytes out of tolerance), its
+        score in match_percent and up to FUZZY_TOP_K candidates in
+        matches / match_scores, best first.
+        Returns stats: {"offsets": window offsets, "checked": offsets verified, "pruned": skipped by the filter,
+        "bytes": pattern bytes compared (windows are abandoned early)}
+        """
+        stats = {"offsets": 0, "checked": 0, "pruned": 0, "bytes": 0}
+        for done, total, _ in self.iter_fuzzy(all_maps, src_data, target_data, mode, stats, should_stop):
             if progress_callback:
-                progress_callback(int((i / total_missing) * 100))
-            
-            element_size = 2 if m.z_is16 else 1
-            size = m.z_rows * m.z_cols * element_size
-            if m.z_addr + size > len(src_data): continue
-            pattern = src_data[m.z_addr : m.z_addr + size]
-            
-            # Najdeme okno mezi kotvami
-            src_addr = m.z_addr
-            prev_anchor = None
-            for a in anchors:
-                if a[0] < src_addr: prev_anchor = a
-                else: break
-            
-            next_anchor = None
-            for a in anchors:
-                if a[0] > src_addr:
-                    next_anchor = a
-                    break
-            
+                progress_callback(int((done / total) * 100))
+        return stats
+
+    def iter_fuzzy(self, all_maps, src_data, target_data, mode="scan", stats=None, should_stop=None):
+        """
+        scan_fuzzy_sequential() one missing map at a time: yields (done, total, XDFMap)
+        after each attempt, the map is FUZZY if it was found. stats is updated as it goes.
+        Once should_stop() is true the current search is abandoned and nothing more is recorded.
+        """
+        if stats is None: stats = {"offsets": 0, "checked": 0, "pruned": 0, "bytes": 0}
+        yield from self.profile.timed("fuzzy", self._fuzzy_steps(all_maps, src_data, target_data, mode, stats, should_stop))
+
+    def _fuzzy_steps(self, all_maps, src_data, target_data, mode, stats, should_stop):
+        tolerance, threshold = self.fuzzy_tolerance, self.fuzzy_threshold
+        profile = self.profile
+        qindexes = {} # (is16, parity) -> QGramIndex, built when first needed
+        src_view = memoryview(src_data)
+
+        table = table_of(all_maps)
+        if table is None: return
+        z_addr, target_addr, sizes, z_is16 = table["z_addr"], table["target_addr"], table.z_sizes(), table["z_is16"]
+
+        # 1. Collect anchors (already found maps) including their size, sorted by source address
+        found = table.rows_where(all_maps.values(), "UNIQUE", "SEQUENTIAL", "DEEP")
+        found = found[target_addr[found] != -1]
+        found = found[np.argsort(z_addr[found], kind='stable')]
+        anchors = list(zip(z_addr[found].tolist(), target_addr[found].tolist(), sizes[found].tolist()))
+        anchor_keys = [a[0] for a in anchors]
+
+        # 2. Iterate through missing maps
+        missing = table.rows_where(all_maps.values(), "NONE")
+        missing = missing[np.argsort(z_addr[missing], kind='stable')]
+        total_missing = len(missing)
+
+        for i, r in enumerate(missing.tolist()):
+            if should_stop and should_stop(): return
+            step = (i + 1, total_missing, table.views[r])
+            profile.count("fuzzy_maps")
+            src_addr, size = int(z_addr[r]), int(sizes[r])
+            if src_addr + size > len(src_data):
+                yield step
+                continue
+            pattern = src_view[src_addr : src_addr + size]
+
+            # Najdeme okno mezi kotvami: last anchor before, first anchor after the map
+            lo = bisect_left(anchor_keys, src_addr)
+            hi = bisect_right(anchor_keys, src_addr)
+            prev_anchor = anchors[lo - 1] if lo > 0 else None
+            next_anchor = anchors[hi] if hi < len(anchors) else None
+
             # Search start is after the end of the previous map
-            start_search = (prev_anchor[1] + prev_anchor[2]) if prev_anchor else 0x10000
+            start_search = (prev_anchor[1] + prev_anchor[2]) if prev_anchor else SEGMENT0
             # Search end is the start of the next map
             end_search = next_anchor[1] if next_anchor else len(target_data)
             
@@ -352,45 +645,168 @@ class DataEngine:
                 start_search = max(0, start_search - 8192)
                 end_search = min(len(target_data), end_search + 8192)
 
-            if start_search >= end_search: continue
-            
-            fuzzy_addr = self.find_fuzzy_match(target_data, start_search, end_search, pattern, tolerance=10, threshold=0.80)
+            if start_search >= end_search:
+                yield step
+                continue
+
+            # 16-bit maps are compared word by word, at word-aligned offsets only
+            is16 = bool(z_is16[r])
+            parity = src_addr & 1 if is16 else 0
+            qindex = None
+            if mode == "qgram":
+                if (is16, parity) not in qindexes: qindexes[(is16, parity)] = QGramIndex(target_data, tolerance, is16, parity, should_stop)
+                qindex = qindexes[(is16, parity)]
+            # Every search region inside the window on its own, the best candidates of all of them win
+            found, checked, offsets, compared = [], 0, 0, 0
+            for lo_span, hi_span in self.search_spans(len(target_data), start_search, end_search):
+                span = self.find_fuzzy_candidates(target_data, lo_span, hi_span, pattern, tolerance, threshold, qindex,
+                                                  should_stop=should_stop, is16=is16, parity=parity)
+                found = sorted(found + span[0], key=lambda c: (c[1], c[0]))[:self.FUZZY_TOP_K]
+                checked, offsets, compared = checked + span[1], offsets + span[2], compared + span[3]
+            # Search cut short: its result means nothing
+            if should_stop and should_stop(): return
+            stats["offsets"] += offsets
+            stats["checked"] += checked
+            stats["bytes"] += compared
+            stats["pruned"] = stats["offsets"] - stats["checked"]
+            profile.count("fuzzy_offsets", offsets)
+            profile.count("fuzzy_checked", checked)
+            profile.count("fuzzy_bytes", compared)
             
-            if fuzzy_addr != -1:
-                m.match_type = "FUZZY"
-                m.target_addr = fuzzy_addr
-                m.matches = [fuzzy_addr]
-                # New anchor
-                anchors.append((m.z_addr, m.target_addr, size))
-                anchors.sort(key=lambda x: x[0])
+            if found:
+                # Score: share of values within tolerance; the runners-up stay in matches for review
+                fuzzy_addr = found[0][0]
+                elements = size // 2 if is16 else size
+                scores = [round(100 * (elements - mm) / elements) for _, mm in found]
+                table["match_type"][r] = MATCH_CODES["FUZZY"]
+                target_addr[r] = fuzzy_addr
+                table["match_percent"][r] = scores[0]
+                table["matches"][r] = [o for o, _ in found]
+                table["match_scores"][r] = scores
+                # New anchor (after the anchors with the same source address)
+                anchors.insert(hi, (src_addr, fuzzy_addr, size))
+                anchor_keys.insert(hi, src_addr)
+            yield step
     
-    def find_fuzzy_match(self, data, start, end, pattern, tolerance=8, threshold=0.85):
+    def find_fuzzy_match(self, data, start, end, pattern, tolerance=8, threshold=0.85, should_stop=None):
         """
         Searches for pattern in data[start:end] with tolerance and match threshold.
+        Returns the best offset (fewest out-of-tolerance bytes, the lowest
+        offset on a tie), the same as find_fuzzy_match_reference, or -1.
+        should_stop() is polled between blocks, -1 once it is true.
+        """
+        found = self.find_fuzzy_candidates(data, start, end, pattern, tolerance, threshold, top_k=1, should_stop=should_stop)[0]
+        if not found or (should_stop and should_stop()): return -1
+        return found[0][0]
+
+    def find_fuzzy_match_qgram(self, data, start, end, pattern, qindex, tolerance=8, threshold=0.85, should_stop=None):
+        """
+        find_fuzzy_match restricted to the candidates of a QGramIndex built
+        with the same tolerance. Same result, fewer offsets verified.
+        Returns: (offset, checked, offsets)
+        """
+        found, checked, offsets, _ = self.find_fuzzy_candidates(data, start, end, pattern, tolerance, threshold, qindex, 1, should_stop)
+        if not found or (should_stop and should_stop()): return -1, checked, offsets
+        return found[0][0], checked, offsets
+
+    def find_fuzzy_candidates(self, data, start, end, pattern, tolerance=8, threshold=0.85, qindex=None, top_k=None,
+                              should_stop=None, is16=False, parity=0):
         """
+        Best fuzzy matches of pattern in data[start:end]: up to top_k
+        (default FUZZY_TOP_K) (offset, mismatches) pairs, fewest
+        out-of-tolerance values first, ties by offset.
+        Windows are scored FUZZY_COLUMNS pattern values at a time and dropped
+        as soon as they have more mismatches than the threshold allows or,
+        once top_k are found, than the worst of them; most windows are
+        abandoned after their first few columns.
+        is16: pattern and data are little-endian 16-bit words, the tolerance
+        and the mismatches apply to word values and only offsets with the
+        given byte parity are tried.
+        qindex: QGramIndex built with the same tolerance and width, only its candidates are scored.
+        Returns: (candidates, checked, offsets, bytes compared)
+        """
+        top_k = top_k or self.FUZZY_TOP_K
+        if len(pattern) < 4: return [], 0, 0, 0 # Too small maps aren't searched fuzzy (false positives risk)
+        if qindex is not None and (qindex.tolerance, qindex.is16, qindex.parity) != (tolerance, is16, parity if is16 else 0):
+            raise ValueError("QGramIndex was built for a different tolerance or width")
+        if is16:
+            first = start + ((parity - start) & 1) # First word-aligned offset
+            step, dtype, pat_len = 2, '<u2', len(pattern) // 2
+            count = max(0, (end - first) // 2)
+        else:
+            first, step, dtype, pat_len, count = start, 1, np.uint8, len(pattern), end - start
+        if count < pat_len: return [], 0, 0, 0
+        offsets = count - pat_len + 1
+        bound = int(pat_len * (1.0 - threshold))
+        pat = np.frombuffer(pattern, dtype=dtype, count=pat_len).astype(np.int32 if is16 else np.int16)
+
+        # qindex positions count its own elements (words of the parity lane with is16)
+        lane_first = (first - parity) // 2 if is16 else first
+        starts = None if qindex is None else qindex.candidates(pattern, lane_first, lane_first + offsets - 1, bound)
+        if starts is None:
+            # Every offset of the window, addressed relative to it
+            values = np.frombuffer(data, dtype=dtype, count=count, offset=first).astype(pat.dtype)
+            starts, base = np.arange(offsets), first
+        else:
+            values, base = qindex.values, qindex.parity
+
+        best = [] # (mismatches, offset), best first
+        compared = 0
+        block = max(1, self.FUZZY_BLOCK_ELEMENTS // pat_len)
+        for b in range(0, len(starts), block):
+            if should_stop and should_stop(): break
+            s = starts[b : b + block]
+            counts = np.zeros(len(s), dtype=np.int64)
+            for c in range(0, pat_len, self.FUZZY_COLUMNS):
+                span = np.arange(c, min(c + self.FUZZY_COLUMNS, pat_len))
+                counts += (np.abs(values[s[:, None] + span] - pat[span]) > tolerance).sum(axis=1)
+                compared += len(s) * len(span) * step
+                alive = counts <= bound
+                if not alive.all(): s, counts = s[alive], counts[alive]
+                if not len(s): break
+            if not len(s): continue
+            order = np.lexsort((s, counts))[:top_k]
+            best = sorted(best + list(zip(counts[order].tolist(), (s[order] * step + base).tolist())))[:top_k]
+            if len(best) == top_k:
+                # Later offsets lose ties, so they must be strictly better
+                bound = best[-1][0] - 1
+                if bound < 0: break
+        return [(o, mm) for mm, o in best], len(starts), offsets, compared
+
+    def find_fuzzy_match_reference(self, data, start, end, pattern, tolerance=8, threshold=0.85, is16=False, parity=0):
+        """
+        Pure-Python reference for find_fuzzy_match (element-by-element loop).
+        Kept to check the vectorized kernel and the q-gram path against.
+        is16: compares little-endian words at offsets of the given parity, like find_fuzzy_candidates.
+        """
+        if len(pattern) < 4: return -1 # Too small maps aren't searched fuzzy (false positives risk)
+        if is16:
+            step = 2
+            first = start + ((parity - start) & 1)
+            pattern = [pattern[j] | (pattern[j + 1] << 8) for j in range(0, len(pattern) - 1, 2)]
+            value = lambda i: data[i] | (data[i + 1] << 8)
+        else:
+            step, first = 1, start
+            value = lambda i: data[i]
         pat_len = len(pattern)
-        if pat_len < 4: return -1 # Too small maps aren't searched fuzzy (false positives risk)
-    
-        window_size = end - start
-        if window_size < pat_len: return -1
+        if (end - first) // step < pat_len: return -1
         
         mismatches_allowed = int(pat_len * (1.0 - threshold))
+        best, best_mismatches = -1, mismatches_allowed + 1
         
-        for i in range(start, end - pat_len + 1):
+        for i in range(first, end - pat_len * step + 1, step):
             mismatches = 0
             match = True
-            
-            # Fast check of first and last byte (optimization)
-            if abs(data[i] - pattern[0]) > tolerance and abs(data[i+pat_len-1] - pattern[pat_len-1]) > tolerance:
-                if mismatches_allowed < 1: continue
 
             for j in range(pat_len):
-                if abs(data[i+j] - pattern[j]) > tolerance:
+                if abs(value(i + j * step) - pattern[j]) > tolerance:
                     mismatches += 1
-                    if mismatches > mismatches_allowed:
+                    # Not better than the best so far
+                    if mismatches >= best_mismatches:
                         match = False
                         break
             
             if match:
-                return i
-        return -1
+                best, best_mismatches = i, mismatches
+                if mismatches == 0: break
+        return best
@@ -0,0 +1,78 @@
+import ast
+from functools import lru_cache
+import numpy as np
+
+# What an XDF MATH equation may contain: arithmetic on X and number literals
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load,
+                  ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.UAdd, ast.USub)
+
+@lru_cache(maxsize=None)
+def compile_equation(eq):
+    """
+    Parses an XDF equation once into a code object with the single variable X.
+    Anything but arithmetic on X and numbers is rejected (returns None), the
+    same equations eval() with no builtins could not run either.
+    Cached per equation string, every map using it shares the result.
+    """
+    try:
+        tree = ast.parse(eq.replace(',', '.').strip(), mode='eval')
+    except (SyntaxError, ValueError):
+        return None
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES): return None
+        if isinstance(node, ast.Name) and node.id != 'X': return None
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+            return None
+    return compile(tree, '<xdf equation>', 'eval')
+
+def to_signed(raw, is16):
+    """
+    Classic ME7 signed interpretation of unsigned raw values (array or int):
+    8-bit 128-255 -> -128..-1, 16-bit 32768-65535 -> -32768..-1.
+    """
+    bits = 16 if is16 else 8
+    return raw - ((raw >> (bits - 1)) & 1) * (1 << bits)
+
+def format_value(res, precision):
+    return f"{res:.{precision}f}" if isinstance(res, float) else str(res)
+
+def evaluate(eq, raw_val, is16, signed, precision=2):
+    """
+    One raw value -> display string. Falls back to the (signed) raw value
+    when the equation is invalid or fails (division by zero...).
+    """
+    val = to_signed(raw_val, is16) if signed else raw_val
+    code = compile_equation(eq)
+    if code is None: return str(val)
+    try:
+        return format_value(eval(code, {"__builtins__": {}}, {"X": val}), precision)
+    except Exception:
+        return str(val)
+
+def evaluate_array(eq, raw, is16, signed, precision=2):
+    """
+    Whole array of raw values -> list of display strings, with one
+    vectorized evaluation. Elements are evaluated one by one only if numpy
+    hits a case Python handles differently (zero division, negative powers).
+    """
+    vals = np.asarray(raw, dtype=np.int64)
+    if signed: vals = to_signed(vals, is16)
+    code = compile_equation(eq)
+    if code is None: return [str(v) for v in vals.tolist()]
+    if '**' in eq:
+        # Powers overflow int64 quickly; object arrays keep Python int semantics
+        try:
+            res = np.broadcast_to(np.asarray(eval(code, {"__builtins__": {}}, {"X": vals.astype(object)}), dtype=object), vals.shape)
+            return [format_value(r, precision) for r in res.tolist()]
+        except Exception:
+            return [evaluate(eq, v, is16, False, precision) for v in vals.tolist()]
+    try:
+        with np.errstate(all='raise'):
+            res = eval(code, {"__builtins__": {}}, {"X": vals})
+        res = np.broadcast_to(np.asarray(res), vals.shape)
+    except Exception:
+        return [evaluate(eq, v, is16, False, precision) for v in vals.tolist()]
+    # Same int/float distinction as the scalar path
+    if np.issubdtype(res.dtype, np.floating):
+        return [f"{r:.{precision}f}" for r in res.tolist()]
+    return [str(r) for r in res.tolist()]
@@ -1,14 +1,26 @@
 import sys
 import os
+import time
+import multiprocessing
+import sqlite3
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                             QHBoxLayout, QListWidget, QTableWidget, QPushButton, 
+                             QHBoxLayout, QListWidget, QTableView, QPushButton, 
                              QFileDialog, QLabel, QLineEdit, QSplitter, QTabWidget, 
                              QProgressBar, QListWidgetItem, QCheckBox, QHeaderView, 
-                             QTableWidgetItem)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+                             QSpinBox, QComboBox)
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt6.QtGui import QColor, QBrush, QIcon
 from data_engine import DataEngine
-from ui_components import UIManager
+from models import table_of
+from target_index import TargetIndex
+from alignment import OffsetMap, offset_map_path
+from profiling import EngineProfile, profile_path
+from ui_components import UIManager, MapListModel, MapFilterProxy
+from parallel_scan import iter_parallel, default_workers
+from scan_cache import ScanCache
+from scan_state import ScanState
+from regions import SearchRegions, PROFILES, DEFAULT_PROFILE
+from corpus import FirmwareCorpus
 
 def resource_path(relative_path):
     """ Get absolute path to resources, works for PyInstaller EXE """
@@ -24,91 +36,213 @@ if sys.platform == 'win32':
     myappid = 'veigy.xdftransfertool.v100'
     ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
 
-class ScanWorker(QThread):
+class StreamingWorker(QThread):
+    """
+    Base of the scan workers. Maps are sent to the UI as their results
+    come in (results_ready with their names, at most every EMIT_INTERVAL
+    seconds); stop() is polled in every phase and ends the run with
+    stopped instead of the finished signal.
+    """
     progress_update = pyqtSignal(int)
     log_message = pyqtSignal(str)
-    scanning_finished = pyqtSignal(int, int) # found, unique
+    results_ready = pyqtSignal(list) # names of maps with new results
+    stopped = pyqtSignal()           # stop() took effect, results are partial
+    profile_ready = pyqtSignal(dict) # EngineProfile.to_dict(), scan + fuzzy so far
+
+    EMIT_INTERVAL = 0.1
 
-    def __init__(self, engine, all_maps, bin_src, bin_trg):
+    def __init__(self, engine):
         super().__init__()
         self.engine = engine
+        self._is_running = True
+        self._pending = []
+        self._last_emit = 0.0
+
+    def stop(self):
+        self._is_running = False
+
+    def should_stop(self):
+        return not self._is_running
+
+    def publish(self, maps):
+        self._pending.extend(m.name for m in maps)
+        if time.monotonic() - self._last_emit >= self.EMIT_INTERVAL: self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.results_ready.emit(self._pending)
+            self._pending = []
+        self._last_emit = time.monotonic()
+
+    def finish_stopped(self):
+        self.flush()
+        self.profile_ready.emit(self.engine.profile.to_dict())
+        self.stopped.emit()
+
+class ScanWorker(StreamingWorker):
+    scanning_finished = pyqtSignal(int, int) # found, unique
+    corpus_match = pyqtSignal(str)           # closest known BIN of the target
+
+    # Below this many searches, starting worker processes costs more than it saves.
+    # Counted after alignment and corpus seeding: only the patterns they could not place are searched.
+    PARALLEL_MIN_SCANS = 500
+
+    def __init__(self, engine, all_maps, bin_src, bin_trg, workers=1, state=None, digests=(None, None), corpus=None,
+                 bin_names=("", "")):
+        super().__init__(engine)
         self.all_maps = all_maps
         self.bin_src = bin_src
         self.bin_trg = bin_trg
-        self._is_running = True
+        self.workers = workers
+        self.state = state         # ScanState of the previous scan, enables incremental rescans
+        self.digests = digests     # (source, target) content digests for the state
+        self.corpus = corpus       # FirmwareCorpus: seeds the scan, learns its result
+        self.bin_names = bin_names # (source, target) file names recorded in the corpus
+
+    def corpus_call(self, fn, *args):
+        # A missing or locked corpus must never break a scan
+        try:
+            with self.engine.profile.phase("corpus"):
+                return fn(*args)
+        except (sqlite3.Error, OSError) as e:
+            self.log_message.emit(f"Firmware corpus not available: {e}")
+            return None
 
     def run(self):
         total = len(self.all_maps)
         if total == 0:
             self.scanning_finished.emit(0, 0)
             return
+        profile = self.engine.profile
+        profile.reset()
+
+        # Reuse everything the last scan already decided
+        dirty, resolve = set(self.all_maps), None
+        if self.state is not None:
+            dirty, resolve = self.state.plan(self.all_maps, self.bin_src, *self.digests, self.engine.regions)
+            if resolve is not None:
+                self.log_message.emit(f"Rescanning {len(dirty)} changed maps...")
+                self.publish([m for n, m in self.all_maps.items() if n not in dirty])
+
+        # 0. Index target once, every map lookup below reuses it
+        self.log_message.emit("Indexing target BIN...")
+        with profile.phase("index"):
+            if self.state is not None:
+                index = self.state.target_index(self.bin_trg, self.digests[1], self.should_stop)
+            else:
+                index = TargetIndex(self.bin_trg, should_stop=self.should_stop)
+        if index.stopped: return self.finish_stopped()
+        self.log_message.emit("Aligning source and target...")
+        with profile.phase("align"):
+            if self.state is not None:
+                offset_map = self.state.offset_map(self.bin_src, self.bin_trg, *self.digests, index=index, should_stop=self.should_stop)
+            else:
+                offset_map = OffsetMap.build(self.bin_src, self.bin_trg, index, self.should_stop)
+        if offset_map is None: return self.finish_stopped()
 
         # 1. Scan Z addresses (Data)
-        for i, (name, m) in enumerate(self.all_maps.items()):
-            if not self._is_running: break
-            
-            # Reset
-            m.target_addr = -1
-            m.match_count = 0
-            m.matches = []
-            m.match_type = "NONE"
-            m.x_matches = []
-            m.y_matches = []
-            
-            # Scan Z (Deep scanning with context)
-            matches, is_deep, radius_l, radius_r = self.engine.scan_with_context(self.bin_src, self.bin_trg, m.z_addr, m.z_rows, m.z_cols, m.z_is16)
-            m.matches = matches
-            m.match_count = len(matches)
-            m.is_deep = is_deep
-            m.deep_l = radius_l
-            m.deep_r = radius_r
-            
-            if i % 10 == 0:
-                self.progress_update.emit(int((i / total) * 90)) # 0-90% for scanning
+        scan_progress = lambda done, n: self.progress_update.emit(int((done / n) * 90)) # 0-90% for scanning
+        maps = [m for name, m in self.all_maps.items() if name in dirty]
+        for m in maps: m.reset_scan()
+        # Pattern deduplication: one target search per distinct pattern
+        groups = self.engine.group_patterns(maps, self.bin_src)
+        distinct = self.engine.count_lookups(groups)
+        ratio = len(maps) / distinct if distinct else 1.0
+        # Patterns inside aligned segments are placed with one comparison
+        rest = self.engine.align_groups(groups, self.bin_src, self.bin_trg, offset_map)
+        aligned = len(groups) - len(rest)
+        # Addresses known from similar BINs only need to be verified
+        if self.corpus is not None and rest:
+            self.log_message.emit("Looking up firmware corpus...")
+            found = self.corpus_call(self.corpus.seeds, self.bin_trg, FirmwareCorpus.map_sizes(maps), 3, self.should_stop)
+            if self.should_stop(): return self.finish_stopped()
+            if found:
+                seeds, closest = found
+                self.corpus_match.emit(f"Closest known BIN: {closest[0][1]} ({closest[0][3]:.0%} shared)" if closest
+                                       else "No similar BIN in the firmware corpus")
+                rest = self.engine.seed_groups(rest, self.bin_trg, seeds)
+        for key, members in groups.items():
+            if key not in rest: self.publish(members)
+        seeded = len(groups) - aligned - len(rest)
+        groups = rest
+        message = (f"Scanning {len(maps)} maps as {distinct} distinct patterns ({ratio:.2f} maps per pattern), "
+                   f"{aligned} placed by alignment, {seeded} by corpus seeds")
+        if self.workers > 1 and self.engine.count_lookups(groups) >= self.PARALLEL_MIN_SCANS:
+            self.log_message.emit(f"{message}, {self.workers} workers...")
+            groups = list(groups.items())
+            lookups = {} # lookup_key -> scans of the groups that share its search
+            for i, (key, members) in enumerate(groups):
+                if key is None:
+                    self.engine.apply_scan(members, ([], False, 0, 0))
+                    self.publish(members)
+                    continue
+                m = members[0]
+                lookups.setdefault(self.engine.lookup_key(key, m), []).append((i, m.z_addr, m.z_rows, m.z_cols, m.z_is16))
+            for done, chunks, out in iter_parallel(self.bin_src, self.bin_trg, list(lookups.values()), self.workers,
+                                                   self.should_stop, self.engine.scan_params(), profile):
+                for i, *result in out:
+                    self.engine.apply_scan(groups[i][1], result)
+                    self.publish(groups[i][1])
+                scan_progress(done, chunks)
+        else:
+            self.log_message.emit(f"{message}...")
+            for i, members in enumerate(self.engine.iter_scan_groups(groups, self.bin_src, self.bin_trg, index)):
+                self.publish(members)
+                if i % 10 == 0: scan_progress(i, len(groups))
+                if self.should_stop(): break
+        if self.should_stop(): return self.finish_stopped()
 
         # 2. Resolve Matches (Sequential logic + Axis scanning)
         self.log_message.emit("Analyzing duplicates and axes...")
-        self.engine.resolve_matches(self.all_maps, self.bin_src, self.bin_trg)
+        patterns = self.state.patterns if self.state is not None else None
+        for decided in self.engine.iter_resolve(self.all_maps, self.bin_src, self.bin_trg, index, resolve, patterns):
+            self.publish(decided)
+            if self.should_stop(): return self.finish_stopped()
+        self.flush()
         self.progress_update.emit(100)
+        # Only a complete scan becomes the base of the next incremental one
+        if self.state is not None:
+            self.state.commit(self.all_maps, self.bin_src, *self.digests, self.engine.regions)
+        # The XDF is known-good for the source, the certain results become seeds for similar targets
+        if self.corpus is not None:
+            self.corpus_call(self.corpus.add_source, self.bin_src, self.bin_names[0], self.all_maps)
+            self.corpus_call(self.corpus.add_transfer, self.bin_trg, self.bin_names[1], self.all_maps)
         
         # 3. Count results
-        found = 0
-        unique = 0
-        for m in self.all_maps.values():
-            if m.match_type in ["UNIQUE", "SEQUENTIAL"]:
-                found += 1
-                if m.match_type == "UNIQUE":
-                    unique += 1
-        
-        self.scanning_finished.emit(found, unique)
+        self.profile_ready.emit(profile.to_dict())
+        self.scanning_finished.emit(*self.count_results(self.all_maps))
 
-    def stop(self):
-        self._is_running = False
+    @staticmethod
+    def count_results(all_maps):
+        table = table_of(all_maps)
+        if table is None: return 0, 0
+        counts = table.type_counts(all_maps.values())
+        return counts["UNIQUE"] + counts["SEQUENTIAL"], counts["UNIQUE"]
 
-class FuzzyScanWorker(QThread):
-    progress_update = pyqtSignal(int)
-    log_message = pyqtSignal(str)
-    fuzzy_finished = pyqtSignal(int) # found_count
+class FuzzyScanWorker(StreamingWorker):
+    fuzzy_finished = pyqtSignal(int, int) # found_count, pruned offsets
 
-    def __init__(self, engine, all_maps, bin_src, bin_trg):
-        super().__init__()
-        self.engine = engine
+    def __init__(self, engine, all_maps, bin_src, bin_trg, mode="scan"):
+        super().__init__(engine)
         self.all_maps = all_maps
         self.bin_src = bin_src
         self.bin_trg = bin_trg
-        self._is_running = True
+        self.mode = mode
 
     def run(self):
         # Starting fuzzy scan
         self.log_message.emit("Starting Fuzzy Search (searching with tolerance)...")
-        self.engine.scan_fuzzy_sequential(self.all_maps, self.bin_src, self.bin_trg, self.progress_update.emit)
+        stats = {"offsets": 0, "checked": 0, "pruned": 0, "bytes": 0}
+        for done, total, m in self.engine.iter_fuzzy(self.all_maps, self.bin_src, self.bin_trg, self.mode, stats, self.should_stop):
+            self.progress_update.emit(int((done / total) * 100))
+            if m.match_type == "FUZZY": self.publish([m])
+        if self.should_stop(): return self.finish_stopped()
+        self.flush()
         
         # Count new finds (FUZZY)
-        fuzzy_count = sum(1 for m in self.all_maps.values() if m.match_type == "FUZZY")
-        self.fuzzy_finished.emit(fuzzy_count)
-
-    def stop(self):
-        self._is_running = False
+        fuzzy_count = table_of(self.all_maps).type_counts(self.all_maps.values())["FUZZY"] if self.all_maps else 0
+        self.profile_ready.emit(self.engine.profile.to_dict())
+        self.fuzzy_finished.emit(fuzzy_count, stats["pruned"])
 
 class ME7TransferApp(QMainWindow):
     def __init__(self):
@@ -120,10 +254,16 @@ class ME7TransferApp(QMainWindow):
         # Module initialization
         self.engine = DataEngine()
         self.ui_man = UIManager()
-        self.bin_src = self.bin_trg = self.xdf_tree = None
+        self.bin_src = self.bin_trg = self.xdf_document = None
         self.src_filename = self.trg_filename = ""
+        self.xdf_digest = self.src_digest = self.trg_digest = None
+        self.cache = ScanCache()
+        self.scan_state = ScanState()
+        self.regions = None # SearchRegions of the target BIN
+        self.corpus = None  # FirmwareCorpus, opened on the first scan that uses it
         self.all_maps = {}
-        self.worker = None
+        self.worker = self.fuzzy_worker = None
+        self.scan_complete = False # Results of a finished (not stopped) scan, only those may be cached
 
         # UI Assembly
         main_widget = QWidget()
@@ -147,27 +287,75 @@ class ME7TransferApp(QMainWindow):
         self.btn_fuzzy.setEnabled(False)
         self.btn_fuzzy.setStyleSheet("color: #FFA500; font-weight: bold;")
 
+        self.btn_stop = QPushButton("Stop")
+        self.btn_stop.setEnabled(False)
+        self.btn_stop.setToolTip("Stop the running scan or Fuzzy Search (results so far are kept, not cached)")
+
+        self.spin_workers = QSpinBox()
+        self.spin_workers.setRange(1, 64)
+        self.spin_workers.setValue(default_workers())
+        self.spin_workers.setPrefix("Scan workers: ")
+        self.spin_workers.setToolTip("Processes used for the map scan (1 = single background thread)")
+
+        self.combo_regions = QComboBox()
+        for key, profile in PROFILES.items(): self.combo_regions.addItem(profile["label"], key)
+        self.combo_regions.setCurrentIndex(self.combo_regions.findData(DEFAULT_PROFILE))
+        self.combo_regions.setToolTip("Parts of the target BIN searched for maps (calibration segments)")
+        self.lbl_regions = QLabel("")
+        self.lbl_regions.setStyleSheet("color: #aaa; font-size: 10px; padding: 0 5px;")
+
+        self.btn_clear_cache = QPushButton("Clear scan cache")
+        self.btn_clear_cache.setStyleSheet("font-size: 11px;")
+
+        self.cb_fuzzy_qgram = QCheckBox("Fuzzy: q-gram prefilter (faster)")
+        self.cb_fuzzy_qgram.setChecked(True)
+        self.cb_fuzzy_qgram.setStyleSheet("color: #444; font-size: 11px;")
+
         self.cb_deep_export = QCheckBox("Include (deep) results in export")
         self.cb_deep_export.setChecked(True)
         self.cb_deep_export.setStyleSheet("color: #444; font-size: 11px;")
+
+        self.cb_offsets_export = QCheckBox("Export offset map (.offsets.json)")
+        self.cb_offsets_export.setStyleSheet("color: #444; font-size: 11px;")
+
+        self.cb_corpus = QCheckBox("Firmware corpus: seed scan, learn results")
+        self.cb_corpus.setChecked(True)
+        self.cb_corpus.setToolTip("Known addresses from similar BINs are verified first; finished scans are added to the corpus")
+        self.cb_corpus.setStyleSheet("color: #444; font-size: 11px;")
+        self.lbl_corpus = QLabel("")
+        self.lbl_corpus.setWordWrap(True)
+        self.lbl_corpus.setMaximumWidth(280)
+        self.lbl_corpus.setStyleSheet("color: #aaa; font-size: 10px; padding: 0 5px;")
+
+        self.cb_profile_export = QCheckBox("Export scan profile (.profile.json)")
+        self.cb_profile_export.setChecked(True)
+        self.cb_profile_export.setStyleSheet("color: #444; font-size: 11px;")
         
         self.search = QLineEdit()
         self.search.setPlaceholderText("Search...")
-        self.search.textChanged.connect(self.update_list)
+        # Filter once typing pauses, not on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.apply_filter)
+        self.search.textChanged.connect(self.search_timer.start)
         
         self.tabs = QTabWidget()
-        self.table_map = QTableWidget(0, 2)
-        self.table_scat = QTableWidget(0, 2)
+        self.table_map = QTableView()
+        self.table_scat = QTableView()
         
-        for t in [self.table_map, self.table_scat]:
-            t.setHorizontalHeaderLabels(["Address", "Map Name"])
+        for t, scalars in [(self.table_map, False), (self.table_scat, True)]:
+            proxy = MapFilterProxy(t)
+            proxy.setSourceModel(MapListModel(scalars, t))
+            t.setModel(proxy)
             t.setColumnWidth(0, 85)
             t.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
-            t.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-            t.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
-            t.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+            t.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+            t.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+            t.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
             t.verticalHeader().setVisible(False)
-            t.itemSelectionChanged.connect(self.select_map)
+            t.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+            t.selectionModel().selectionChanged.connect(self.select_map)
 
         self.tabs.addTab(self.table_map, "Maps")
         self.tabs.addTab(self.table_scat, "Scalars")
@@ -176,6 +364,12 @@ class ME7TransferApp(QMainWindow):
         self.lbl_info.setWordWrap(True)
         self.lbl_info.setMaximumWidth(280) # Zabrání roztahování panelu
         self.lbl_info.setStyleSheet("color: #fff; font-weight: bold; font-size: 11px; padding: 5px; background: rgba(255,255,255,5%); border-radius: 3px;")
+
+        # Phase times and counters of the last scan / fuzzy search
+        self.lbl_profile = QLabel("")
+        self.lbl_profile.setWordWrap(True)
+        self.lbl_profile.setMaximumWidth(280)
+        self.lbl_profile.setStyleSheet("color: #aaa; font-size: 10px; padding: 0 5px;")
         
         # Color Legend
         self.lbl_legend = QLabel(
@@ -200,14 +394,25 @@ class ME7TransferApp(QMainWindow):
         left_panel.addWidget(self.btn_load_xdf)
         left_panel.addWidget(self.btn_load_src)
         left_panel.addWidget(self.btn_load_trg)
+        left_panel.addWidget(self.spin_workers)
+        left_panel.addWidget(self.combo_regions)
+        left_panel.addWidget(self.lbl_regions)
+        left_panel.addWidget(self.btn_clear_cache)
         left_panel.addWidget(QLabel("Progress:"))
         left_panel.addWidget(self.progress)
         left_panel.addWidget(self.btn_export)
         left_panel.addWidget(self.btn_fuzzy)
+        left_panel.addWidget(self.btn_stop)
+        left_panel.addWidget(self.cb_fuzzy_qgram)
+        left_panel.addWidget(self.cb_corpus)
+        left_panel.addWidget(self.lbl_corpus)
         left_panel.addWidget(self.cb_deep_export)
+        left_panel.addWidget(self.cb_offsets_export)
+        left_panel.addWidget(self.cb_profile_export)
         left_panel.addWidget(self.search)
         left_panel.addWidget(self.tabs)
         left_panel.addWidget(self.lbl_info)
+        left_panel.addWidget(self.lbl_profile)
         left_panel.addSpacing(10)
         left_panel.addWidget(self.lbl_legend)
 
@@ -215,12 +420,11 @@ class ME7TransferApp(QMainWindow):
         right_panel = QVBoxLayout()
         self.splitter = QSplitter(Qt.Orientation.Vertical)
         self.splitter.setHandleWidth(2) # Narrower gap between tables
-        self.table_src = QTableWidget(); self.table_trg = QTableWidget()
+        self.table_src = self.ui_man.create_map_view(); self.table_trg = self.ui_man.create_map_view()
         self.splitter_spacer = QWidget() # Pružina pro horizontální režim
         
-        # Scroll synchronization
-        self.table_src.verticalScrollBar().valueChanged.connect(self.table_trg.verticalScrollBar().setValue)
-        self.table_trg.verticalScrollBar().valueChanged.connect(self.table_src.verticalScrollBar().setValue)
+        # Scroll and selection synchronization
+        self.ui_man.link_views(self.table_src, self.table_trg)
         
         self.splitter.addWidget(self.table_src)
         self.splitter.addWidget(self.table_trg)
@@ -240,141 +444,200 @@ class ME7TransferApp(QMainWindow):
         self.btn_load_trg.clicked.connect(lambda: self.load_bin_action('trg'))
         self.btn_export.clicked.connect(self.export_xdf_action)
         self.btn_fuzzy.clicked.connect(self.start_fuzzy_scan)
+        self.btn_stop.clicked.connect(self.stop_action)
+        self.btn_clear_cache.clicked.connect(self.clear_cache_action)
+        self.combo_regions.currentIndexChanged.connect(self.regions_changed_action)
         # Table configurations (itemSelectionChanged)
         pass
 
     def load_xdf_action(self):
         path, _ = QFileDialog.getOpenFileName(self, "XDF", "", "XDF (*.xdf)")
         if path:
-            self.xdf_tree, self.all_maps = self.engine.parse_xdf(path)
+            self.xdf_document, self.all_maps = self.engine.parse_xdf(path)
+            self.xdf_digest = ScanCache.digest_file(path)
             self.btn_fuzzy.setEnabled(False)
-            self.update_list()
+            self.load_list()
+            # Reloaded/edited XDF: rescan, the scan state keeps unchanged maps
+            if self.bin_src and self.bin_trg:
+                self.start_scan()
 
     def load_bin_action(self, mode):
         path, _ = QFileDialog.getOpenFileName(self, "BIN", "", "BIN (*.bin)")
         if not path: return
         import os
         filename = os.path.basename(path)
-        data = open(path, "rb").read()
+        data = self.engine.load_bin(path)
         if mode == 'src': 
             self.bin_src = data
             self.src_filename = str(filename)
+            self.src_digest = ScanCache.digest(data)
         else: 
             self.bin_trg = data
             self.trg_filename = str(filename)
+            self.trg_digest = ScanCache.digest(data)
+            self.update_regions()
         
         if self.bin_src and self.bin_trg and self.all_maps:
             self.start_scan()
 
+    def update_regions(self):
+        # Regions are detected per target BIN, the engine searches only inside them
+        if self.bin_trg is None: return
+        self.regions = SearchRegions.for_profile(self.combo_regions.currentData(), self.bin_trg)
+        self.engine.regions = self.regions.spans
+        self.lbl_regions.setText(f"Search: {self.regions.summary()}")
+
+    def regions_changed_action(self):
+        self.update_regions()
+        if self.bin_src and self.bin_trg and self.all_maps:
+            self.start_scan()
+
+    def cache_key(self, stage):
+        # Corpus seeds only place maps the way the alignment does, they are not part of the key
+        return self.cache.key(self.xdf_digest, self.src_digest, self.trg_digest, self.engine.scan_params(), stage)
+
+    def open_corpus(self):
+        if not self.cb_corpus.isChecked(): return None
+        if self.corpus is None:
+            try:
+                self.corpus = FirmwareCorpus()
+            except (sqlite3.Error, OSError) as e:
+                self.lbl_corpus.setText(f"Firmware corpus not available: {e}")
+        return self.corpus
+
+    def clear_cache_action(self):
+        self.cache.invalidate()
+        self.lbl_info.setText("Scan cache cleared.")
+
     def start_scan(self):
+        if self.cache.load(self.cache_key("scan"), self.all_maps):
+            self.scan_state.commit(self.all_maps, self.bin_src, self.src_digest, self.trg_digest, self.engine.regions)
+            found, unique = ScanWorker.count_results(self.all_maps)
+            self.engine.profile.reset() # Nothing was scanned
+            self.lbl_profile.setText("")
+            self.progress.setValue(100)
+            self.on_scan_finished(found, unique, cached=True)
+            return
+
         self.lbl_info.setText("Starting scan...")
         self.progress.setValue(0)
         self.set_buttons_enabled(False)
+        self.btn_fuzzy.setEnabled(False)
+        self.scan_complete = False
         
-        self.worker = ScanWorker(self.engine, self.all_maps, self.bin_src, self.bin_trg)
+        self.worker = ScanWorker(self.engine, self.all_maps, self.bin_src, self.bin_trg, self.spin_workers.value(),
+                                 self.scan_state, (self.src_digest, self.trg_digest), self.open_corpus(),
+                                 (self.src_filename, self.trg_filename))
         self.worker.progress_update.connect(self.progress.setValue)
         self.worker.log_message.connect(self.lbl_info.setText)
         self.worker.scanning_finished.connect(self.on_scan_finished)
+        self.worker.results_ready.connect(self.on_results)
+        self.worker.stopped.connect(self.on_scan_stopped)
+        self.worker.profile_ready.connect(self.show_profile)
+        self.worker.corpus_match.connect(self.lbl_corpus.setText)
+        self.btn_stop.setEnabled(True)
         self.worker.start()
 
-    def on_scan_finished(self, found, unique):
+    def on_scan_finished(self, found, unique, cached=False):
+        if not cached: self.cache.store(self.cache_key("scan"), self.all_maps)
+        self.scan_complete = True
         self.set_buttons_enabled(True)
+        self.btn_stop.setEnabled(False)
         self.update_list()
-        self.lbl_info.setText(f"Finished. Found: {found} (Unique: {unique})")
+        note = " (cached)" if cached else ""
+        self.lbl_info.setText(f"Finished{note}. Found: {found} (Unique: {unique})")
         
         # Pokud jsou nenalezené mapy, povolíme Fuzzy Search
         total = len(self.all_maps)
         if found < total:
             self.btn_fuzzy.setEnabled(True)
-            self.lbl_info.setText(f"Finished. Found: {found}/{total}. You can try Fuzzy Search.")
+            self.lbl_info.setText(f"Finished{note}. Found: {found}/{total}. You can try Fuzzy Search.")
 
     def start_fuzzy_scan(self):
+        if self.cache.load(self.cache_key("fuzzy"), self.all_maps):
+            fuzzy_count = table_of(self.all_maps).type_counts(self.all_maps.values())["FUZZY"] if self.all_maps else 0
+            self.progress.setValue(100)
+            self.on_fuzzy_finished(fuzzy_count, 0, cached=True)
+            return
+
         self.lbl_info.setText("Starting Fuzzy Search...")
         self.progress.setValue(0)
         self.set_buttons_enabled(False)
         self.btn_fuzzy.setEnabled(False)
         
-        self.fuzzy_worker = FuzzyScanWorker(self.engine, self.all_maps, self.bin_src, self.bin_trg)
+        mode = "qgram" if self.cb_fuzzy_qgram.isChecked() else "scan"
+        self.fuzzy_worker = FuzzyScanWorker(self.engine, self.all_maps, self.bin_src, self.bin_trg, mode)
         self.fuzzy_worker.progress_update.connect(self.progress.setValue)
         self.fuzzy_worker.log_message.connect(self.lbl_info.setText)
         self.fuzzy_worker.fuzzy_finished.connect(self.on_fuzzy_finished)
+        self.fuzzy_worker.results_ready.connect(self.on_results)
+        self.fuzzy_worker.stopped.connect(self.on_fuzzy_stopped)
+        self.fuzzy_worker.profile_ready.connect(self.show_profile)
+        self.btn_stop.setEnabled(True)
         self.fuzzy_worker.start()
 
-    def on_fuzzy_finished(self, fuzzy_count):
+    def on_fuzzy_finished(self, fuzzy_count, pruned, cached=False):
+        # Fuzzy results on top of a stopped scan are partial as well
+        if not cached and self.scan_complete: self.cache.store(self.cache_key("fuzzy"), self.all_maps)
         self.set_buttons_enabled(True)
+        self.btn_stop.setEnabled(False)
         self.update_list()
-        self.lbl_info.setText(f"Fuzzy Search finished. Newly found: {fuzzy_count}")
+        info = f"Fuzzy Search finished{' (cached)' if cached else ''}. Newly found: {fuzzy_count}"
+        if pruned: info += f" (q-gram filter skipped {pruned:,} offsets)"
+        self.lbl_info.setText(info)
         self.btn_fuzzy.setEnabled(False) # Already tried
 
+    def stop_action(self):
+        self.btn_stop.setEnabled(False)
+        for w in (self.worker, self.fuzzy_worker):
+            if w is not None and w.isRunning():
+                w.stop()
+                self.lbl_info.setText("Stopping...")
+
+    def on_results(self, names):
+        # Rows appear / change while the worker is still running; only the published maps are read
+        for model in self.list_models(): model.refresh(names)
+
+    def on_scan_stopped(self):
+        # Partial results stay visible but are neither cached nor used for the next incremental scan
+        self.set_buttons_enabled(True)
+        self.btn_fuzzy.setEnabled(False) # Fuzzy Search needs the anchors of a complete scan
+        self.update_list()
+        self.lbl_info.setText("Scan stopped. Results are incomplete and were not cached.")
+
+    def on_fuzzy_stopped(self):
+        self.set_buttons_enabled(True)
+        self.update_list()
+        self.btn_fuzzy.setEnabled(True) # Can be run again
+        self.lbl_info.setText("Fuzzy Search stopped. Maps found so far are kept.")
+
+    def show_profile(self, profile):
+        self.lbl_profile.setText(EngineProfile.summary(profile))
+
     def set_buttons_enabled(self, enabled):
         self.btn_load_xdf.setEnabled(enabled)
         self.btn_load_src.setEnabled(enabled)
         self.btn_load_trg.setEnabled(enabled)
         self.btn_export.setEnabled(enabled)
+        self.combo_regions.setEnabled(enabled)
+        self.cb_corpus.setEnabled(enabled)
+
+    def list_models(self):
+        return [t.model().sourceModel() for t in (self.table_map, self.table_scat)]
+
+    def load_list(self):
+        # New XDF: rebuild the lists and their name index
+        for model in self.list_models(): model.set_maps(self.all_maps)
 
     def update_list(self):
-        q = self.search.text().lower()
-        self.table_map.setRowCount(0)
-        self.table_scat.setRowCount(0)
-        
-        def get_sort_key(m):
-            if m.match_type == "UNIQUE": return 0
-            if m.match_type == "SEQUENTIAL": return 1
-            if m.match_type == "FUZZY": return 2
-            if m.match_type == "AMBIGUOUS": return 3
-            return 3 # NONE/ERROR
-
-        sorted_maps = sorted(self.all_maps.values(), key=get_sort_key)
-        
-        for m in sorted_maps:
-            if q in m.name.lower():
-                if m.match_type in ["NONE", "ERROR"] and m.match_count == 0:
-                     continue
-                
-                target = self.table_scat if m.is_scalar else self.table_map
-                
-                # Unified status marker
-                if m.match_type == "UNIQUE":
-                    marker = "●"
-                    color = Qt.GlobalColor.darkGreen
-                elif m.match_type == "SEQUENTIAL":
-                    marker = "● SEQ"
-                    color = QColor("#FF8C00")
-                elif m.match_type == "FUZZY":
-                    marker = "● FUZZY"
-                    color = QColor("#DAA520")
-                elif m.match_type == "AMBIGUOUS":
-                    marker = f"● [{m.match_count}x]"
-                    color = Qt.GlobalColor.red
-                else:
-                    marker = "● NONE"
-                    color = Qt.GlobalColor.gray
-                
-                row = target.rowCount()
-                target.insertRow(row)
-                
-                # Adresa (0. sloupec)
-                addr_text = f"0x{m.target_addr:X}" if m.target_addr > 0 else "???"
-                it_addr = QTableWidgetItem(addr_text)
-                it_addr.setForeground(QBrush(color))
-                it_addr.setData(Qt.ItemDataRole.UserRole, m.name) # Store name for select_map
-                target.setItem(row, 0, it_addr)
-                
-                # Name + Marker + Extra info (1st column)
-                name_text = f"{marker} {m.name}"
-                extra = []
-                if m.is_deep: extra.append("deep")
-                if m.x_is_deep: extra.append("x-deep")
-                if m.y_is_deep: extra.append("y-deep")
-                if extra:
-                    name_text += " (" + ", ".join(extra) + ")"
-                
-                it_name = QTableWidgetItem(name_text)
-                it_name.setForeground(QBrush(color))
-                target.setItem(row, 1, it_name)
+        # Statuses changed (scan, fuzzy, cache): only changed rows are redrawn
+        for model in self.list_models(): model.refresh()
+
+    def apply_filter(self):
+        for t in (self.table_map, self.table_scat): t.model().set_query(self.search.text())
 
     def export_xdf_action(self):
-        if not self.xdf_tree:
+        if not self.xdf_document:
             self.lbl_info.setText("Error: XDF not loaded.")
             return
             
@@ -387,15 +650,26 @@ class ME7TransferApp(QMainWindow):
             
         path, _ = QFileDialog.getSaveFileName(self, "Save XDF", default_name, "XDF (*.xdf)")
         if path:
-            self.engine.write_xdf(self.xdf_tree, self.all_maps, path, include_deep=self.cb_deep_export.isChecked())
+            try:
+                self.engine.write_xdf(self.xdf_document, self.all_maps, path, include_deep=self.cb_deep_export.isChecked())
+            except ValueError as e: # XDF edited on disk since loading
+                self.lbl_info.setText(f"Error: {e}")
+                return
             self.lbl_info.setText(f"Saved to {path}")
+            if self.cb_offsets_export.isChecked() and self.bin_src is not None and self.bin_trg is not None:
+                offset_map = self.scan_state.offset_map(self.bin_src, self.bin_trg, self.src_digest, self.trg_digest)
+                offset_map.to_json(offset_map_path(path))
+            if self.cb_profile_export.isChecked() and self.engine.profile:
+                self.engine.profile.to_json(profile_path(path), xdf=os.path.basename(self.xdf_document.path),
+                                            source=self.src_filename, target=self.trg_filename, maps=len(self.all_maps),
+                                            excluded_bytes=self.regions.excluded if self.regions else 0)
 
     def select_map(self):
         target = self.table_map if self.tabs.currentIndex() == 0 else self.table_scat
-        items = target.selectedItems()
-        if not items: return
+        rows = target.selectionModel().selectedRows()
+        if not rows: return
         
-        name = items[0].data(Qt.ItemDataRole.UserRole)
+        name = rows[0].data(Qt.ItemDataRole.UserRole)
         m = self.all_maps.get(name)
         if m and self.bin_src:
             # 1. Basic info
@@ -415,13 +689,18 @@ class ME7TransferApp(QMainWindow):
             addr_str = f"0x{m.target_addr:X}" if m.target_addr > 0 else "???"
             if m.match_type == "AMBIGUOUS":
                 addr_str = f"DUPLICATES ({m.match_count}x)"
+            if m.match_type == "FUZZY":
+                addr_str += f", fuzzy {m.match_percent}%"
+                # Runners-up for review
+                others = [f"0x{a:X} ({p}%)" for a, p in zip(m.matches[1:], m.match_scores[1:])]
+                if others: deep_info += f"<br/><font color='#DAA520'><b>Other candidates:</b> {', '.join(others)}</font>"
                 
             self.lbl_info.setText(f"Map: {m.name}{map_markers} ({addr_str}){deep_info}")
 
             # 2. Helper function for reading axes
             def get_axis_vals(bin_data, addr, count, is16, is_signed, eq):
                 if addr > 0:
-                    return [m.calculate(self.engine.read_raw(bin_data, addr + i*(2 if is16 else 1), is16, is_signed), eq, is16, is_signed) for i in range(count)]
+                    return m.calculate_array(self.engine.read_array(bin_data, addr, count, is16), eq, is16, is_signed)
                 return None
 
             # 3. Orientation and dimensions (MLHFM and 1D maps)
@@ -443,8 +722,7 @@ class ME7TransferApp(QMainWindow):
                 
                 # Show address list on the right
                 self.ui_man.setup_table(self.table_trg, len(m.matches), 1, ["Possible addresses (Ambig.)"], None)
-                for i, addr in enumerate(m.matches):
-                    self.table_trg.setItem(i, 0, QTableWidgetItem(f"0x{addr:X}"))
+                self.ui_man.fill_list(self.table_trg, [f"0x{addr:X}" for addr in m.matches])
                 
                 self.splitter.setOrientation(Qt.Orientation.Horizontal)
                 self.splitter_spacer.show()
@@ -510,17 +788,12 @@ class ME7TransferApp(QMainWindow):
                 self.ui_man.fill_table(self.table_trg, m, self.bin_trg, m.target_addr, self.engine, is_source=False)
 
             # 7. Coloring headers in target table
-                if trg_x:
-                    for col in range(real_cols):
-                        item = self.table_trg.horizontalHeaderItem(col)
-                        if item: item.setForeground(QBrush(x_color))
-                if trg_y:
-                    for row in range(real_rows):
-                        item = self.table_trg.verticalHeaderItem(row)
-                        if item: item.setForeground(QBrush(y_color))
+                self.ui_man.set_header_colors(self.table_trg, x_color if trg_x else None, y_color if trg_y else None)
 
             self.ui_man.auto_set_height(self.table_src, max_h)
             self.ui_man.auto_set_height(self.table_trg, max_h)
 
 if __name__ == "__main__":
+    # Scan worker processes re-enter the frozen EXE, let them run their task instead of the GUI
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv); ex = ME7TransferApp(); ex.show(); sys.exit(app.exec())
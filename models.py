@@ -1,51 +1,168 @@
+import numpy as np
+from equations import evaluate, evaluate_array
+
+# match_type / x_match_type / y_match_type values, stored as their index
+MATCH_TYPES = ("NONE", "UNIQUE", "SEQUENTIAL", "AMBIGUOUS", "FUZZY", "ERROR", "OFFSET", "GUESS", "DEEP")
+MATCH_CODES = {t: i for i, t in enumerate(MATCH_TYPES)}
+
+class MapTable:
+    """
+    Struct-of-arrays storage of all maps of one XDF, one row per map.
+    Addresses, sizes, flags, deep radii and match types are NumPy columns,
+    so engine passes can select and update many maps at once
+    (e.g. all NONE maps ordered by z_addr); names, equations and match
+    lists stay Python lists. XDFMap is a two-slot view on one row.
+    """
+    INT_FIELDS = ("node_index", "z_addr", "z_rows", "z_cols", "x_addr", "x_count", "y_addr", "y_count",
+                  "match_percent", "target_addr", "target_x_addr", "target_y_addr", "match_count",
+                  "deep_l", "deep_r", "x_deep_l", "x_deep_r", "y_deep_l", "y_deep_r")
+    BOOL_FIELDS = ("is_scalar", "z_is16", "z_signed", "x_is16", "x_signed", "y_is16", "y_signed",
+                   "is_deep", "x_is_deep", "y_is_deep")
+    TYPE_FIELDS = ("match_type", "x_match_type", "y_match_type")
+    TEXT_FIELDS = ("name", "z_eq", "x_eq", "y_eq")
+    LIST_FIELDS = ("matches", "x_matches", "y_matches", "match_scores")
+    # Everything else starts at 0 / False / "NONE" / []
+    DEFAULTS = {"z_rows": 1, "z_cols": 1, "target_addr": -1, "target_x_addr": -1, "target_y_addr": -1,
+                "name": "", "z_eq": "X", "x_eq": "X", "y_eq": "X"}
+
+    def __init__(self, records=()):
+        """
+        records: one dict per map with any of the fields above.
+        """
+        records = list(records)
+        n = self.size = len(records)
+        self.cols = {}
+        for f in self.INT_FIELDS:
+            self.cols[f] = np.fromiter((r.get(f, self.DEFAULTS.get(f, 0)) for r in records), np.int64, n)
+        for f in self.BOOL_FIELDS:
+            self.cols[f] = np.fromiter((r.get(f, False) for r in records), np.bool_, n)
+        for f in self.TYPE_FIELDS:
+            self.cols[f] = np.fromiter((MATCH_CODES[r.get(f, "NONE")] for r in records), np.int8, n)
+        for f in self.TEXT_FIELDS:
+            self.cols[f] = [r.get(f, self.DEFAULTS[f]) for r in records]
+        for f in self.LIST_FIELDS:
+            self.cols[f] = [list(r.get(f, ())) for r in records]
+        self.views = [XDFMap(self, row) for row in range(n)]
+
+    def by_name(self):
+        return {m.name: m for m in self.views}
+
+    def __getitem__(self, field):
+        return self.cols[field]
+
+    def z_sizes(self, rows=slice(None)):
+        # Bytes of the Z data per row
+        c = self.cols
+        return c["z_rows"][rows] * c["z_cols"][rows] * np.where(c["z_is16"][rows], 2, 1)
+
+    def rows_where(self, maps, *types):
+        """
+        Rows of the given XDFMaps whose match_type is one of types, in the maps' order.
+        """
+        rows = rows_of(maps)
+        return rows[np.isin(self.cols["match_type"][rows], [MATCH_CODES[t] for t in types])]
+
+    def type_counts(self, maps, field="match_type"):
+        """
+        {match type: how many of the given XDFMaps have it}
+        """
+        counts = np.bincount(self.cols[field][rows_of(maps)], minlength=len(MATCH_TYPES))
+        return dict(zip(MATCH_TYPES, counts.tolist()))
+
+    def reset_scan(self, rows):
+        c = self.cols
+        c["target_addr"][rows] = -1
+        c["match_count"][rows] = 0
+        c["match_type"][rows] = MATCH_CODES["NONE"]
+        for f in self.LIST_FIELDS:
+            for r in rows.tolist(): c[f][r] = []
+
+def rows_of(maps):
+    """
+    Row numbers of XDFMap views (all from one MapTable) as an array.
+    """
+    return np.fromiter((m.row for m in maps), np.intp)
+
+def table_of(all_maps):
+    # The MapTable behind a {name: XDFMap} dict, None if it is empty
+    for m in all_maps.values(): return m.table
+    return None
+
 class XDFMap:
-    def __init__(self, name, node, is_scalar=False):
-        self.name = name
-        self.node = node
-        self.is_scalar = is_scalar
-        self.z_addr, self.z_is16, self.z_signed, self.z_eq = 0, False, False, "X"
-        self.z_rows, self.z_cols = 1, 1
-        self.x_addr, self.x_is16, self.x_signed, self.x_eq, self.x_count = 0, False, False, "X", 0
-        self.y_addr, self.y_is16, self.y_signed, self.y_eq, self.y_count = 0, False, False, "X", 0
-        self.match_percent = 0
+    """
+    One map of an XDF: a view on its MapTable row. Reading or assigning a
+    field goes straight to the column, so per-map code and whole-column
+    passes see the same data.
+    """
+    __slots__ = ("table", "row")
+
+    # Everything a scan/resolve/fuzzy pass writes (see ScanCache)
+    RESULT_FIELDS = (
+        "match_percent", "target_addr", "target_x_addr", "target_y_addr", "match_count", "matches", "match_scores",
+        "x_matches", "y_matches", "match_type", "x_match_type", "y_match_type",
+        "is_deep", "deep_l", "deep_r",
+        "x_is_deep", "x_deep_l", "x_deep_r", "y_is_deep", "y_deep_l", "y_deep_r",
+    )
+    # match_type: "NONE", "UNIQUE", "SEQUENTIAL", "AMBIGUOUS", "FUZZY"
+    # x/y_match_type: "NONE", "UNIQUE", "OFFSET" (near the map offset), "GUESS"
+    # FUZZY: matches = best candidates first, match_scores = their % of bytes within tolerance
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def result_state(self):
+        return {f: getattr(self, f) for f in self.RESULT_FIELDS}
+
+    def restore_result(self, state):
+        for f in self.RESULT_FIELDS:
+            setattr(self, f, state[f])
+
+    def reset_scan(self):
         self.target_addr = -1
-        self.target_x_addr = -1
-        self.target_y_addr = -1
-        self.match_count = 0  # Number of matches found
-        self.matches = []     # List of addresses for all matches
-        
-        # New for Phase 2
+        self.match_count = 0
+        self.matches = []
+        self.match_scores = []
+        self.match_type = "NONE"
         self.x_matches = []
         self.y_matches = []
-        # match_type: "NONE", "UNIQUE", "SEQUENTIAL", "AMBIGUOUS", "FUZZY"
+
+    def reset_resolve(self):
+        """
+        Clears what resolve_matches decides, keeps the Z scan (matches, deep radii).
+        """
+        self.target_addr = -1
         self.match_type = "NONE"
-        # x/y_match_type: "NONE", "UNIQUE", "OFFSET", "GUESS"
-        self.x_match_type = "NONE"
-        self.y_match_type = "NONE"
-        self.is_deep = False
-        self.deep_l, self.deep_r = 0, 0
-        
-        # New for Axis context
-        self.x_is_deep = False
-        self.x_deep_l, self.x_deep_r = 0, 0
-        self.y_is_deep = False
-        self.y_deep_l, self.y_deep_r = 0, 0
+        self.match_percent = 0
+        self.match_scores = []
+        self.target_x_addr = self.target_y_addr = -1
+        self.x_match_type = self.y_match_type = "NONE"
+        self.x_matches, self.y_matches = [], []
+        self.x_is_deep = self.y_is_deep = False
+        self.x_deep_l = self.x_deep_r = self.y_deep_l = self.y_deep_r = 0
 
     def calculate(self, raw_val, eq, is16, signed, precision=2):
-        val = raw_val
-        if signed:
-            # Classic ME7 signed byte interpretation:
-            # Values 128-255 are interpreted as -128 to -1
-            if not is16: # 8-bit
-                if val > 127:
-                    val -= 256
-            else: # 16-bit
-                if val > 32767:
-                    val -= 65536
-        
-        try:
-            # Replace X in equation with the calculated value
-            res = eval(eq.replace('X', str(val)).replace(',', '.'), {"__builtins__": None}, {})
-            return f"{res:.{precision}f}" if isinstance(res, float) else str(res)
-        except:
-            return str(val)
+        # Signed handling and the compiled equation live in equations.py
+        return evaluate(eq, raw_val, is16, signed, precision)
+
+    def calculate_array(self, raw_vals, eq, is16, signed, precision=2):
+        """
+        calculate() for a whole array of raw values in one call.
+        """
+        return evaluate_array(eq, raw_vals, is16, signed, precision)
+
+def _column(field):
+    # NumPy columns hand out plain Python values (JSON, formatting)
+    if field in MapTable.TYPE_FIELDS:
+        def get(self): return MATCH_TYPES[self.table.cols[field].item(self.row)]
+        def set(self, value): self.table.cols[field][self.row] = MATCH_CODES[value]
+    elif field in MapTable.INT_FIELDS or field in MapTable.BOOL_FIELDS:
+        def get(self): return self.table.cols[field].item(self.row)
+        def set(self, value): self.table.cols[field][self.row] = value
+    else:
+        def get(self): return self.table.cols[field][self.row]
+        def set(self, value): self.table.cols[field][self.row] = value
+    return property(get, set)
+
+for _f in (MapTable.INT_FIELDS + MapTable.BOOL_FIELDS + MapTable.TYPE_FIELDS + MapTable.TEXT_FIELDS + MapTable.LIST_FIELDS):
+    setattr(XDFMap, _f, _column(_f))
@@ -0,0 +1,111 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+from data_engine import DataEngine
+from target_index import TargetIndex
+
+# Jobs per task; small enough for smooth progress, large enough to hide IPC
+CHUNK_SIZE = 64
+# Seconds between should_stop() checks while waiting for chunks
+STOP_POLL = 0.05
+
+# Per-process state filled by _init_worker
+_worker = {}
+
+def default_workers():
+    return max(1, os.cpu_count() or 1)
+
+def _share(data):
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    shm.buf[:len(data)] = data
+    return shm
+
+def _init_worker(src_name, src_size, trg_name, trg_size, params):
+    """
+    Pool initializer: attach both BINs once per worker process and build
+    the target index there, so tasks only carry map coordinates.
+    """
+    # Spawned workers share the parent's resource tracker, the parent unlinks the blocks
+    src_shm = shared_memory.SharedMemory(name=src_name)
+    trg_shm = shared_memory.SharedMemory(name=trg_name)
+    _worker['shm'] = (src_shm, trg_shm)
+    # Zero-copy views straight into the shared blocks
+    _worker['src'] = src_shm.buf[:src_size]
+    _worker['trg'] = trg_shm.buf[:trg_size]
+    _worker['index'] = TargetIndex(_worker['trg'])
+    _worker['engine'] = DataEngine(**params)
+    atexit.register(_close_worker)
+
+def _close_worker():
+    # Views and the index pin the buffers; drop them first or close() raises BufferError
+    shms = _worker.pop('shm', ())
+    _worker.clear()
+    for shm in shms: shm.close()
+
+def _scan_chunk(jobs):
+    engine, src, trg, index = _worker['engine'], _worker['src'], _worker['trg'], _worker['index']
+    profile = engine.profile
+    out = []
+    for job in jobs:
+        # One target search per job, the context is compared per address
+        _, addr, rows, cols, is16 = job[0]
+        with profile.phase("scan"):
+            matches = engine.scan_for_matches(src, trg, addr, rows, cols, is16, index=index)
+        profile.count("find_calls")
+        profile.count("candidates", len(matches))
+        for name, addr, rows, cols, is16 in job:
+            out.append((name, *engine.scan_with_context(src, trg, addr, rows, cols, is16, index=index, matches=matches)))
+    # The worker's counters travel back with the chunk
+    return out, engine.profile.take()
+
+def iter_parallel(src_data, trg_data, jobs, workers, should_stop=None, params=None, profile=None):
+    """
+    Runs scan_with_context in a process pool. A job is a list of scans
+    [(id, addr, rows, cols, is16)] that look up the same pattern
+    (DataEngine.lookup_key): the target is searched once per job and the
+    matches are shared by all its scans.
+    Both BINs are passed through shared memory, not pickled per task.
+    Yields (chunks done, chunks, [(id, matches, is_deep, radius_l, radius_r)]) as chunks complete.
+    params: DataEngine.scan_params() of the calling engine.
+    profile: EngineProfile the workers' timers and counters are merged into
+    (times are summed over the workers, so they are CPU time, not wall time).
+    should_stop() is polled every STOP_POLL seconds while waiting; once it
+    is true pending chunks are cancelled and the pool winds down in the
+    background, without waiting for the chunks still running.
+    """
+    if not jobs: return
+    src_shm, trg_shm = _share(src_data), _share(trg_data)
+    # spawn: forking a process that runs Qt threads is not safe
+    ctx = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                               initargs=(src_shm.name, len(src_data), trg_shm.name, len(trg_data), params or {}))
+    stopped = True
+    try:
+        chunks = [jobs[i : i + CHUNK_SIZE] for i in range(0, len(jobs), CHUNK_SIZE)]
+        pending = {pool.submit(_scan_chunk, c) for c in chunks}
+        done = 0
+        while pending:
+            finished, pending = wait(pending, timeout=STOP_POLL, return_when=FIRST_COMPLETED)
+            if should_stop and should_stop(): return
+            for fut in finished:
+                out, raw = fut.result()
+                if profile is not None: profile.merge(raw)
+                done += 1
+                yield done, len(chunks), out
+        stopped = False
+    finally:
+        # Also reached when the consumer stops iterating
+        if stopped:
+            threading.Thread(target=_release, args=(pool, src_shm, trg_shm)).start()
+        else:
+            _release(pool, src_shm, trg_shm)
+
+def _release(pool, *shms):
+    # Workers may still be attaching, the blocks go only after the pool is down
+    pool.shutdown(wait=True, cancel_futures=True)
+    for shm in shms:
+        shm.close()
+        shm.unlink()
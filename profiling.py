@@ -0,0 +1,105 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+def profile_path(xdf_path):
+    # Written next to the exported XDF
+    return os.path.splitext(xdf_path)[0] + ".profile.json"
+
+class EngineProfile:
+    """
+    Timers and counters of one transfer, filled by DataEngine as it works.
+    Phases (seconds): index, align (OffsetMap), corpus (firmware corpus
+    lookup), place (groups placed by the alignment or corpus seeds), scan
+    (exact pattern lookups), context (context widening), group
+    (unique/sequential grouping), axes, fuzzy, export. scan and context
+    include the lookups made for axes, so they overlap with axes.
+    Counters: find_calls, candidates, context_scans, context_steps,
+    context_bytes, aligned, seeded, axis_near_hits, axis_scans, fuzzy_maps,
+    fuzzy_offsets, fuzzy_checked, fuzzy_bytes.
+    """
+    def __init__(self):
+        self.seconds = {}
+        self.counters = {}
+
+    def reset(self):
+        self.seconds.clear()
+        self.counters.clear()
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def timed(self, name, items):
+        """
+        Yields from items, adding only the time spent producing them to
+        phase name (not the time the consumer spends between items).
+        """
+        items = iter(items)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(name, time.perf_counter() - started)
+            yield item
+
+    def take(self):
+        """
+        Raw (seconds, counters) gathered so far, and starts over (worker processes).
+        """
+        raw = (dict(self.seconds), dict(self.counters))
+        self.reset()
+        return raw
+
+    def merge(self, raw):
+        seconds, counters = raw
+        for k, v in seconds.items(): self.add_time(k, v)
+        for k, v in counters.items(): self.count(k, v)
+
+    def __bool__(self):
+        return bool(self.seconds or self.counters)
+
+    def to_dict(self):
+        c = self.counters
+        derived = {}
+        if c.get("find_calls"): derived["candidates_per_find"] = round(c.get("candidates", 0) / c["find_calls"], 2)
+        if c.get("context_scans"): derived["steps_per_context_scan"] = round(c.get("context_steps", 0) / c["context_scans"], 2)
+        if c.get("fuzzy_offsets"): derived["fuzzy_checked_share"] = round(c.get("fuzzy_checked", 0) / c["fuzzy_offsets"], 4)
+        return {"seconds": {k: round(v, 4) for k, v in self.seconds.items()}, "counters": dict(c), "derived": derived}
+
+    @staticmethod
+    def summary(profile):
+        """
+        Short text of a to_dict() result for the status panel.
+        """
+        seconds, c = profile["seconds"], profile["counters"]
+        lines = [" ".join(f"{k} {v:.2f}s" for k, v in seconds.items())]
+        if c.get("aligned") or c.get("seeded"):
+            lines.append(f"placed {c.get('aligned', 0):,} by alignment, {c.get('seeded', 0):,} from corpus")
+        if c.get("find_calls"):
+            lines.append(f"finds {c['find_calls']:,}, {profile['derived']['candidates_per_find']} cand./find")
+        if c.get("context_scans"):
+            lines.append(f"context {c['context_scans']:,} scans, {c.get('context_steps', 0):,} steps, {c.get('context_bytes', 0):,} B")
+        if c.get("axis_scans") or c.get("axis_near_hits"):
+            lines.append(f"axes {c.get('axis_near_hits', 0):,} near, {c.get('axis_scans', 0):,} global")
+        if c.get("fuzzy_offsets"):
+            lines.append(f"fuzzy {c['fuzzy_checked']:,}/{c['fuzzy_offsets']:,} offsets, {c.get('fuzzy_bytes', 0):,} B")
+        return "\n".join(lines)
+
+    def to_json(self, path, **extra):
+        with open(path, "w") as f:
+            json.dump(dict(self.to_dict(), **extra), f, indent=2)
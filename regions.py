@@ -0,0 +1,133 @@
+import numpy as np
+
+# Segment 0 holds the bootloader and RAM mirror, never calibration data
+SEGMENT0 = 0x10000
+
+# Search region profiles per ECU family.
+# segments: calibration ranges (start, end) of the image, None = everything after segment 0
+# fill: drop long runs of erased/zeroed flash; max_entropy: drop blocks above this many bits per byte (code)
+PROFILES = {
+    "all": {"label": "Whole image", "segments": None, "fill": False, "max_entropy": None},
+    "auto": {"label": "Auto (skip fill runs)", "segments": None, "fill": True, "max_entropy": None},
+    "auto-entropy": {"label": "Auto (skip fill runs and code)", "segments": None, "fill": True, "max_entropy": 7.2},
+    "me7": {"label": "ME7 calibration 0x10000-0x1FFFF", "segments": [(0x10000, 0x20000)], "fill": True, "max_entropy": None},
+}
+# Whole image: the same search area as without regions, results only change when a profile is picked
+DEFAULT_PROFILE = "all"
+
+class SearchRegions:
+    """
+    Byte ranges of a target BIN that may hold calibration data, as sorted
+    disjoint (start, end) spans. Map searches (exact, axes, fuzzy) only
+    report offsets where the whole map fits in one span.
+    Built from a profile of PROFILES or a span list like "0x10000-0x20000,0x30000-0x38000".
+    """
+    # Fill runs shorter than this stay searchable (all-0xFF or all-zero tables)
+    MIN_FILL = 0x1000
+    # Bytes kept searchable at both ends of a fill run, maps may end or start with fill bytes
+    FILL_MARGIN = 0x100
+    FILL_BYTES = (0x00, 0xFF)
+    # Entropy is measured per block of this many bytes
+    ENTROPY_BLOCK = 0x1000
+
+    def __init__(self, spans, size, name=None):
+        self.size = size
+        self.name = name
+        self.spans = self.merge((max(0, a), min(b, size)) for a, b in spans)
+
+    @staticmethod
+    def merge(spans):
+        out = []
+        for a, b in sorted(spans):
+            if a >= b: continue
+            if out and a <= out[-1][1]: out[-1] = (out[-1][0], max(out[-1][1], b))
+            else: out.append((a, b))
+        return out
+
+    @staticmethod
+    def subtract(spans, cuts):
+        """
+        spans minus cuts, both sorted disjoint (start, end) lists.
+        """
+        out = []
+        cuts = SearchRegions.merge(cuts)
+        i = 0
+        for a, b in spans:
+            while i < len(cuts) and cuts[i][1] <= a: i += 1
+            j = i
+            while j < len(cuts) and cuts[j][0] < b:
+                if cuts[j][0] > a: out.append((a, cuts[j][0]))
+                a = max(a, cuts[j][1])
+                j += 1
+            if a < b: out.append((a, b))
+        return out
+
+    @classmethod
+    def for_profile(cls, name, data):
+        """
+        Regions of data for a PROFILES key or a span list.
+        """
+        if name not in PROFILES: return cls.parse(name, len(data))
+        profile = PROFILES[name]
+        spans = [(SEGMENT0, len(data))] if profile["segments"] is None else profile["segments"]
+        spans = [(max(a, SEGMENT0), b) for a, b in spans]
+        cuts = []
+        if profile["fill"]: cuts += cls.fill_runs(data)
+        if profile["max_entropy"] is not None: cuts += cls.high_entropy(data, profile["max_entropy"])
+        return cls(cls.subtract(cls.merge(spans), cuts), len(data), name)
+
+    @classmethod
+    def parse(cls, spec, size):
+        """
+        "start-end,start-end" (hex or decimal, end exclusive).
+        """
+        spans = []
+        for part in spec.split(","):
+            try:
+                a, b = part.split("-")
+                spans.append((int(a, 0), int(b, 0)))
+            except ValueError:
+                raise ValueError(f"Unknown region profile or span: {part.strip()!r}")
+        return cls(spans, size, spec)
+
+    @classmethod
+    def fill_runs(cls, data):
+        """
+        (start, end) of runs of one fill byte at least MIN_FILL long,
+        shrunk by FILL_MARGIN at both ends.
+        """
+        buf = np.frombuffer(data, dtype=np.uint8)
+        runs = []
+        for fill in cls.FILL_BYTES:
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], (buf == fill).view(np.int8), [0]))))
+            for a, b in zip(edges[0::2].tolist(), edges[1::2].tolist()):
+                if b - a >= cls.MIN_FILL: runs.append((a + cls.FILL_MARGIN, b - cls.FILL_MARGIN))
+        return runs
+
+    @classmethod
+    def high_entropy(cls, data, max_entropy):
+        """
+        (start, end) of the ENTROPY_BLOCK blocks with a byte entropy above max_entropy bits.
+        """
+        buf = np.frombuffer(data, dtype=np.uint8)
+        blocks = len(buf) // cls.ENTROPY_BLOCK
+        if blocks == 0: return []
+        counts = np.bincount(np.repeat(np.arange(blocks) * 256, cls.ENTROPY_BLOCK) + buf[:blocks * cls.ENTROPY_BLOCK],
+                             minlength=blocks * 256).reshape(blocks, 256)
+        p = counts / cls.ENTROPY_BLOCK
+        with np.errstate(divide='ignore', invalid='ignore'):
+            entropy = -np.where(p > 0, p * np.log2(p), 0).sum(axis=1)
+        return [(int(b) * cls.ENTROPY_BLOCK, (int(b) + 1) * cls.ENTROPY_BLOCK) for b in np.flatnonzero(entropy > max_entropy)]
+
+    @property
+    def searched(self):
+        return sum(b - a for a, b in self.spans)
+
+    @property
+    def excluded(self):
+        return self.size - self.searched
+
+    def summary(self):
+        share = 100 * self.excluded / self.size if self.size else 0
+        regions = f"{len(self.spans)} region{'' if len(self.spans) == 1 else 's'}"
+        return f"{regions}, {self.excluded:,} of {self.size:,} bytes excluded ({share:.0f}%)"
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+
+def default_cache_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "XDF-Transfer-Tool", "scan_cache")
+
+class ScanCache:
+    """
+    On-disk cache of scan results, keyed by content hashes of the XDF,
+    source BIN and target BIN plus the scan parameters.
+    One JSON file per key. Reading an entry refreshes its mtime, and the
+    least recently used files are evicted once the directory grows past max_bytes.
+    """
+    # Bump when engine changes make older results invalid
+    VERSION = 4
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def digest_file(path):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def key(self, xdf_digest, src_digest, trg_digest, params, stage="scan"):
+        """
+        stage: "scan" (scan + resolve) or "fuzzy" (after Fuzzy Search)
+        """
+        payload = json.dumps({"version": self.VERSION, "xdf": xdf_digest, "src": src_digest,
+                              "trg": trg_digest, "params": params, "stage": stage}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def load(self, key, all_maps):
+        """
+        Restores cached results into all_maps. False if there is no entry
+        or it does not cover exactly these maps.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False
+        maps = entry.get("maps", {})
+        if set(maps) != set(all_maps): return False
+        for name, m in all_maps.items():
+            m.restore_result(maps[name])
+        try: os.utime(path) # Mark as recently used
+        except OSError: pass
+        return True
+
+    def store(self, key, all_maps):
+        entry = {"version": self.VERSION, "maps": {name: m.result_state() for name, m in all_maps.items()}}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(entry, f, separators=(",", ":"))
+            os.replace(tmp, self._path(key))
+        except OSError:
+            return # A read-only or full cache dir must never break a scan
+        self.evict()
+
+    def invalidate(self, key=None):
+        """
+        Removes one entry, or every entry when key is None.
+        """
+        if key is not None:
+            paths = [self._path(key)]
+        else:
+            paths = [p for p, _, _ in self._entries()]
+        for p in paths:
+            try: os.remove(p)
+            except OSError: pass
+
+    def evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        # Oldest access first
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        out = []
+        for n in names:
+            if not n.endswith(".json"): continue
+            p = os.path.join(self.directory, n)
+            try:
+                st = os.stat(p)
+                out.append((p, st.st_size, st.st_mtime))
+            except OSError:
+                pass
+        return out
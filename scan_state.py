@@ -0,0 +1,97 @@
+from target_index import TargetIndex
+from alignment import OffsetMap
+
+class ScanState:
+    """
+    Snapshot of the last completed scan (before Fuzzy Search), so the next
+    scan can redo only what changed:
+    - same BINs, edited XDF: only maps whose Z/axis address, size or width
+      changed are rescanned, and only their pattern groups are resolved again
+    - new target BIN or other search regions: every map is rescanned, but
+      source patterns are reused
+    - new source BIN: full rescan
+    """
+    def __init__(self):
+        self.src_digest = None
+        self.trg_digest = None
+        self.regions = None  # DataEngine.regions the results were scanned with
+        self.signatures = {} # name -> signature(m)
+        self.group_keys = {} # name -> source pattern bytes (resolve_matches group key)
+        self.results = {}    # name -> XDFMap.result_state()
+        self.patterns = {}   # (addr, size) -> source pattern bytes, valid for src_digest
+        self._index = None   # (target digest, TargetIndex)
+        self._offsets = None # ((source digest, target digest), OffsetMap)
+
+    @staticmethod
+    def signature(m):
+        return (m.z_addr, m.z_rows, m.z_cols, m.z_is16,
+                m.x_addr, m.x_count, m.x_is16, m.y_addr, m.y_count, m.y_is16)
+
+    def plan(self, all_maps, src_data, src_digest, trg_digest, regions=None):
+        """
+        Restores every map that can be reused and returns (dirty, resolve):
+        dirty - names to rescan; resolve - names resolve_matches must
+        revisit, or None for all of them.
+        """
+        if src_digest != self.src_digest:
+            self.patterns.clear()
+        if src_digest != self.src_digest or trg_digest != self.trg_digest or regions != self.regions:
+            return set(all_maps), None
+
+        dirty = {n for n, m in all_maps.items()
+                 if n not in self.results or self.signatures.get(n) != self.signature(m)}
+        # Groups that lost or gained a member have to be resolved again
+        src_view = memoryview(src_data)
+        touched = {self.group_keys.get(n) for n in dirty}
+        touched |= {self.source_pattern(src_view, all_maps[n]) for n in dirty}
+        touched |= {self.group_keys.get(n) for n in self.results if n not in all_maps}
+        touched.discard(None)
+        resolve = set(dirty)
+        for n, m in all_maps.items():
+            if n in dirty: continue
+            m.restore_result(self.results[n])
+            if self.source_pattern(src_view, m) in touched:
+                m.reset_resolve()
+                resolve.add(n)
+        return dirty, resolve
+
+    def target_index(self, trg_data, trg_digest, should_stop=None):
+        """
+        TargetIndex of the target, rebuilt only when the target changes.
+        An index should_stop() cut short is returned but not kept.
+        """
+        if self._index is None or self._index[0] != trg_digest or trg_digest is None:
+            index = TargetIndex(trg_data, should_stop=should_stop)
+            if index.stopped: return index
+            self._index = (trg_digest, index)
+        return self._index[1]
+
+    def offset_map(self, src_data, trg_data, src_digest, trg_digest, index=None, should_stop=None):
+        """
+        OffsetMap of the BIN pair, rebuilt only when either BIN changes.
+        None if should_stop() cut the build short (nothing is kept then).
+        """
+        key = (src_digest, trg_digest)
+        if self._offsets is None or self._offsets[0] != key or None in key:
+            offset_map = OffsetMap.build(src_data, trg_data, index, should_stop)
+            if offset_map is None: return None
+            self._offsets = (key, offset_map)
+        return self._offsets[1]
+
+    def source_pattern(self, src_view, m):
+        size = m.z_rows * m.z_cols * (2 if m.z_is16 else 1)
+        key = (m.z_addr, size)
+        if key not in self.patterns:
+            if m.z_addr < 0 or m.z_addr + size > len(src_view): return None
+            self.patterns[key] = bytes(src_view[m.z_addr : m.z_addr + size])
+        return self.patterns[key]
+
+    def commit(self, all_maps, src_data, src_digest, trg_digest, regions=None):
+        """
+        Records the state after scan + resolve_matches completed.
+        """
+        src_view = memoryview(src_data)
+        self.src_digest, self.trg_digest, self.regions = src_digest, trg_digest, regions
+        self.signatures = {n: self.signature(m) for n, m in all_maps.items()}
+        self.group_keys = {n: self.source_pattern(src_view, m) for n, m in all_maps.items()}
+        self.results = {n: m.result_state() for n, m in all_maps.items()}
@@ -0,0 +1,264 @@
+import re
+from itertools import product
+import numpy as np
+
+def find_all_linear(data, pattern, start=0, max_matches=100, parity=None, end=None):
+    """
+    Repeated find() over any buffer. bytes and mmap have a native find();
+    plain memoryviews (shared memory) go through re, which searches a
+    buffer in place instead of copying it.
+    parity 0/1 keeps only even/odd offsets (word-aligned 16-bit maps),
+    end: matches must lie before it.
+    """
+    matches = []
+    if end is None: end = len(data)
+    find = getattr(data, 'find', None)
+    if find is None:
+        rx = re.compile(re.escape(bytes(pattern)))
+        while len(matches) < max_matches:
+            hit = rx.search(data, start, end)
+            if hit is None: break
+            start = hit.start() + 1
+            if parity is not None and hit.start() & 1 != parity: continue
+            matches.append(hit.start())
+        return matches
+    while len(matches) < max_matches:
+        idx = find(pattern, start, end)
+        if idx == -1: break
+        start = idx + 1
+        if parity is not None and idx & 1 != parity: continue
+        matches.append(idx)
+    return matches
+
+class TargetIndex:
+    """
+    k-gram index over a target BIN, built once per image.
+    Every k-byte window is keyed as a big-endian integer and the window
+    positions are sorted by key, so all occurrences of a gram are one
+    contiguous slice found with a binary search.
+    """
+    # Above this many hits for the rarest gram the pattern is so common that
+    # a plain find() reaches max_matches sooner than verifying candidates.
+    MAX_CANDIDATES = 4096
+    # With should_stop the grams are sorted in this many key ranges, polled in between
+    SORT_PARTS = 16
+
+    def __init__(self, data, k=4, should_stop=None):
+        """
+        should_stop() is polled while the grams are sorted. Once it is true
+        the index is left empty and stopped is set; an empty index still
+        finds everything, through plain find().
+        """
+        self.data = data
+        self.view = memoryview(data)
+        self.k = k
+        self.stopped = False
+        self.keys = np.zeros(0, dtype=np.uint32)
+        self.positions = np.zeros(0, dtype=np.int32)
+        buf = np.frombuffer(data, dtype=np.uint8) if data else np.zeros(0, dtype=np.uint8)
+        if len(buf) - k + 1 <= 0: return
+        grams = self._sorted_grams(self._gram_keys(buf, k), 8 * k, should_stop)
+        if grams is None: self.stopped = True
+        else: self.keys, self.positions = grams
+
+    @staticmethod
+    def _gram_keys(buf, k, bits=8):
+        # Each element takes bits bits of the key, first element highest
+        n = len(buf) - k + 1
+        keys = np.zeros(n, dtype=np.uint32 if bits * k <= 32 else np.uint64)
+        for i in range(k):
+            keys = (keys << bits) | buf[i : i + n]
+        return keys
+
+    @classmethod
+    def _sorted_grams(cls, keys, key_bits, should_stop=None):
+        """
+        (keys sorted, their positions), positions ascending inside each gram.
+        When key and position fit one 64-bit word together a plain sort of
+        the packed words gives that order, several times faster than a
+        stable argsort.
+        should_stop: sort SORT_PARTS key ranges one after another and poll
+        it in between; None once it is true.
+        """
+        n = len(keys)
+        bits = n.bit_length()
+        def sort(idx):
+            # idx: ascending positions of one key range, None = all
+            sub = keys if idx is None else keys[idx]
+            if key_bits + bits > 64:
+                order = np.argsort(sub, kind='stable')
+                return sub[order], (order if idx is None else idx[order]).astype(np.int32)
+            shift = np.uint64(bits)
+            packed = (sub.astype(np.uint64) << shift) | (np.arange(n, dtype=np.uint64) if idx is None else idx.astype(np.uint64))
+            packed.sort()
+            positions = (packed & np.uint64((1 << bits) - 1)).astype(np.int32)
+            return (packed >> shift).astype(keys.dtype), positions
+        if should_stop is None: return sort(None)
+
+        # Positions grouped by key range, ascending inside each (stable radix sort of one byte)
+        if should_stop(): return None
+        top = (keys >> keys.dtype.type(max(0, key_bits - cls.SORT_PARTS.bit_length() + 1))).astype(np.uint8)
+        grouped = np.argsort(top, kind='stable')
+        if should_stop(): return None
+        counts = np.bincount(top, minlength=cls.SORT_PARTS)
+        ends = np.cumsum(counts)
+        parts = []
+        for part in range(cls.SORT_PARTS):
+            if should_stop(): return None
+            parts.append(sort(grouped[ends[part] - counts[part] : ends[part]]))
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    def find_all(self, pattern, start=0, max_matches=100, parity=None, end=None):
+        """
+        Returns up to max_matches ascending offsets >= start where pattern occurs.
+        Same result as repeated data.find(pattern, idx + 1, end); parity 0/1
+        keeps only even/odd offsets.
+        """
+        pat_len = len(pattern)
+        if end is None: end = len(self.data)
+        if pat_len == 0 or len(self.keys) == 0:
+            return self._find_linear(pattern, start, max_matches, parity, end)
+        if pat_len < self.k:
+            return self._find_short(pattern, start, max_matches, parity, end)
+
+        pkeys = self._gram_keys(np.frombuffer(pattern, dtype=np.uint8), self.k)
+        lo = np.searchsorted(self.keys, pkeys, 'left')
+        hi = np.searchsorted(self.keys, pkeys, 'right')
+        counts = hi - lo
+        # Anchor the lookup on the rarest gram of the pattern
+        j = int(np.argmin(counts))
+        if counts[j] == 0: return []
+        if counts[j] > self.MAX_CANDIDATES:
+            return self._find_linear(pattern, start, max_matches, parity, end)
+
+        cands = self.positions[lo[j] : hi[j]].astype(np.int64) - j
+        cands = cands[(cands >= start) & (cands + pat_len <= min(end, len(self.data)))]
+        if parity is not None: cands = cands[(cands & 1) == parity]
+        return self._verify(cands, pattern, max_matches)
+
+    def _find_short(self, pattern, start, max_matches, parity, end):
+        """
+        Patterns shorter than k: every gram starting with the pattern bytes
+        lies in one key range. The last k-1 offsets have no gram and are
+        checked directly.
+        """
+        shift = 8 * (self.k - len(pattern))
+        key_lo = int.from_bytes(pattern, 'big') << shift
+        key_hi = key_lo + (1 << shift)
+        # Keys must keep the array dtype, a Python int makes numpy convert the whole array
+        key_t = self.keys.dtype.type
+        lo = int(np.searchsorted(self.keys, key_t(key_lo), 'left'))
+        hi = int(np.searchsorted(self.keys, key_t(key_hi), 'left')) if key_hi < (1 << 8 * self.k) else len(self.keys)
+        if hi - lo > self.MAX_CANDIDATES:
+            return self._find_linear(pattern, start, max_matches, parity, end)
+        cands = np.sort(self.positions[lo:hi]).astype(np.int64)
+        cands = cands[(cands >= start) & (cands + len(pattern) <= end)]
+        if parity is not None: cands = cands[(cands & 1) == parity]
+        tail = len(self.keys)
+        matches = cands[:max_matches].tolist()
+        if len(matches) < max_matches:
+            matches += self._find_linear(pattern, max(start, tail), max_matches - len(matches), parity, end)
+        return matches
+
+    def _verify(self, cands, pattern, max_matches):
+        pat_len = len(pattern)
+        matches = []
+        for c in cands.tolist():
+            if self.view[c : c + pat_len] == pattern:
+                matches.append(c)
+                if len(matches) >= max_matches: break
+        return matches
+
+    def _find_linear(self, pattern, start, max_matches, parity=None, end=None):
+        return find_all_linear(self.data, pattern, start, max_matches, parity, end)
+
+class QGramIndex:
+    """
+    Inverted q-gram index over a target BIN for fuzzy search.
+    Bytes are quantized into buckets of width 2*tolerance+1 first, so a
+    byte within +/-tolerance of a pattern byte always lands in one of at
+    most two known buckets. That keeps the pigeonhole filter lossless:
+    a window with at most e out-of-tolerance bytes has one of e+1
+    disjoint pattern pieces fully in tolerance, hence an exact
+    quantized q-gram hit.
+    With is16 the index covers the little-endian 16-bit words starting at
+    byte parity (0/1) instead of the bytes: positions, values and the
+    tolerance are then in words.
+    should_stop() is polled while a gram index is sorted; a sort it cuts
+    short is not kept and candidates() returns None (no filter) instead.
+    """
+    MAX_Q = 8
+    MIN_Q = 3 # Shorter grams prune too little to beat the plain kernel
+
+    def __init__(self, data, tolerance, is16=False, parity=0, should_stop=None):
+        self.tolerance = tolerance
+        self.should_stop = should_stop
+        self.width = 2 * tolerance + 1
+        self.is16, self.parity = is16, parity
+        if is16:
+            self.top = 0xFFFF
+            words = max(0, (len(data) - parity) // 2)
+            buf = np.frombuffer(data, dtype='<u2', count=words, offset=parity) if words else np.zeros(0, dtype=np.uint16)
+            self.values = buf.astype(np.int32)
+        else:
+            self.top = 0xFF
+            buf = np.frombuffer(data, dtype=np.uint8) if data else np.zeros(0, dtype=np.uint8)
+            self.values = buf.astype(np.int16)
+        self.buckets = buf // self.width
+        self.bits = (self.top // self.width).bit_length()
+        self.max_q = min(self.MAX_Q, 64 // self.bits)
+        self._grams = {} # q -> (sorted keys, positions)
+
+    def pattern_values(self, pattern):
+        if self.is16: return np.frombuffer(pattern, dtype='<u2', count=len(pattern) // 2).astype(np.int32)
+        return np.frombuffer(pattern, dtype=np.uint8).astype(np.int16)
+
+    def _index(self, q):
+        if q not in self._grams:
+            if len(self.buckets) < q:
+                self._grams[q] = (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int32))
+            else:
+                keys = TargetIndex._gram_keys(self.buckets, q, self.bits)
+                grams = TargetIndex._sorted_grams(keys, self.bits * q, self.should_stop)
+                if grams is None: return None
+                self._grams[q] = grams
+        return self._grams[q]
+
+    def candidates(self, pattern, first, last, mismatches_allowed):
+        """
+        Sorted candidate offsets in [first, last] that can still pass the
+        fuzzy check, or None when the pattern is too short to split into
+        useful grams (caller then checks every offset). Offsets and
+        mismatches count elements (words with is16).
+        """
+        pattern = self.pattern_values(pattern).tolist()
+        pieces = mismatches_allowed + 1
+        q = min(len(pattern) // pieces, self.max_q)
+        if q < self.MIN_Q: return None
+        grams = self._index(q)
+        if grams is None: return None
+        keys, positions = grams
+        key_t = keys.dtype.type
+
+        found = []
+        for p in range(pieces):
+            off = p * q
+            choices = []
+            for b in pattern[off : off + q]:
+                lo_b = max(0, b - self.tolerance) // self.width
+                hi_b = min(self.top, b + self.tolerance) // self.width
+                choices.append((lo_b,) if lo_b == hi_b else (lo_b, hi_b))
+            for combo in product(*choices):
+                key = 0
+                for c in combo: key = (key << self.bits) | c
+                key = key_t(key)
+                lo = np.searchsorted(keys, key, 'left')
+                hi = np.searchsorted(keys, key, 'right')
+                if lo == hi: continue
+                # Positions are ascending inside one key, cut them to the window
+                pos = positions[lo:hi]
+                a = np.searchsorted(pos, first + off, 'left')
+                z = np.searchsorted(pos, last + off, 'right')
+                if a < z: found.append(pos[a:z].astype(np.int64) - off)
+        if not found: return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
@@ -0,0 +1,82 @@
+"""
+Fuzzy Search: the NumPy kernel and the q-gram path against the
+pure-Python reference on random targets with planted near-copies.
+
+    python -m pytest -q
+"""
+import numpy as np
+import pytest
+from data_engine import DataEngine
+from target_index import QGramIndex
+
+TOLERANCE = 6
+THRESHOLD = 0.8
+
+def make_case(seed, is16):
+    """
+    (target, pattern, start, end): a random target with a few noisy copies
+    of the pattern (some at odd offsets) and a random search window.
+    """
+    rng = np.random.default_rng(seed)
+    target = bytearray(rng.integers(0, 256, 3000, dtype=np.uint8).tobytes())
+    elements = int(rng.integers(2, 40))
+    if is16:
+        words = rng.integers(0, 0x10000, elements)
+        pattern = words.astype('<u2').tobytes()
+    else:
+        pattern = rng.integers(0, 256, elements, dtype=np.uint8).tobytes()
+    for _ in range(int(rng.integers(0, 4))):
+        at = int(rng.integers(0, len(target) - len(pattern)))
+        if is16:
+            copy = words + rng.integers(-TOLERANCE - 2, TOLERANCE + 3, elements)
+            copy = np.clip(copy, 0, 0xFFFF).astype('<u2').tobytes()
+        else:
+            copy = np.frombuffer(pattern, dtype=np.uint8).astype(np.int64)
+            copy += rng.integers(-TOLERANCE - 2, TOLERANCE + 3, elements)
+            copy = np.clip(copy, 0, 0xFF).astype(np.uint8).tobytes()
+        target[at : at + len(copy)] = copy
+    start = int(rng.integers(0, 500))
+    end = int(rng.integers(len(target) - 500, len(target) + 1))
+    return bytes(target), pattern, start, end
+
+@pytest.mark.parametrize("seed", range(60))
+def test_kernel_matches_reference(seed):
+    engine = DataEngine()
+    data, pattern, start, end = make_case(seed, False)
+    expected = engine.find_fuzzy_match_reference(data, start, end, pattern, TOLERANCE, THRESHOLD)
+    assert engine.find_fuzzy_match(data, start, end, pattern, TOLERANCE, THRESHOLD) == expected
+
+@pytest.mark.parametrize("seed", range(60))
+def test_qgram_matches_reference(seed):
+    engine = DataEngine()
+    data, pattern, start, end = make_case(seed, False)
+    expected = engine.find_fuzzy_match_reference(data, start, end, pattern, TOLERANCE, THRESHOLD)
+    qindex = QGramIndex(data, TOLERANCE)
+    found, checked, offsets = engine.find_fuzzy_match_qgram(data, start, end, pattern, qindex, TOLERANCE, THRESHOLD)
+    assert found == expected
+    assert checked <= offsets
+
+@pytest.mark.parametrize("seed", range(60))
+@pytest.mark.parametrize("parity", [0, 1])
+def test_words_match_reference(seed, parity):
+    engine = DataEngine()
+    data, pattern, start, end = make_case(seed, True)
+    expected = engine.find_fuzzy_match_reference(data, start, end, pattern, TOLERANCE, THRESHOLD, is16=True, parity=parity)
+    for qindex in (None, QGramIndex(data, TOLERANCE, True, parity)):
+        found = engine.find_fuzzy_candidates(data, start, end, pattern, TOLERANCE, THRESHOLD, qindex, is16=True, parity=parity)[0]
+        assert (found[0][0] if found else -1) == expected
+        assert all(o % 2 == parity for o, _ in found)
+
+@pytest.mark.parametrize("seed", range(20))
+def test_candidates_are_the_best_windows(seed):
+    # Top-K against every window scored in full, fewest mismatches first, ties by offset
+    engine = DataEngine()
+    data, pattern, start, end = make_case(seed, False)
+    values = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+    pat = np.frombuffer(pattern, dtype=np.uint8).astype(np.int64)
+    allowed = int(len(pat) * (1.0 - THRESHOLD))
+    scored = [(int((np.abs(values[o : o + len(pat)] - pat) > TOLERANCE).sum()), o) for o in range(start, end - len(pat) + 1)]
+    expected = [(o, mm) for mm, o in sorted(s for s in scored if s[0] <= allowed)][:engine.FUZZY_TOP_K]
+    if len(pattern) < 4: expected = []
+    for qindex in (None, QGramIndex(data, TOLERANCE)):
+        assert engine.find_fuzzy_candidates(data, start, end, pattern, TOLERANCE, THRESHOLD, qindex)[0] == expected
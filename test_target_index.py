@@ -0,0 +1,59 @@
+"""
+TargetIndex.find_all against the plain find() loop (find_all_linear).
+
+    python -m pytest -q
+"""
+import numpy as np
+import pytest
+from target_index import TargetIndex, find_all_linear
+
+def make_target(seed):
+    # Few distinct byte values, so short and repeated patterns have many hits
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 4, 5000, dtype=np.uint8).tobytes()
+
+@pytest.mark.parametrize("seed", range(40))
+def test_find_all_matches_linear(seed):
+    rng = np.random.default_rng(1000 + seed)
+    data = make_target(seed)
+    index = TargetIndex(data)
+    for length in (1, 2, 3, 4, 5, 8, 16):
+        at = int(rng.integers(0, len(data) - length))
+        pattern = data[at : at + length]
+        start = int(rng.integers(0, 1000))
+        end = int(rng.integers(len(data) - 1000, len(data) + 1))
+        for parity in (None, 0, 1):
+            for max_matches in (1, 2, 100, 10000):
+                expected = find_all_linear(data, pattern, start, max_matches, parity, end)
+                assert index.find_all(pattern, start, max_matches, parity, end) == expected
+
+def test_pattern_not_in_target():
+    data = make_target(1)
+    assert TargetIndex(data).find_all(b"\xff\xfe\xfd\xfc\xfb") == []
+    assert TargetIndex(data).find_all(b"\xff") == []
+
+def test_common_pattern_falls_back_to_find():
+    # The rarest gram has more than MAX_CANDIDATES hits: find() path, same result
+    data = bytes(20000)
+    index = TargetIndex(data)
+    for pattern in (bytes(2), bytes(8)):
+        for parity in (None, 1):
+            expected = find_all_linear(data, pattern, 3, 100, parity, 19000)
+            assert index.find_all(pattern, 3, 100, parity, 19000) == expected
+            assert len(expected) == 100
+
+def test_tail_offsets_of_short_patterns():
+    # The last k-1 offsets have no gram of their own
+    data = b"\x01\x02\x03\x04\x05\x01\x02\x03"
+    index = TargetIndex(data)
+    assert index.find_all(b"\x02\x03") == find_all_linear(data, b"\x02\x03") == [1, 6]
+    assert index.find_all(b"\x03", end=8) == [2, 7]
+
+def test_memoryview_target():
+    # Shared-memory buffers have no find(), the linear path goes through re
+    data = make_target(2)
+    view = memoryview(bytearray(data))
+    index = TargetIndex(view)
+    pattern = data[100:103]
+    assert index.find_all(pattern, 0, 10000) == find_all_linear(data, pattern, 0, 10000)
+    assert find_all_linear(view, pattern, 0, 10000, 1) == find_all_linear(data, pattern, 0, 10000, 1)
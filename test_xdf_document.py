@@ -0,0 +1,185 @@
+"""
+XDF export: the streamed XDFPatch output against the ElementTree export
+it replaced, compared as parsed trees. Touched (not edited) XDFs and
+their sidecar cache.
+
+    python -m pytest -q
+"""
+import os
+import xml.etree.ElementTree as ET
+import pytest
+import xdf_document
+from data_engine import DataEngine
+from xdf_document import MAP_TAGS
+
+XDF = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<XDFFORMAT version="1.60">
+<XDFHEADER><deftitle>Test \xe4\xf6\xfc</deftitle></XDFHEADER>
+<XDFTABLE uniqueid="0x1" flags="0x0">
+  <title>Kennfeld A (seq) \xb0C</title>
+  <XDFAXIS id="x" uniqueid="0x0" title="Drehzahl"><title>Drehzahl</title><EMBEDDEDDATA mmedtypeflags="0x00" mmedaddress="0x1000" mmedelementsizebits="16" /><indexcount>8</indexcount><MATH equation="X*0.25"><VAR id="X" /></MATH></XDFAXIS>
+  <XDFAXIS id="y" uniqueid="0x0"><title/><EMBEDDEDDATA mmedtypeflags="0x00" mmedaddress="0x1010" mmedelementsizebits="8" /><indexcount>4</indexcount></XDFAXIS>
+  <XDFAXIS id="z"><EMBEDDEDDATA mmedtypeflags="0x00" mmedaddress="0x1020" mmedelementsizebits="8" mmedrowcount="4" mmedcolcount="8" /><MATH equation="X"><VAR id="X" /></MATH></XDFAXIS>
+</XDFTABLE>
+<XDFTABLE uniqueid="0x2" flags="0x0">
+  <title>Kennfeld B &amp; (deep)</title>
+  <XDFAXIS id="X" uniqueid="0x0" title = 'Last (x-deep)'><title>Last (x-deep)</title><EMBEDDEDDATA mmedaddress="0x2000" mmedelementsizebits="16" /><indexcount>6</indexcount></XDFAXIS>
+  <XDFAXIS id="z"><EMBEDDEDDATA mmedaddress="0x2010" mmedrowcount="1" mmedcolcount="6" /></XDFAXIS>
+</XDFTABLE>
+<XDFTABLE uniqueid="0x3" flags="0x0">
+  <title/>
+  <XDFAXIS id="x"><indexcount>2</indexcount></XDFAXIS>
+  <XDFAXIS id="z"><EMBEDDEDDATA mmedaddress="0x3000" mmedrowcount="1" mmedcolcount="2" /></XDFAXIS>
+</XDFTABLE>
+<XDFTABLE uniqueid="0x4" flags="0x0">
+  <title>Kennfeld D</title>
+  <XDFAXIS id="z"><EMBEDDEDDATA mmedaddress="0x4000" mmedrowcount="2" mmedcolcount="2" /></XDFAXIS>
+</XDFTABLE>
+<XDFCONSTANT uniqueid="0x5">
+  <title>Konstante E</title>
+  <EMBEDDEDDATA mmedaddress="0x5000" mmedelementsizebits="8" />
+</XDFCONSTANT>
+<XDFCONSTANT uniqueid="0x6">
+  <title>Konstante F</title>
+  <EMBEDDEDDATA mmedaddress="0x6000" mmedelementsizebits="16" />
+</XDFCONSTANT>
+</XDFFORMAT>
+"""
+
+# node_index -> results; maps that are not listed stay NONE and are left out
+RESULTS = {
+    # Edited: new addresses, markers, a deep axis with title text and title attribute
+    0: dict(match_type="SEQUENTIAL", target_addr=0x9020, target_x_addr=0x9000, target_y_addr=-1,
+            x_is_deep=True, y_is_deep=True),
+    1: dict(match_type="UNIQUE", target_addr=0xA010, target_x_addr=0xA000, is_deep=True, x_is_deep=True),
+    2: dict(match_type="FUZZY", target_addr=0xB000, target_x_addr=-1),
+    # Unedited: exported with the addresses it already has
+    4: dict(match_type="UNIQUE", target_addr=0x5000),
+    5: dict(match_type="AMBIGUOUS"),
+}
+
+def reference_export(path, all_maps, output_path, include_deep):
+    # The ElementTree export as it was before XDFPatch, maps found by node_index.
+    # Parsed with the declared encoding: the old cp1252 round trip garbled non-ASCII text
+    tree = ET.parse(path)
+    root = tree.getroot()
+    nodes = [n for n in root.iter() if n.tag in MAP_TAGS]
+    keep = set()
+    for m in all_maps.values():
+        if m.match_type not in ["UNIQUE", "SEQUENTIAL", "FUZZY"] or (m.is_deep and not include_deep): continue
+        node = nodes[m.node_index]
+        keep.add(node)
+        title_node = node.find("title")
+        if title_node is not None:
+            text = str(title_node.text or "")
+            for marker in [" (seq)", " (deep)", " (x-deep)", " (y-deep)", " (x-off)", " (y-off)", " (?x)", " (?y)"]:
+                text = text.replace(marker, "")
+            markers = ""
+            if m.match_type == "SEQUENTIAL": markers += " (seq)"
+            if m.match_type == "FUZZY": markers += " (fuzzy)"
+            if m.is_deep: markers += " (deep)"
+            if m.x_is_deep: markers += " (x-deep)"
+            if m.y_is_deep: markers += " (y-deep)"
+            title_node.text = text.strip() + markers
+        if m.is_scalar:
+            emb = node.find("EMBEDDEDDATA")
+            if emb is not None: emb.set('mmedaddress', f"0x{m.target_addr:X}")
+            continue
+        z_axis = node.find(".//XDFAXIS[@id='z']")
+        if z_axis is not None and z_axis.find("EMBEDDEDDATA") is not None:
+            z_axis.find("EMBEDDEDDATA").set('mmedaddress', f"0x{m.target_addr:X}")
+        for ax_id, addr in [('x', m.target_x_addr), ('y', m.target_y_addr)]:
+            ax_node = next((a for a in node.iter("XDFAXIS") if a.get('id', '').lower() == ax_id), None)
+            if ax_node is None: continue
+            emb = ax_node.find("EMBEDDEDDATA")
+            if emb is not None: emb.set('mmedaddress', f"0x{addr:X}" if addr > 0 else "0x0")
+            if not getattr(m, f"{ax_id}_is_deep"): continue
+            marker = f" ({ax_id}-deep)"
+            ax_title_node = ax_node.find("title")
+            if ax_title_node is not None:
+                ax_text = str(ax_title_node.text or "")
+                if marker not in ax_text: ax_title_node.text = ax_text.strip() + marker
+                attr_title = ax_node.get('title')
+                if attr_title and marker not in attr_title: ax_node.set('title', attr_title.strip() + marker)
+    parents = {c: p for p in root.iter() for c in p}
+    for node in nodes:
+        if node not in keep: parents[node].remove(node)
+    tree.write(output_path, encoding="cp1252", xml_declaration=True)
+
+def canonical(el):
+    # Whitespace between elements is layout, not content
+    return (el.tag, sorted(el.attrib.items()), (el.text or "").strip(), [canonical(c) for c in el])
+
+def maps_by_index(all_maps):
+    # Titles are read with the historic cp1252 decoding, the position is unambiguous
+    return {m.node_index: m for m in all_maps.values()}
+
+@pytest.fixture
+def xdf(tmp_path):
+    path = tmp_path / "defs.xdf"
+    path.write_bytes(XDF.encode('latin-1'))
+    return str(path)
+
+@pytest.mark.parametrize("include_deep", [True, False])
+def test_patch_matches_elementtree_export(xdf, tmp_path, include_deep):
+    engine = DataEngine()
+    document, all_maps = engine.parse_xdf(xdf)
+    maps = maps_by_index(all_maps)
+    for i, results in RESULTS.items():
+        for field, value in results.items(): setattr(maps[i], field, value)
+    engine.write_xdf(document, all_maps, str(tmp_path / "patched.xdf"), include_deep)
+    reference_export(xdf, all_maps, str(tmp_path / "reference.xdf"), include_deep)
+    patched = ET.parse(str(tmp_path / "patched.xdf")).getroot()
+    assert canonical(patched) == canonical(ET.parse(str(tmp_path / "reference.xdf")).getroot())
+    kept = {el.findtext("title") for el in patched.iter() if el.tag in MAP_TAGS}
+    assert len(kept) == (4 if include_deep else 3)
+
+def test_unedited_maps_keep_their_bytes(xdf, tmp_path):
+    # Exported at the addresses they already have: copied as they are
+    engine = DataEngine()
+    document, all_maps = engine.parse_xdf(xdf)
+    maps = maps_by_index(all_maps)
+    for m in (maps[3], maps[4]):
+        m.match_type, m.target_addr = "UNIQUE", m.z_addr
+    engine.write_xdf(document, all_maps, str(tmp_path / "patched.xdf"))
+    reference_export(xdf, all_maps, str(tmp_path / "reference.xdf"), True)
+    patched = (tmp_path / "patched.xdf").read_bytes()
+    assert canonical(ET.fromstring(patched)) == canonical(ET.parse(str(tmp_path / "reference.xdf")).getroot())
+    original = XDF.encode('latin-1')
+    for start, end in ((b'<XDFTABLE uniqueid="0x4"', b"</XDFTABLE>"), (b'<XDFCONSTANT uniqueid="0x5"', b"</XDFCONSTANT>")):
+        at = original.index(start)
+        assert original[at : original.index(end, at) + len(end)] in patched
+    assert b"Kennfeld A" not in patched
+
+def touch(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+def test_touched_xdf_still_exports(xdf, tmp_path):
+    engine = DataEngine()
+    document, all_maps = engine.parse_xdf(xdf)
+    touch(xdf)
+    engine.write_xdf(document, all_maps, str(tmp_path / "patched.xdf"))
+    assert document.stamp == (os.stat(xdf).st_mtime_ns, os.stat(xdf).st_size)
+
+def test_edited_xdf_refuses_export(xdf, tmp_path):
+    engine = DataEngine()
+    document, all_maps = engine.parse_xdf(xdf)
+    with open(xdf, 'r+b') as f:
+        f.seek(XDF.index("0x4000"))
+        f.write(b"0x4002") # Same size, other content
+    touch(xdf)
+    with pytest.raises(ValueError):
+        engine.write_xdf(document, all_maps, str(tmp_path / "patched.xdf"))
+
+def test_sidecar_takes_the_new_mtime(xdf, monkeypatch):
+    hashed = []
+    digest = xdf_document._file_digest
+    monkeypatch.setattr(xdf_document, "_file_digest", lambda path: hashed.append(path) or digest(path))
+    first = xdf_document.read_xdf(xdf)[1]
+    assert len(hashed) == 1 # Parsed, the sidecar is written with the hash
+    touch(xdf)
+    second = xdf_document.read_xdf(xdf)[1]
+    assert len(hashed) == 2 # Same content under a new mtime: hashed once more
+    assert xdf_document.read_xdf(xdf)[1].keys() == second.keys() == first.keys()
+    assert len(hashed) == 2 # The sidecar now has the new mtime, trusted as is
@@ -1,48 +1,291 @@
-from PyQt6.QtWidgets import QTableWidgetItem, QHeaderView
-from PyQt6.QtGui import QColor
+import heapq
+from PyQt6.QtWidgets import QTableView, QHeaderView, QAbstractItemView
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QItemSelection, QItemSelectionModel, QSortFilterProxyModel
+from PyQt6.QtGui import QBrush, QColor
+
+STATUS_ORDER = {"UNIQUE": 0, "SEQUENTIAL": 1, "FUZZY": 2} # Everything else sorts last
+
+class MapListModel(QAbstractTableModel):
+    """
+    Map or scalar list (Address / Map Name) over the parsed XDFMaps.
+    Rows are kept in status order (UNIQUE, SEQ, FUZZY, rest; XDF order
+    inside), the lowercase names are indexed once per XDF for filtering.
+    refresh() after a scan only touches rows whose status changed, with
+    the names of the maps a worker published only those rows are read.
+    """
+    HEADERS = ["Address", "Map Name"]
+
+    def __init__(self, scalars, parent=None):
+        super().__init__(parent)
+        self.scalars = scalars
+        self.maps = []   # XDFMap per row
+        self.lower = []  # lowercase name per row
+        self._state = [] # row_state() per row as last shown
+        self._pos = {}   # name -> position in the XDF
+        self._keys = []  # _order_key() per row as last sorted
+        self._row = {}   # name -> row
+
+    @staticmethod
+    def row_state(m):
+        return (m.match_type, m.target_addr, m.match_count, m.is_deep, m.x_is_deep, m.y_is_deep)
+
+    def _order_key(self, m):
+        return (STATUS_ORDER.get(m.match_type, 3), self._pos[m.name])
+
+    def set_maps(self, all_maps):
+        self.beginResetModel()
+        maps = [m for m in all_maps.values() if m.is_scalar == self.scalars]
+        self._pos = {m.name: i for i, m in enumerate(maps)}
+        self.maps = sorted(maps, key=self._order_key)
+        self.lower = [m.name.lower() for m in self.maps]
+        self._state = [self.row_state(m) for m in self.maps]
+        self._keys = [self._order_key(m) for m in self.maps]
+        self._row = {m.name: r for r, m in enumerate(self.maps)}
+        self.endResetModel()
+
+    def refresh(self, names=None):
+        """
+        Re-reads the map statuses (names: only these maps, e.g. the ones a
+        worker just published): rows move only if their status group
+        changed, repaints are limited to the rows that changed.
+        """
+        rows = range(len(self.maps)) if names is None else sorted({self._row[n] for n in names if n in self._row})
+        changed = [r for r in rows if self.row_state(self.maps[r]) != self._state[r]]
+        moved = {r: self._order_key(self.maps[r]) for r in changed}
+        moved = {r: k for r, k in moved.items() if k != self._keys[r]}
+        if moved:
+            # The other rows keep their keys and stay sorted, the moved ones are merged back in
+            key = lambda i: moved[i] if i in moved else self._keys[i]
+            stay = [i for i in range(len(self.maps)) if i not in moved]
+            order = list(heapq.merge(stay, sorted(moved, key=key), key=key))
+            self.layoutAboutToBeChanged.emit()
+            new_row = {old: new for new, old in enumerate(order)}
+            persistent = self.persistentIndexList()
+            self.changePersistentIndexList(persistent, [self.index(new_row[i.row()], i.column()) for i in persistent])
+            self.maps = [self.maps[i] for i in order]
+            self.lower = [self.lower[i] for i in order]
+            self._state = [self._state[i] for i in order]
+            self._keys = [key(i) for i in order]
+            self._row = {m.name: r for r, m in enumerate(self.maps)}
+            self.layoutChanged.emit()
+            changed = sorted(new_row[r] for r in changed)
+        for r in changed:
+            self._state[r] = self.row_state(self.maps[r])
+        # One dataChanged per run of neighbouring rows
+        start = prev = None
+        for r in changed + [None]:
+            if start is not None and (r is None or r != prev + 1):
+                self.dataChanged.emit(self.index(start, 0), self.index(prev, 1))
+                start = None
+            if start is None: start = r
+            prev = r
+
+    def is_hidden(self, row):
+        # Nothing found at all: not listed (as before Fuzzy Search finds it)
+        m = self.maps[row]
+        return m.match_type in ["NONE", "ERROR"] and m.match_count == 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.maps)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        m = self.maps[index.row()]
+        if role == Qt.ItemDataRole.UserRole:
+            return m.name # For select_map
+        if role == Qt.ItemDataRole.DisplayRole:
+            if index.column() == 0:
+                return f"0x{m.target_addr:X}" if m.target_addr > 0 else "???"
+            # Name + Marker + Extra info
+            name_text = f"{self.marker(m)[0]} {m.name}"
+            extra = []
+            if m.is_deep: extra.append("deep")
+            if m.x_is_deep: extra.append("x-deep")
+            if m.y_is_deep: extra.append("y-deep")
+            if extra:
+                name_text += " (" + ", ".join(extra) + ")"
+            return name_text
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return QBrush(self.marker(m)[1])
+        return None
+
+    @staticmethod
+    def marker(m):
+        # Unified status marker
+        if m.match_type == "UNIQUE": return "●", QColor(Qt.GlobalColor.darkGreen)
+        if m.match_type == "SEQUENTIAL": return "● SEQ", QColor("#FF8C00")
+        if m.match_type == "FUZZY": return f"● FUZZY {m.match_percent}%", QColor("#DAA520")
+        if m.match_type == "AMBIGUOUS": return f"● [{m.match_count}x]", QColor(Qt.GlobalColor.red)
+        return "● NONE", QColor(Qt.GlobalColor.gray)
+
+class MapFilterProxy(QSortFilterProxyModel):
+    """
+    Search box filter over a MapListModel. Matches against the model's
+    lowercase name index; rows keep the model's order (no proxy sorting).
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.query = ""
+
+    def set_query(self, text):
+        query = text.lower()
+        if query == self.query: return
+        self.query = query
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, row, parent):
+        src = self.sourceModel()
+        if src.is_hidden(row): return False
+        return not self.query or self.query in src.lower[row]
+
+class MapTableModel(QAbstractTableModel):
+    """
+    Read-only grid behind the source/target map views.
+    Cell text is produced on demand in blocks of rows (only what the view
+    paints), so a 512-row MLHFM costs one block per screen, not 512 items.
+    """
+    ROW_BLOCK = 32
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = self.cols = 0
+        self.headers_x = self.headers_y = None
+        self.x_color = self.y_color = None
+        self.block_text = None # (first_row, last_row) -> cell strings, see set_cells
+        self._blocks = {}      # block index -> cell strings of that block
+
+    def set_shape(self, rows, cols, headers_x=None, headers_y=None):
+        self.beginResetModel()
+        self.rows, self.cols = rows, cols
+        self.headers_x = [str(x) for x in headers_x] if headers_x else None
+        self.headers_y = [str(y) for y in headers_y] if headers_y else None
+        self.x_color = self.y_color = None
+        self.block_text = None
+        self._blocks = {}
+        self.endResetModel()
+
+    def set_cells(self, block_text):
+        """
+        block_text(first_row, last_row) -> cell strings of those rows, row-major.
+        None leaves the grid empty.
+        """
+        self.block_text = block_text
+        self._blocks = {}
+        if self.rows and self.cols:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rows - 1, self.cols - 1))
+
+    def set_header_colors(self, x_color=None, y_color=None):
+        self.x_color, self.y_color = x_color, y_color
+        if self.cols: self.headerDataChanged.emit(Qt.Orientation.Horizontal, 0, self.cols - 1)
+        if self.rows: self.headerDataChanged.emit(Qt.Orientation.Vertical, 0, self.rows - 1)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.rows
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.cols
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or self.block_text is None or not index.isValid(): return None
+        b, r = divmod(index.row(), self.ROW_BLOCK)
+        if b not in self._blocks:
+            first = b * self.ROW_BLOCK
+            self._blocks[b] = self.block_text(first, min(first + self.ROW_BLOCK, self.rows))
+        return self._blocks[b][r * self.cols + index.column()]
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        horizontal = orientation == Qt.Orientation.Horizontal
+        if role == Qt.ItemDataRole.DisplayRole:
+            labels = self.headers_x if horizontal else self.headers_y
+            if labels and section < len(labels): return labels[section]
+            return str(section + 1)
+        if role == Qt.ItemDataRole.ForegroundRole:
+            color = self.x_color if horizontal else self.y_color
+            if color is not None: return QBrush(color)
+        return None
 
 class UIManager:
+    @staticmethod
+    def create_map_view():
+        view = QTableView()
+        view.setModel(MapTableModel(view))
+        view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        # Fixed row height: heights need no per-row measuring
+        view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        view.verticalHeader().setDefaultSectionSize(22)
+        # Size hints from the visible rows only, not the whole map
+        view.horizontalHeader().setResizeContentsPrecision(0)
+        view.verticalHeader().setResizeContentsPrecision(0)
+        return view
+
+    @staticmethod
+    def link_views(a, b):
+        """
+        Source and target panes scroll and select together.
+        """
+        for bar in ("verticalScrollBar", "horizontalScrollBar"):
+            getattr(a, bar)().valueChanged.connect(getattr(b, bar)().setValue)
+            getattr(b, bar)().valueChanged.connect(getattr(a, bar)().setValue)
+        def mirror(src, dst):
+            def on_change(*_):
+                dst_sel = dst.selectionModel()
+                if dst_sel is None or getattr(dst, "_mirroring", False): return
+                selection = QItemSelection()
+                for rng in src.selectionModel().selection():
+                    # Target may have a different shape (duplicates list), clip to it
+                    bottom = min(rng.bottom(), dst.model().rowCount() - 1)
+                    right = min(rng.right(), dst.model().columnCount() - 1)
+                    if rng.top() > bottom or rng.left() > right: continue
+                    selection.select(dst.model().index(rng.top(), rng.left()), dst.model().index(bottom, right))
+                src._mirroring = True
+                dst_sel.select(selection, QItemSelectionModel.SelectionFlag.ClearAndSelect)
+                src._mirroring = False
+            src.selectionModel().selectionChanged.connect(on_change)
+        mirror(a, b)
+        mirror(b, a)
+
     @staticmethod
     def setup_table(table, rows, cols, headers_x=None, headers_y=None):
-        table.setRowCount(rows)
-        table.setColumnCount(cols)
-        if headers_x: 
-            table.setHorizontalHeaderLabels([str(x) for x in headers_x])
-        else:
-            table.setHorizontalHeaderLabels([str(i+1) for i in range(cols)])
-            
-        if headers_y: 
-            table.setVerticalHeaderLabels([str(y) for y in headers_y])
-        else:
-            table.setVerticalHeaderLabels([str(i+1) for i in range(rows)])
-        
+        table.model().set_shape(rows, cols, headers_x, headers_y)
+
         if cols > 1:
             table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         else:
             table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
-        
-        table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
 
     @staticmethod
     def fill_table(table, m, bin_data, start_addr, engine, is_source=True):
         if start_addr == -1: return
-        step = 2 if m.z_is16 else 1
         prec = 4 if m.is_scalar else 2
-        
-        for r in range(m.z_rows):
-            for c in range(m.z_cols):
-                idx = (r * m.z_cols) + c
-                raw = engine.read_raw(bin_data, start_addr + idx*step, m.z_is16, m.z_signed)
-                val_str = m.calculate(raw, m.z_eq, m.z_is16, m.z_signed, prec)
-                table.setItem(r, c, QTableWidgetItem(val_str))
+
+        # Whole map in one read; text is made per block of rows when the view asks
+        raw = engine.read_array(bin_data, start_addr, m.z_rows * m.z_cols, m.z_is16)
+        cols = m.z_cols
+        table.model().set_cells(lambda first, last: m.calculate_array(raw[first * cols : last * cols], m.z_eq, m.z_is16, m.z_signed, prec))
+
+    @staticmethod
+    def fill_list(table, texts):
+        # One column of ready-made strings (duplicate address list)
+        table.model().set_cells(lambda first, last: texts[first:last])
+
+    @staticmethod
+    def set_header_colors(table, x_color=None, y_color=None):
+        table.model().set_header_colors(x_color, y_color)
 
     @staticmethod
     def auto_set_height(table, max_h=500):
-        # Calculate required height: header + all rows + margin
+        # Calculate required height: header + all rows + margin (rows have a fixed height)
         h = table.horizontalHeader().height()
-        for r in range(table.rowCount()):
-            h += table.rowHeight(r)
-        
+        h += table.verticalHeader().defaultSectionSize() * table.model().rowCount()
+
         # Add a small margin for grid/border
         final_h = min(h + 4, max_h)
         table.setMinimumHeight(final_h)
@@ -0,0 +1,374 @@
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from models import MapTable
+
+MAP_TAGS = ('XDFTABLE', 'XDFCONSTANT')
+
+# Map definition fields stored in the sidecar cache (results are not)
+DEFINITION_FIELDS = ("name", "node_index", "is_scalar",
+                     "z_addr", "z_is16", "z_signed", "z_eq", "z_rows", "z_cols",
+                     "x_addr", "x_is16", "x_signed", "x_eq", "x_count",
+                     "y_addr", "y_is16", "y_signed", "y_eq", "y_count")
+
+class XDFDocument:
+    """
+    A parsed XDF without its element tree. Maps only carry node_index, the
+    position of their XDFTABLE/XDFCONSTANT among all of them in document
+    order. Exports stream the original file with patches (XDFPatch), the
+    document itself never changes, so any number of exports (also
+    concurrent ones) can start from it.
+    """
+    CACHE_VERSION = 1
+
+    def __init__(self, path, stamp=None, digest=None):
+        self.path = path
+        self.stamp = stamp   # (mtime_ns, size) when the maps were read
+        self.digest = digest # sha256 of the content the maps were read from
+        self._layout = None
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Worker processes get path, stamp and digest, the layout is rebuilt there
+        return (XDFDocument, (self.path, self.stamp, self.digest))
+
+    @staticmethod
+    def cache_path(path):
+        # Sidecar next to the XDF
+        return path + ".parsed.json"
+
+    def check_unchanged(self):
+        st = os.stat(self.path)
+        if self.stamp is None or (st.st_mtime_ns, st.st_size) == self.stamp: return
+        # Touched or saved again without edits: the content decides
+        if self.digest is not None and st.st_size == self.stamp[1] and _file_digest(self.path) == self.digest:
+            self.stamp = (st.st_mtime_ns, st.st_size)
+            return
+        raise ValueError(f"{self.path} changed since it was loaded, load it again")
+
+    def layout(self):
+        """
+        Byte positions of every map element (MapLayout per node_index),
+        found with one expat pass on first use.
+        """
+        with self._lock:
+            if self._layout is None:
+                self.check_unchanged()
+                with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    self._layout = _scan_layout(f, data)
+            return self._layout
+
+# Start tag at a position, attribute values may contain '>'
+_START_TAG = re.compile(rb"""<[^\s/>]+(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*/?>""")
+_WHITESPACE = b" \t\r\n"
+
+class ElementSpan:
+    """
+    Where one element sits in the file: [start, tag_end) is its start tag,
+    [tag_end, text_end) its text before the first child, [start, end) all of it.
+    """
+    __slots__ = ("tag", "start", "tag_end", "empty", "text_end", "end", "first")
+
+    def __init__(self, tag, start, tag_end, empty):
+        self.tag = tag
+        self.start, self.tag_end = start, tag_end
+        self.empty = empty # <tag ... />, no text span to write into
+        self.text_end = self.end = tag_end if empty else None
+        self.first = {} # First direct child per tag (title, EMBEDDEDDATA)
+
+class MapLayout:
+    """
+    What an export may touch inside one map element, with the same lookups
+    the ElementTree export used: title and EMBEDDEDDATA as direct children,
+    the first XDFAXIS with id 'z' and the first with id x / y (any case).
+    """
+    __slots__ = ("element", "axes")
+
+    def __init__(self, element):
+        self.element = element
+        self.axes = {}
+
+    @property
+    def title(self): return self.element.first.get("title")
+
+    @property
+    def embedded(self): return self.element.first.get("EMBEDDEDDATA")
+
+def _scan_layout(f, data):
+    layouts = []
+    stack = []    # Open ElementSpans
+    open_maps = []
+    parser = expat.ParserCreate(encoding='ISO-8859-1') # Any byte is valid, byte index == char index
+
+    def start(tag, attrs):
+        pos = parser.CurrentByteIndex
+        parent = stack[-1] if stack else None
+        if parent is not None and parent.text_end is None: parent.text_end = pos
+        tag_end = _START_TAG.match(data, pos).end()
+        el = ElementSpan(tag, pos, tag_end, data[tag_end - 2 : tag_end] == b"/>")
+        if parent is not None and tag in ("title", "EMBEDDEDDATA"): parent.first.setdefault(tag, el)
+        if tag == "XDFAXIS":
+            aid = attrs.get("id", "")
+            for m in open_maps:
+                if aid == "z": m.axes.setdefault("z", el)
+                if aid.lower() in ("x", "y"): m.axes.setdefault(aid.lower(), el)
+        if tag in MAP_TAGS:
+            layout = MapLayout(el)
+            layouts.append(layout)
+            open_maps.append(layout)
+        stack.append(el)
+
+    def end(tag):
+        el = stack.pop()
+        if not el.empty:
+            pos = parser.CurrentByteIndex
+            if el.text_end is None: el.text_end = pos
+            el.end = data.find(b">", pos) + 1
+        if tag in MAP_TAGS: open_maps.pop()
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.ParseFile(f)
+    return layouts
+
+class XDFPatch:
+    """
+    Edits on the original bytes of an XDFDocument, applied while streaming
+    it to the output. Texts and values are bytes in the file's own
+    encoding (markers and addresses are plain ASCII).
+    Use as a context manager, the file stays memory-mapped inside.
+    """
+    def __init__(self, document):
+        self.document = document
+        self.edits = [] # (start, end, replacement)
+
+    def __enter__(self):
+        self.layout = self.document.layout()
+        self.document.check_unchanged()
+        self._file = open(self.document.path, 'rb')
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, *exc):
+        self.data.close()
+        self._file.close()
+
+    def text(self, el):
+        return self.data[el.tag_end : el.text_end]
+
+    def set_text(self, el, text):
+        if el.empty:
+            # <title/> -> <title>text</title>
+            head = self.data[el.start : el.tag_end - 2].rstrip(_WHITESPACE)
+            self.edits.append((el.start, el.end, head + b">" + text + b"</" + el.tag.encode() + b">"))
+        else:
+            self.edits.append((el.tag_end, el.text_end, text))
+
+    def _attribute(self, el, name):
+        pattern = rb"\s" + re.escape(name.encode()) + rb"""\s*=\s*(["'])(.*?)\1"""
+        return re.compile(pattern, re.S).search(self.data, el.start, el.tag_end)
+
+    def attribute(self, el, name):
+        found = self._attribute(el, name)
+        return found.group(2) if found else None
+
+    def set_attribute(self, el, name, value):
+        found = self._attribute(el, name)
+        if found:
+            self.edits.append((found.start(2), found.end(2), value))
+        else:
+            # New attributes go last, like Element.set
+            close = el.tag_end - (2 if el.empty else 1)
+            self.edits.append((close, close, b" " + name.encode() + b'="' + value + b'"'))
+
+    def remove(self, el):
+        # The whitespace after the element goes too (its ElementTree tail)
+        end = el.end
+        while end < len(self.data) and self.data[end] in _WHITESPACE: end += 1
+        self.edits.append((el.start, end, b""))
+
+    def write(self, output_path, chunk_size=1 << 20):
+        pos = 0
+        with open(output_path, 'wb') as out:
+            for start, end, replacement in sorted(self.edits, key=lambda e: (e[0], e[1])):
+                if start < pos: continue # Inside a removed map
+                for i in range(pos, start, chunk_size): out.write(self.data[i : min(i + chunk_size, start)])
+                out.write(replacement)
+                pos = end
+            for i in range(pos, len(self.data), chunk_size): out.write(self.data[i : i + chunk_size])
+
+def _find(parent, tag):
+    if parent is None: return None
+    res = parent.find(tag)
+    if res is not None: return res
+    tag_u = tag.upper()
+    for child in parent:
+        if child.tag.upper() == tag_u: return child
+    return None
+
+def _p(n):
+    if n is None: return 0, False, False
+    a = int(n.get('mmedaddress', '0x0'), 16)
+    i = n.get('mmedelementsizebits') == "16"
+    try:
+        flags = int(n.get('mmedtypeflags', '0x00'), 16)
+        s = bool(flags & 0x01)
+    except: s = False
+    return a, i, s
+
+def _get_eq(math_node, axis_node=None):
+    base_eq = "X"
+    if math_node is not None:
+        base_eq = math_node.get('equation', 'X')
+
+    # kmul/kadd can be in MATH tag or directly in XDFAXIS/XDFTABLE (axis_node)
+    src = math_node if math_node is not None else axis_node
+    if src is None: return base_eq
+
+    kmul = src.get('kmul') or (axis_node.get('kmul') if axis_node is not None and axis_node != src else None) or '1.0'
+    kadd = src.get('kadd') or (axis_node.get('kadd') if axis_node is not None and axis_node != src else None) or '0.0'
+
+    try:
+        f_mul = float(kmul)
+        f_add = float(kadd)
+        if f_mul != 1.0 or f_add != 0.0:
+            return f"({base_eq})*{f_mul} + {f_add}"
+    except:
+        pass
+    return base_eq
+
+def _read_map(node):
+    """
+    One finished XDFTABLE/XDFCONSTANT element -> record of its definition
+    fields (see MapTable).
+    """
+    m = {"name": node.findtext('title', 'Unknown'), "is_scalar": node.tag == 'XDFCONSTANT'}
+
+    if m["is_scalar"]:
+        m["z_addr"], m["z_is16"], m["z_signed"] = _p(_find(node, "EMBEDDEDDATA"))
+        m["z_eq"] = _get_eq(_find(node, "MATH"), node)
+        return m
+
+    # One walk over the axes, first one wins per id (case-insensitive)
+    axes = {}
+    for cand in node.iter('XDFAXIS'):
+        axes.setdefault(cand.get('id', '').lower(), cand)
+    for aid in ['x', 'y', 'z']:
+        n = axes.get(aid)
+        if n is None: continue
+        e = _find(n, "EMBEDDEDDATA"); a, i, s = _p(e)
+        m[aid + "_addr"], m[aid + "_is16"], m[aid + "_signed"] = a, i, s
+        m[aid + "_eq"] = _get_eq(_find(n, "MATH"), n)
+        if aid == 'z':
+            m["z_rows"] = int(e.get('mmedrowcount', '1')) if e is not None else 1
+            m["z_cols"] = int(e.get('mmedcolcount', '1')) if e is not None else 1
+        else:
+            m[aid + "_count"] = int(n.findtext('indexcount', '1') or '1')
+    return m
+
+def _closed_elements(path, chunk_size=1 << 20):
+    """
+    iterparse() over the file as it was always read: cp1252 text, handed to
+    expat as UTF-8 bytes (expat still applies the declared encoding, exactly
+    like parsing the decoded string in one piece), one chunk at a time.
+    Yields every element once it is complete.
+    """
+    parser = ET.XMLPullParser(events=('end',))
+    with open(path, 'rb') as raw:
+        stream = io.TextIOWrapper(raw, encoding='cp1252', errors='ignore')
+        for chunk in iter(lambda: stream.read(chunk_size), ''):
+            parser.feed(chunk.encode('utf-8'))
+            for _, el in parser.read_events(): yield el
+    parser.close()
+    for _, el in parser.read_events(): yield el
+
+def parse_maps(path):
+    """
+    Single streaming pass over the XDF. Every map element is read when it
+    closes and then cleared, so the file is never held as one string or
+    one full tree.
+    Returns the maps in the historic order: all tables, then all constants
+    (a later duplicate title replaces the earlier map in place).
+    """
+    order = [] # Maps in document (preorder) order, node_index = position
+    for el in _closed_elements(path):
+        if el.tag not in MAP_TAGS: continue
+        m = _read_map(el)
+        # A map nested in this one closed earlier, the parent goes before it
+        nested = sum(1 for d in el.iter() if d.tag in MAP_TAGS) - 1
+        order.insert(len(order) - nested, m)
+        el.clear() # The tag stays, nested maps are still counted
+    for i, m in enumerate(order): m["node_index"] = i
+    records = {}
+    for scalar in (False, True):
+        for m in order:
+            if m["is_scalar"] == scalar: records[m["name"]] = m
+    return MapTable(records.values()).by_name()
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _load_cached(path, stat):
+    """
+    Maps from the sidecar if it still describes this file: same mtime/size
+    is trusted as is, otherwise the content hash has to match (and the
+    sidecar takes the new mtime, so the next load does not hash again).
+    Returns (maps or None, content digest if known).
+    """
+    try:
+        with open(XDFDocument.cache_path(path), 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    if entry.get("version") != XDFDocument.CACHE_VERSION: return None, None
+    digest = entry.get("sha256")
+    touched = entry.get("mtime_ns") != stat.st_mtime_ns or entry.get("size") != stat.st_size
+    if touched:
+        digest = _file_digest(path)
+        if entry.get("sha256") != digest: return None, digest
+    if entry.get("fields") != list(DEFINITION_FIELDS): return None, digest
+    if touched:
+        entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+        _write_cached(path, entry)
+    return MapTable(dict(zip(DEFINITION_FIELDS, row)) for row in entry["maps"]).by_name(), digest
+
+def _store_cached(path, stat, all_maps, digest):
+    _write_cached(path, {"version": XDFDocument.CACHE_VERSION, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                         "sha256": digest,
+                         "fields": DEFINITION_FIELDS, # One row per map, in all_maps order
+                         "maps": [[getattr(m, f) for f in DEFINITION_FIELDS] for m in all_maps.values()]})
+
+def _write_cached(path, entry):
+    cache_path = XDFDocument.cache_path(path)
+    tmp = cache_path + ".tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, separators=(',', ':'))
+        os.replace(tmp, cache_path)
+    except OSError:
+        pass # Read-only folder: parse again next time
+
+def read_xdf(path, use_cache=True):
+    """
+    Returns (XDFDocument, {title: XDFMap}), from the sidecar cache when
+    the XDF did not change since it was written.
+    """
+    stat = os.stat(path)
+    all_maps = digest = None
+    if use_cache:
+        all_maps, digest = _load_cached(path, stat)
+    if all_maps is None:
+        all_maps = parse_maps(path)
+        digest = digest or _file_digest(path)
+        if use_cache: _store_cached(path, stat, all_maps, digest)
+    return XDFDocument(path, (stat.st_mtime_ns, stat.st_size), digest), all_maps